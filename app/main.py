@@ -10,6 +10,7 @@ from flask_socketio import join_room, leave_room
 
 from extensions import cache, db, socketio
 from .models import User
+from .market_bridge import MARKET_ROOM
 
 main = Blueprint('main', __name__)
 
@@ -249,6 +250,7 @@ def handle_connect_event():
         return False  # Reject connection silently
 
     join_room(str(current_user.id))
+    join_room(MARKET_ROOM)  # shared live LTP stream
     print(f'✅ Client connected: {current_user.name} joined room "{current_user.id}"')
 
 
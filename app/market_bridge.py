@@ -0,0 +1,98 @@
+# app/market_bridge.py
+# PURPOSE: Relay streamer ticks from Redis pub/sub to browsers over Socket.IO.
+#
+# One background task per web process subscribes to TICK_CHANNEL, keeps the
+# latest tick per instrument and emits an `ltp_update` to the shared "market"
+# room at up to MARKET_PUSH_RATE_HZ per instrument (each instrument has its own
+# last-emit time, so a busy one never holds back the others). Price refreshes
+# no longer need per-user Celery work.
+# A second task blocks on the trend transition stream and emits `trend_transition`
+# the moment a signal flips.
+
+import json
+import time
+
+import redis
+
+from app.extensions import socketio
+from app.tasks.utils import TICK_CHANNEL
+from app.tasks.trend_transitions import wait_for_transitions
+
+MARKET_ROOM = "market"
+NEVER = float("-inf")   # last-emit time of an instrument not pushed yet
+
+_bridge_started = False
+
+
+def start_market_bridge(app):
+    """Start the relay once per process (call from the web entry point only)."""
+    global _bridge_started
+    if _bridge_started:
+        return
+    _bridge_started = True
+
+    redis_url = app.config.get("CACHE_REDIS_URL") or "redis://127.0.0.1:6379/0"
+    rate_hz = float(app.config.get("MARKET_PUSH_RATE_HZ") or 4)
+    socketio.start_background_task(relay_ticks, redis_url, rate_hz)
+    socketio.start_background_task(relay_trend_transitions, redis_url)
+    print(f"📡 Market bridge started ({rate_hz:g} updates/sec per instrument)")
+
+
+def due_ticks(latest, last_emit, now, interval):
+    """Pop the pending ticks whose instrument was last emitted `interval` ago or earlier."""
+    due = {key: tick for key, tick in latest.items() if now - last_emit.get(key, NEVER) >= interval}
+    for key in due:
+        del latest[key]
+        last_emit[key] = now
+    return due
+
+
+def next_wait(latest, last_emit, now, interval):
+    """Seconds until the first pending tick is due (`interval` when nothing is pending)."""
+    if not latest:
+        return interval
+    return max(0.0, min(interval - (now - last_emit.get(key, NEVER)) for key in latest))
+
+
+def relay_ticks(redis_url, rate_hz):
+    interval = 1.0 / rate_hz
+    latest = {}
+    last_emit = {}   # instrument -> monotonic time of its last emit
+
+    while True:
+        try:
+            client = redis.Redis.from_url(redis_url)
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(TICK_CHANNEL)
+
+            while True:
+                message = pubsub.get_message(timeout=next_wait(latest, last_emit, time.monotonic(), interval))
+                if message and message.get("type") == "message":
+                    try:
+                        latest.update(json.loads(message["data"]).get("ticks", {}))
+                    except Exception as e:
+                        print(f"⚠️ Market bridge: bad tick payload: {e}")
+
+                due = due_ticks(latest, last_emit, time.monotonic(), interval)
+                if due:
+                    socketio.emit("ltp_update", {"ticks": due}, room=MARKET_ROOM)
+                else:
+                    socketio.sleep(0)
+        except Exception as e:
+            print(f"❌ Market bridge error, reconnecting: {e}")
+            socketio.sleep(2)
+
+
+def relay_trend_transitions(redis_url, block_ms=5000):
+    last_id = "$"
+    while True:
+        try:
+            client = redis.Redis.from_url(redis_url)
+            while True:
+                transitions, last_id = wait_for_transitions(last_id, block_ms=block_ms, client=client)
+                for transition in transitions:
+                    socketio.emit("trend_transition", transition, room=MARKET_ROOM)
+                socketio.sleep(0)
+        except Exception as e:
+            print(f"❌ Trend transition relay error, reconnecting: {e}")
+            socketio.sleep(2)
@@ -6,6 +6,11 @@ document.addEventListener("DOMContentLoaded", () => {
     
     // Nifty 50 identifier used in the backend payload
     const NIFTY_50_PAYLOAD_KEY = 'Nifty 50';
+    // Instrument key used by the live tick stream (ltp_update)
+    const NIFTY_50_INSTRUMENT_KEY = 'NSE_INDEX|Nifty 50';
+
+    // Last active trade seen in market_update, used to price live P&L between updates
+    let currentActiveTrade = null;
 
     /**
      * Helper function to update text content of an element with formatting and color logic.
@@ -105,6 +110,8 @@ document.addEventListener("DOMContentLoaded", () => {
         const activeTrade = data.active_trade;
         const activeTradeSection = document.getElementById('active-trade-section');
 
+        currentActiveTrade = (activeTrade && activeTrade.instrument_token) ? activeTrade : null;
+
         if (activeTrade && activeTrade.instrument_token) {
             activeTradeSection.classList.remove('hidden'); 
 
@@ -159,6 +166,25 @@ document.addEventListener("DOMContentLoaded", () => {
         }
     });
 
+    socket.on('ltp_update', (payload) => {
+        // Sub-second LTPs relayed from the streamer (shared 'market' room)
+        const ticks = payload.ticks || {};
+
+        const nifty = ticks[NIFTY_50_INSTRUMENT_KEY];
+        if (nifty) {
+            updateText('nifty_50-ltp', nifty.ltp, true);
+        }
+
+        if (currentActiveTrade && ticks[currentActiveTrade.instrument_token]) {
+            const ltp = parseFloat(ticks[currentActiveTrade.instrument_token].ltp);
+            const entry = parseFloat(currentActiveTrade.entry_price);
+            const qty = parseFloat(currentActiveTrade.quantity);
+            if (!isNaN(ltp) && !isNaN(entry) && !isNaN(qty)) {
+                updateText('live-pnl', (ltp - entry) * qty, false, true);
+            }
+        }
+    });
+
     socket.on('trade_notification', (data) => {
         console.log('Received trade_notification:', data);
         alert(`🔔 TRADE ALERT 🔔\n\n${data.message}`);
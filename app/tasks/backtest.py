@@ -0,0 +1,188 @@
+# ============================================
+# FILE: app/tasks/backtest.py
+# PURPOSE: Offline backtest of the SMA-stack CALL/PUT strategy on stored 1m candles
+# ============================================
+#
+# Same rules as the live path:
+#   - entry (decide_and_execute_trade): at a bar close between 09:30 and 15:15,
+#     CALL when close > SMA10/25/50/100 and SMA10 > SMA25/50/100, PUT on the
+#     mirror image (task_trend.trend_signals), one position at a time, re-entry
+#     as soon as the signal still holds after an exit;
+#   - exit (manage_active_trade): stoploss 15 / target 30 points on the option
+#     premium, stoploss checked first, auto square-off at 15:15.
+# SMAs and signals for the whole range are computed in one vectorized pass;
+# the loop only walks trades, and each exit is found with a vectorized search
+# over the bars of that trade's day.
+#
+# Only the index candles are stored, so the option premium is modelled as
+# `delta` x the index move (an ATM option is close to 0.5). Stop/target fills
+# are at the level, or at the bar open when the bar gaps through it.
+#
+# Run from the repo root:
+#   python -m app.tasks.backtest "NSE_INDEX|Nifty 50" 2025-09-01 2025-09-30
+
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytz
+
+from app.tasks.candle_archive import DAY_MS, IST_OFFSET_MS, ist_day_numbers, read_archive
+from app.tasks.candle_store import interval_to_ms
+from app.tasks.indicators import SMA_PERIODS
+from app.tasks.task_trend import CALL_BUY, PUT_BUY, trend_signals
+
+# --- CONFIG ---
+ENTRY_START_MINUTE = 9 * 60 + 30     # decide_and_execute_trade: 09:30 <= now <= 15:15
+SQUARE_OFF_MINUTE = 15 * 60 + 15     # manage_active_trade: auto square-off from 15:15
+STOPLOSS_POINTS = 15.0
+TARGET_POINTS = 30.0
+OPTION_DELTA = 0.5
+
+IST = pytz.timezone("Asia/Kolkata")
+
+
+def rolling_sma(close, period):
+    """SMA of `period` closes ending at every bar (NaN until the window is full or while it holds a NaN)."""
+    out = np.full(len(close), np.nan)
+    if len(close) >= period:
+        missing = np.isnan(close)
+        sums = np.cumsum(np.r_[0.0, np.where(missing, 0.0, close)])
+        nans = np.cumsum(np.r_[0, missing])      # windowed NaN count, as in SMAEngine
+        window_nans = nans[period:] - nans[:-period]
+        out[period - 1:] = np.where(window_nans, np.nan, (sums[period:] - sums[:-period]) / period)
+    return out
+
+
+def entry_sides(close, periods=SMA_PERIODS):
+    """+1 (CALL BUY), -1 (PUT BUY) or 0 at every bar close, from the trend stacking rules."""
+    values = np.column_stack([close] + [rolling_sma(close, p) for p in periods])
+    signals = trend_signals(values)
+    return np.where(signals == CALL_BUY, 1, np.where(signals == PUT_BUY, -1, 0)).astype(np.int8)
+
+
+def backtest(records, start_ms=None, interval_minutes=1, stoploss=STOPLOSS_POINTS, target=TARGET_POINTS,
+             delta=OPTION_DELTA, quantity=1):
+    """
+    Backtest ts-sorted CANDLE_DTYPE records. Bars before `start_ms` only warm up the SMAs.
+    Returns {"trades": DataFrame, "summary": dict}; P&L is in option points (x quantity for value).
+    """
+    ts = np.asarray(records["ts"], dtype="<i8")
+    open_, high, low, close = (np.asarray(records[c], dtype=float) for c in ("open", "high", "low", "close"))
+    n = len(ts)
+
+    # --- Vectorized signals and session geometry ---
+    side = entry_sides(close)
+    minute = ((ts + IST_OFFSET_MS) % DAY_MS) // 60_000
+    decided_at = minute + interval_minutes            # the signal is acted on at the bar close
+    first = 0 if start_ms is None else int(np.searchsorted(ts, start_ms))
+    can_enter = (side != 0) & (decided_at >= ENTRY_START_MINUTE) & (decided_at <= SQUARE_OFF_MINUTE)
+    can_enter[:first] = False
+    candidates = np.flatnonzero(can_enter)
+
+    day = ist_day_numbers(ts)
+    day_last = np.searchsorted(day, day, side="right") - 1           # last bar of each bar's day
+    square_off_bars = np.flatnonzero(minute >= SQUARE_OFF_MINUTE)
+
+    # --- Event loop over positions ---
+    rows = []
+    k = 0
+    while k < len(candidates):
+        e = candidates[k]
+        s = int(side[e])
+        entry = close[e]
+        last = day_last[e]
+        j = np.searchsorted(square_off_bars, e + 1)
+        q = square_off_bars[j] if j < len(square_off_bars) and square_off_bars[j] <= last else None
+
+        # Bars in which a stop or target can trigger: up to the 15:15 bar (or the day's last bar)
+        stop = q if q is not None else last + 1
+        worst = delta * (low[e + 1:stop] - entry if s > 0 else entry - high[e + 1:stop])
+        best = delta * (high[e + 1:stop] - entry if s > 0 else entry - low[e + 1:stop])
+        opened = delta * s * (open_[e + 1:stop] - entry)
+        sl_hit = np.flatnonzero(worst <= -stoploss)
+        tp_hit = np.flatnonzero(best >= target)
+        sl_at = sl_hit[0] if len(sl_hit) else len(worst)
+        tp_at = tp_hit[0] if len(tp_hit) else len(worst)
+
+        if sl_at < len(worst) and sl_at <= tp_at:          # stoploss is checked first
+            x, reason = e + 1 + sl_at, "STOPLOSS"
+            pnl = min(-stoploss, opened[sl_at])
+        elif tp_at < len(worst):
+            x, reason = e + 1 + tp_at, "TARGET"
+            pnl = max(target, opened[tp_at])
+        elif q is not None:
+            x, reason = q, "SQUARE_OFF"
+            pnl = delta * s * (open_[q] - entry)
+        else:
+            x, reason = last, "DAY_END"                     # no 15:15 bar in the data
+            pnl = delta * s * (close[last] - entry)
+
+        rows.append((e, x, s, reason, pnl))
+        k = int(np.searchsorted(candidates, max(x, e + 1)))   # flat again: next signal at or after the exit bar
+
+    return _report(rows, ts, close, first, n, interval_minutes, delta, quantity)
+
+
+def _report(rows, ts, close, first, n, interval_minutes, delta, quantity):
+    columns = ["side", "entry_time", "exit_time", "entry_index_price", "exit_index_price",
+               "minutes", "reason", "pnl", "pnl_value"]
+    if rows:
+        e, x, s, reason, pnl = (np.asarray(c) for c in zip(*rows))
+        to_time = lambda idx: pd.to_datetime(ts[idx], unit="ms", utc=True).tz_convert(IST)
+        trades = pd.DataFrame({
+            "side": np.where(s > 0, "CALL", "PUT"),
+            "entry_time": to_time(e) + pd.Timedelta(minutes=interval_minutes),
+            "exit_time": to_time(x),
+            "entry_index_price": close[e],
+            "exit_index_price": close[e] + s * pnl.astype(float) / delta,   # index level of the fill
+            "minutes": (x - e) * interval_minutes,
+            "reason": reason,
+            "pnl": pnl.astype(float),
+        })
+        trades["pnl_value"] = trades["pnl"] * quantity
+    else:
+        trades = pd.DataFrame(columns=columns)
+
+    equity = np.cumsum(trades["pnl"].to_numpy(dtype=float))
+    drawdown = np.maximum.accumulate(np.r_[0.0, equity])[1:] - equity if len(equity) else np.zeros(0)
+    bars = max(n - first, 1)
+    summary = {
+        "trades": len(trades),
+        "wins": int((trades["pnl"] > 0).sum()),
+        "losses": int((trades["pnl"] < 0).sum()),
+        "win_rate": float((trades["pnl"] > 0).mean()) if len(trades) else 0.0,
+        "total_pnl": float(equity[-1]) if len(equity) else 0.0,
+        "total_value": float(equity[-1] * quantity) if len(equity) else 0.0,
+        "avg_pnl": float(trades["pnl"].mean()) if len(trades) else 0.0,
+        "max_drawdown": float(drawdown.max()) if len(drawdown) else 0.0,
+        "time_in_market": float(trades["minutes"].sum() / (bars * interval_minutes)) if len(trades) else 0.0,
+        "exits": trades["reason"].value_counts().to_dict() if len(trades) else {},
+        "bars": n - first,
+    }
+    return {"trades": trades, "summary": summary}
+
+
+def run_backtest(instrument_key, start_day, end_day, interval="1m", **params):
+    """Backtest [start_day, end_day] (dates or YYYY-MM-DD) from the candle archive, SMA warm-up included."""
+    def _ms(day):
+        day = datetime.strptime(day, "%Y-%m-%d").date() if isinstance(day, str) else day
+        return int(IST.localize(datetime(day.year, day.month, day.day)).timestamp() * 1000)
+
+    start_ms, end_ms = _ms(start_day), _ms(end_day) + DAY_MS
+    warmup = read_archive(instrument_key, interval, end_ms=start_ms, count=max(SMA_PERIODS))
+    records = np.concatenate([warmup, read_archive(instrument_key, interval, start_ms=start_ms, end_ms=end_ms)])
+    return backtest(records, start_ms=start_ms, interval_minutes=interval_to_ms(interval) // 60_000, **params)
+
+
+if __name__ == "__main__":
+    key, start, end = (sys.argv[1:4] + [None] * 3)[:3]
+    if not (key and start and end):
+        print('Usage: python -m app.tasks.backtest "NSE_INDEX|Nifty 50" YYYY-MM-DD YYYY-MM-DD')
+        sys.exit(1)
+    result = run_backtest(key, start, end)
+    if len(result["trades"]):
+        print(result["trades"].to_string(index=False))
+    print("\n📊 " + " | ".join(f"{k}: {v:.4g}" if isinstance(v, float) else f"{k}: {v}"
+                             for k, v in result["summary"].items()))
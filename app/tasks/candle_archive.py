@@ -0,0 +1,305 @@
+# ============================================
+# FILE: app/tasks/candle_archive.py
+# PURPOSE: Append-only, day-partitioned on-disk candle files (closed bars + evicted history)
+# ============================================
+#
+# Layout under CANDLE_ARCHIVE_DIR (default data/candles):
+#   <instrument_key with | -> _>/<interval>/YYYY-MM-DD.bin
+# Each file holds CANDLE_DTYPE records (app/tasks/candle_store.py) in ts order,
+# partitioned by IST trading day. merge_hist_live appends every bar as soon as it
+# closes, so a run writes a few records instead of re-exporting the whole series.
+# Files are append-only: a record is only appended when it is newer than the
+# file's last one, so re-archiving after a crash never duplicates bars, and a
+# torn tail record is ignored on read. A revised bar (backfill) is rewritten in
+# place as one fixed-width record. read_archive() / archive_frame() return the
+# days concatenated as one series, and export_csv() writes it out for analysis.
+# Every append is mirrored into the memory-mapped series file
+# (app/tasks/candle_mmap.py), which read_archive() serves as a zero-copy view.
+#
+# coverage.json (next to the day files) records which days are complete, i.e.
+# were backfilled from the history API after the session ended
+# (app/tasks/history_backfill.py), so only missing days are ever re-fetched.
+
+import json
+import os
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:   # Windows dev machines: no cross-process lock
+    fcntl = None
+
+# --- CONFIG ---
+ARCHIVE_DIR = os.getenv("CANDLE_ARCHIVE_DIR", os.path.join("data", "candles"))
+IST_OFFSET_MS = 19_800_000   # +05:30
+DAY_MS = 86_400_000
+
+
+def _dtype():
+    from app.tasks.candle_store import CANDLE_DTYPE
+    return CANDLE_DTYPE
+
+
+def archive_dir(instrument_key: str, interval: str = "1m", directory=ARCHIVE_DIR):
+    return os.path.join(directory, instrument_key.replace("|", "_"), interval)
+
+
+def day_path(instrument_key: str, interval: str, day, directory=ARCHIVE_DIR):
+    name = day if isinstance(day, str) else day.strftime("%Y-%m-%d")
+    return os.path.join(archive_dir(instrument_key, interval, directory), f"{name}.bin")
+
+
+def archive_lock_path(instrument_key: str, interval: str = "1m", directory=ARCHIVE_DIR):
+    return os.path.join(archive_dir(instrument_key, interval, directory), "archive.lock")
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive cross-process lock held on `path` for the duration of the block."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a+b") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+
+def ist_day_numbers(ts_ms):
+    """Epoch-ms array -> IST day number (days since 1970-01-01)."""
+    return (np.asarray(ts_ms, dtype="<i8") + IST_OFFSET_MS) // DAY_MS
+
+
+def _day_name(day_number):
+    return (date(1970, 1, 1) + timedelta(days=int(day_number))).strftime("%Y-%m-%d")
+
+
+def load_day(path):
+    """All complete records of one day file (empty array when missing)."""
+    dtype = _dtype()
+    if not os.path.exists(path):
+        return np.zeros(0, dtype=dtype)
+    with open(path, "rb") as f:
+        raw = f.read()
+    usable = len(raw) - len(raw) % dtype.itemsize   # drop a torn tail record
+    return np.frombuffer(raw[:usable], dtype=dtype)
+
+
+def _last_ts(path, record_size):
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    usable = size - size % record_size
+    if not usable:
+        return None, usable
+    with open(path, "rb") as f:
+        f.seek(usable - record_size)
+        return int(np.frombuffer(f.read(8), dtype="<i8")[0]), usable
+
+
+def _revise(f, usable, record_size, older):
+    """Overwrite stored records whose values differ from `older` (same ts). Returns the count."""
+    stored = np.memmap(f, dtype=older.dtype, mode="r", shape=(usable // record_size,))
+    idx = np.searchsorted(stored["ts"], older["ts"])
+    found = idx < len(stored)
+    found[found] = stored["ts"][idx[found]] == older["ts"][found]
+    changed = [i for i in np.flatnonzero(found) if stored[idx[i]].tobytes() != older[i].tobytes()]
+    positions = idx[changed].tolist()
+    del stored
+    for pos, record in zip(positions, older[changed]):
+        f.seek(pos * record_size)
+        f.write(record.tobytes())
+    return len(positions)
+
+
+def append_archive(instrument_key: str, interval: str, records, directory=ARCHIVE_DIR, revise=False):
+    """
+    Append ts-sorted records to their day files (fsynced). Returns the number written.
+    With revise=True, records already on disk are rewritten in place when their values changed.
+    """
+    if not len(records):
+        return 0
+    os.makedirs(archive_dir(instrument_key, interval, directory), exist_ok=True)
+    record_size = records.dtype.itemsize
+    days = ist_day_numbers(records["ts"])
+    written = 0
+    changed = []
+
+    with file_lock(archive_lock_path(instrument_key, interval, directory)):
+        for day_number in np.unique(days):
+            chunk = records[days == day_number]
+            path = day_path(instrument_key, interval, _day_name(day_number), directory)
+            last_ts, usable = _last_ts(path, record_size)
+            older = chunk[:0]
+            if last_ts is not None:
+                older = chunk[chunk["ts"] <= last_ts] if revise else older
+                chunk = chunk[chunk["ts"] > last_ts]
+            if not len(chunk) and not len(older):
+                continue
+            with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+                f.truncate(usable)   # cut a torn tail left by a crash mid-write
+                if len(older):
+                    revised = _revise(f, usable, record_size, older)
+                    if revised:
+                        changed.append(older)
+                    written += revised
+                f.seek(usable)
+                f.write(chunk.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            written += len(chunk)
+            changed.append(chunk)
+
+    if written:
+        _mirror_series(instrument_key, interval, np.sort(np.concatenate(changed), order="ts"), directory)
+    return written
+
+
+def _mirror_series(instrument_key, interval, records, directory):
+    """Apply appended/revised records to the mapped series (the day files stay the source of truth)."""
+    from app.tasks.candle_mmap import update_series
+    try:
+        update_series(instrument_key, interval, records, directory)
+    except Exception as e:
+        print(f"⚠️ Could not update the mapped series of {instrument_key}:{interval}: {e}")
+
+
+def write_day(instrument_key: str, interval: str, day, records, directory=ARCHIVE_DIR):
+    """
+    Merge `records` (all from one IST day) into that day's file; on equal ts `records` win.
+    Written to a temp file and renamed, so a crash leaves either the old or the new day.
+    Returns the number of records in the day.
+    """
+    path = day_path(instrument_key, interval, day, directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Same lock as append_archive: a bar appended mid-merge is never lost by the rename
+    with file_lock(archive_lock_path(instrument_key, interval, directory)):
+        merged = np.concatenate([records, load_day(path)])          # fetched rows first ...
+        _, first = np.unique(merged["ts"], return_index=True)      # ... so they win on equal ts
+        merged = merged[first]                                      # np.unique sorts by ts
+
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(merged.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    return len(merged)
+
+
+def insert_archive(instrument_key: str, interval: str, records, directory=ARCHIVE_DIR):
+    """
+    Merge ts-sorted records into their day files wherever they fall (e.g. minutes backfilled
+    after an outage, older than bars already archived) and mirror them into the mapped series.
+    Returns the number of records given.
+    """
+    if not len(records):
+        return 0
+    days = ist_day_numbers(records["ts"])
+    for day_number in np.unique(days):
+        write_day(instrument_key, interval, _day_name(day_number), records[days == day_number], directory)
+    _mirror_series(instrument_key, interval, records, directory)
+    return len(records)
+
+
+def coverage_path(instrument_key: str, interval: str = "1m", directory=ARCHIVE_DIR):
+    return os.path.join(archive_dir(instrument_key, interval, directory), "coverage.json")
+
+
+def load_coverage(instrument_key: str, interval: str = "1m", directory=ARCHIVE_DIR):
+    """{"YYYY-MM-DD": {"bars": n, "source": ..., "checked_at": ...}} for the complete days."""
+    path = coverage_path(instrument_key, interval, directory)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"⚠️ Unreadable coverage index {path}, treating every day as missing: {e}")
+        return {}
+
+
+def mark_covered(instrument_key: str, interval: str, days, source="history", directory=ARCHIVE_DIR):
+    """Record {day: bars} as complete in the coverage index (atomic rewrite of the small JSON)."""
+    if not days:
+        return
+    coverage = load_coverage(instrument_key, interval, directory)
+    checked_at = datetime.now().isoformat(timespec="seconds")
+    for day, bars in days.items():
+        name = day if isinstance(day, str) else day.strftime("%Y-%m-%d")
+        coverage[name] = {"bars": int(bars), "source": source, "checked_at": checked_at}
+
+    path = coverage_path(instrument_key, interval, directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(dict(sorted(coverage.items())), f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def archived_days(instrument_key: str, interval: str = "1m", directory=ARCHIVE_DIR):
+    """Sorted 'YYYY-MM-DD' names of the archived days."""
+    folder = archive_dir(instrument_key, interval, directory)
+    if not os.path.isdir(folder):
+        return []
+    return sorted(name[:-4] for name in os.listdir(folder) if name.endswith(".bin"))
+
+
+def read_archive(instrument_key: str, interval: str = "1m", start_ms=None, end_ms=None, count=None,
+                 directory=ARCHIVE_DIR):
+    """
+    Archived candles with start_ms <= ts < end_ms; `count` keeps only the newest ones.
+    Served as a read-only view of the mapped series when it exists, else read from the day files.
+    """
+    from app.tasks.candle_mmap import mapped_candles
+    records = mapped_candles(instrument_key, interval, start_ms, end_ms, count, directory)
+    if records is not None:
+        return records
+    return read_day_files(instrument_key, interval, start_ms, end_ms, count, directory)
+
+
+def read_day_files(instrument_key: str, interval: str = "1m", start_ms=None, end_ms=None, count=None,
+                   directory=ARCHIVE_DIR):
+    """read_archive() straight from the day files (also what the mapped series is built from)."""
+    days = archived_days(instrument_key, interval, directory)
+    if start_ms is not None:
+        days = [d for d in days if d >= _day_name(ist_day_numbers([start_ms])[0])]
+    if end_ms is not None:
+        days = [d for d in days if d <= _day_name(ist_day_numbers([end_ms - 1])[0])]
+
+    chunks, total = [], 0
+    # Newest day first, so a `count` read stops after the days it needs
+    for day in reversed(days):
+        records = load_day(day_path(instrument_key, interval, day, directory))
+        if start_ms is not None:
+            records = records[records["ts"] >= start_ms]
+        if end_ms is not None:
+            records = records[records["ts"] < end_ms]
+        chunks.append(records)
+        total += len(records)
+        if count is not None and total >= count:
+            break
+
+    if not chunks:
+        return np.zeros(0, dtype=_dtype())
+    result = np.concatenate(chunks[::-1])
+    return result[-count:] if count is not None and count < len(result) else result
+
+
+def archive_frame(instrument_key: str, interval: str = "1m", start_ms=None, end_ms=None, directory=ARCHIVE_DIR):
+    """The archived days as one DataFrame (tz-aware IST `timestamp` + OHLCV/OI columns)."""
+    from app.tasks.candle_store import candles_to_frame
+    return candles_to_frame(read_archive(instrument_key, interval, start_ms, end_ms, directory=directory))
+
+
+def export_csv(instrument_key: str, interval: str = "1m", path=None, start_ms=None, end_ms=None,
+               directory=ARCHIVE_DIR):
+    """Write the archived series to one CSV (the old merged_data_*.csv layout). Returns the path."""
+    path = path or os.path.join("data", f"merged_data_{instrument_key.replace('|', '_')}_{interval}.csv")
+    archive_frame(instrument_key, interval, start_ms, end_ms, directory).to_csv(path, index=False)
+    return path
@@ -0,0 +1,124 @@
+# ============================================
+# FILE: app/tasks/candle_codec.py
+# PURPOSE: Shared candle-frame codec (vectorized tz handling + binary columnar format)
+# ============================================
+#
+# normalize_timestamps() localizes / converts a whole timestamp column at once
+# instead of calling Python per row. encode_candles() / decode_candles() replace
+# to_json(orient="records") for frames cached in Redis:
+#
+#   b"CND1" | rows:uint32 | cols:uint16 | cols x (name_len:uint8, name)
+#   | ts:int64[rows] (epoch ms) | cols x float64[rows]
+#
+# Every column other than `timestamp` is stored as float64.
+
+import re
+import struct
+
+import numpy as np
+import pandas as pd
+
+IST = "Asia/Kolkata"
+MAGIC = b"CND1"
+HEADER = struct.Struct("<4sIH")
+_TZ_SUFFIX = re.compile(r"(Z|[+-]\d{2}:?\d{2})$")
+
+
+def _offset(suffix):
+    """'Z' / '+05:30' / '-0400' -> Timedelta east of UTC."""
+    if suffix == "Z":
+        return pd.Timedelta(0)
+    sign = -1 if suffix[0] == "-" else 1
+    digits = suffix[1:].replace(":", "")
+    return sign * pd.Timedelta(hours=int(digits[:2]), minutes=int(digits[2:]))
+
+
+def normalize_timestamps(values, tz=IST):
+    """
+    Parse a timestamp column and return it as tz-aware in `tz`, vectorized:
+    naive values are localized to `tz`, aware values (or strings with an offset) converted.
+    Unparseable values become NaT.
+    """
+    series = values if isinstance(values, pd.Series) else pd.Series(values)
+
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        if getattr(series.dt, "tz", None) is None:
+            return series.dt.tz_localize(tz)
+        return series.dt.tz_convert(tz)
+
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return pd.to_datetime(series, unit="ms", utc=True).dt.tz_convert(tz)
+
+    # Strings / mixed objects. Parsing "...+05:30" directly is slow in pandas, so
+    # strip the offset, parse the naive part, then shift by the (few) distinct offsets.
+    text = series.astype("string").str.strip()
+    result = pd.Series(pd.NaT, index=series.index, dtype=f"datetime64[ns, {tz}]")
+
+    # Fast path: one "+05:30"-style suffix on every row (HistoryV3Api / Upstox payloads)
+    tails = text.str.slice(-6).unique()
+    if len(tails) == 1 and isinstance(tails[0], str) and _TZ_SUFFIX.fullmatch(tails[0]):
+        naive = pd.to_datetime(text.str.slice(0, -6), errors="coerce", format="ISO8601")
+        result[:] = (naive - _offset(tails[0])).dt.tz_localize("UTC").dt.tz_convert(tz)
+        return result
+
+    suffix = text.str.extract(_TZ_SUFFIX, expand=False)
+    aware = suffix.notna()
+    if aware.any():
+        lengths = suffix[aware].str.len().unique()
+        if len(lengths) == 1:
+            body = text[aware].str.slice(0, -int(lengths[0]))   # one offset style: plain slice
+        else:
+            body = text[aware].str.replace(_TZ_SUFFIX, "", regex=True)
+        naive = pd.to_datetime(body, errors="coerce", format="ISO8601")
+        shift = suffix[aware].map({s: _offset(s) for s in suffix[aware].unique()})
+        result[aware] = (naive - shift.astype("timedelta64[ns]")).dt.tz_localize("UTC").dt.tz_convert(tz)
+    if (~aware).any():
+        naive = pd.to_datetime(text[~aware], errors="coerce", format="ISO8601")
+        result[~aware] = naive.dt.tz_localize(tz)
+    return result
+
+
+def to_epoch_ms(timestamps):
+    """tz-aware datetime Series -> int64 epoch milliseconds (NaT is not allowed)."""
+    return timestamps.dt.tz_convert("UTC").astype("int64") // 1_000_000
+
+
+def encode_candles(df, timestamp_col="timestamp"):
+    """DataFrame with a timestamp column + numeric columns -> compact bytes."""
+    ts = to_epoch_ms(normalize_timestamps(df[timestamp_col])).to_numpy(dtype="<i8")
+    columns = [c for c in df.columns if c != timestamp_col]
+
+    parts = [HEADER.pack(MAGIC, len(df), len(columns))]
+    for name in columns:
+        encoded = str(name).encode("utf-8")
+        parts.append(struct.pack("<B", len(encoded)) + encoded)
+    parts.append(ts.tobytes())
+    for name in columns:
+        parts.append(pd.to_numeric(df[name], errors="coerce").to_numpy(dtype="<f8").tobytes())
+    return b"".join(parts)
+
+
+def decode_candles(blob, tz=IST, timestamp_col="timestamp"):
+    """Bytes from encode_candles() -> DataFrame with a tz-aware timestamp column."""
+    magic, rows, ncols = HEADER.unpack_from(blob, 0)
+    if magic != MAGIC:
+        raise ValueError("Not an encoded candle frame")
+
+    offset = HEADER.size
+    columns = []
+    for _ in range(ncols):
+        length = blob[offset]
+        columns.append(blob[offset + 1: offset + 1 + length].decode("utf-8"))
+        offset += 1 + length
+
+    ts = np.frombuffer(blob, dtype="<i8", count=rows, offset=offset)
+    offset += rows * 8
+    data = {timestamp_col: pd.to_datetime(ts, unit="ms", utc=True).tz_convert(tz)}
+    for name in columns:
+        data[name] = np.frombuffer(blob, dtype="<f8", count=rows, offset=offset)
+        offset += rows * 8
+    return pd.DataFrame(data)
+
+
+def is_encoded(value):
+    return isinstance(value, (bytes, bytearray)) and bytes(value[:4]) == MAGIC
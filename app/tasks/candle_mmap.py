@@ -0,0 +1,221 @@
+# ============================================
+# FILE: app/tasks/candle_mmap.py
+# PURPOSE: Memory-mapped candle series shared by every worker process (zero-copy reads)
+# ============================================
+#
+# Next to the day files of each instrument/interval (app/tasks/candle_archive.py)
+# sits one contiguous series file:
+#   <archive_dir>/series.mmap = 64-byte header + CANDLE_DTYPE records in ts order
+# Readers map it read-only and get NumPy views straight into the OS page cache:
+# no Redis round-trip, no decode, and N worker processes share the same pages
+# instead of holding N private copies of the history.
+#
+# Single writer, many readers:
+#   - writes (update_series / rebuild_series) take an exclusive lock on
+#     series.mmap.lock, so only one process changes a series at a time;
+#   - new bars are written past the published count first and the count in the
+#     header is bumped afterwards, so a reader never sees a half-written bar;
+#   - the file grows in SERIES_GROW_BARS steps and never shrinks, so existing
+#     mappings stay valid; readers remap when the count outgrows their mapping;
+#   - inserting older days (history backfill) rebuilds the file from the day
+#     files into series.mmap.tmp, renames it over series.mmap and flags the old
+#     file superseded, which makes readers remap on their next read.
+# The day files stay the durable copy: series.mmap is derived and can always be
+# rebuilt with rebuild_series().
+
+import mmap
+import os
+
+import numpy as np
+
+from app.tasks.candle_archive import ARCHIVE_DIR, archive_dir, file_lock, read_day_files
+
+# --- CONFIG ---
+SERIES_FILE = "series.mmap"
+SERIES_MAGIC = b"A4ACNDL1"
+SERIES_GROW_BARS = int(os.getenv("CANDLE_SERIES_GROW_BARS", str(375 * 22)))   # ~a month of 1m bars
+HEADER_DTYPE = np.dtype([
+    ("magic", "S8"),
+    ("count", "<i8"),        # published records; bumped after the records are written
+    ("superseded", "<i8"),   # 1 once a rebuilt file replaced this one
+    ("reserved", "<i8", (5,)),
+])
+HEADER_SIZE = HEADER_DTYPE.itemsize   # 64 bytes
+
+
+def _dtype():
+    from app.tasks.candle_store import CANDLE_DTYPE
+    return CANDLE_DTYPE
+
+
+def series_path(instrument_key: str, interval: str = "1m", directory=ARCHIVE_DIR):
+    return os.path.join(archive_dir(instrument_key, interval, directory), SERIES_FILE)
+
+
+# --- Readers ---
+class MappedSeries:
+    """Read-only mapping of one series.mmap; records() is a view of the published bars."""
+
+    def __init__(self, path):
+        self.path = path
+        self._map()
+
+    def _map(self):
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._header = np.frombuffer(self._mmap, dtype=HEADER_DTYPE, count=1)
+        if self._header["magic"][0] != SERIES_MAGIC:
+            raise ValueError(f"{self.path} is not a candle series file")
+        capacity = (len(self._mmap) - HEADER_SIZE) // _dtype().itemsize
+        self._data = np.frombuffer(self._mmap, dtype=_dtype(), count=capacity, offset=HEADER_SIZE)
+        # Older views keep their own reference to the previous mapping, so it is never closed here
+
+    def records(self):
+        """All published records (a read-only view, valid for as long as it is referenced)."""
+        if self._header["superseded"][0]:
+            self._map()
+        count = int(self._header["count"][0])
+        if count > len(self._data):
+            self._map()   # the writer grew the file past this mapping
+        return self._data[:count]
+
+    def slice(self, start_ms=None, end_ms=None, count=None):
+        """View of the records with start_ms <= ts < end_ms; `count` keeps the newest ones."""
+        records = self.records()
+        ts = records["ts"]
+        first = int(np.searchsorted(ts, start_ms)) if start_ms is not None else 0
+        last = int(np.searchsorted(ts, end_ms)) if end_ms is not None else len(records)
+        if count is not None:
+            first = max(first, last - count)
+        return records[first:max(first, last)]
+
+
+_mapped = {}   # path -> MappedSeries, one mapping per process
+
+
+def mapped_series(instrument_key: str, interval: str = "1m", directory=ARCHIVE_DIR):
+    """The process-wide mapping of a series, or None when it has not been built yet."""
+    path = series_path(instrument_key, interval, directory)
+    series = _mapped.get(path)
+    if series is None:
+        if not os.path.exists(path):
+            return None
+        try:
+            series = _mapped[path] = MappedSeries(path)
+        except Exception as e:
+            print(f"⚠️ Cannot map {path}: {e}")
+            return None
+    return series
+
+
+def mapped_candles(instrument_key: str, interval: str = "1m", start_ms=None, end_ms=None, count=None,
+                   directory=ARCHIVE_DIR):
+    """Zero-copy view of the archived candles (None when the series is not mapped)."""
+    series = mapped_series(instrument_key, interval, directory)
+    return None if series is None else series.slice(start_ms, end_ms, count)
+
+
+# --- Single writer ---
+def _header(count, superseded=0):
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header["magic"] = SERIES_MAGIC
+    header["count"] = count
+    header["superseded"] = superseded
+    return header.tobytes()
+
+
+def _capacity_bytes(count):
+    bars = -(-max(count, 1) // SERIES_GROW_BARS) * SERIES_GROW_BARS   # round up to whole steps
+    return HEADER_SIZE + bars * _dtype().itemsize
+
+
+def _rebuild(instrument_key, interval, directory, path):
+    records = read_day_files(instrument_key, interval, directory=directory)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_header(len(records)))
+        f.write(records.tobytes())
+        f.truncate(_capacity_bytes(len(records)))
+        f.flush()
+        os.fsync(f.fileno())
+
+    previous = open(path, "r+b") if os.path.exists(path) else None
+    try:
+        os.replace(tmp, path)
+        if previous is not None:
+            # Readers still mapping the old file see this and remap the new one
+            previous.seek(HEADER_DTYPE.fields["superseded"][1])
+            previous.write(np.int64(1).tobytes())
+            previous.flush()
+    finally:
+        if previous is not None:
+            previous.close()
+    return len(records)
+
+
+def rebuild_series(instrument_key: str, interval: str = "1m", directory=ARCHIVE_DIR):
+    """Rewrite series.mmap from the day files (after a backfill or to repair it). Returns the bar count."""
+    path = series_path(instrument_key, interval, directory)
+    with file_lock(f"{path}.lock"):
+        return _rebuild(instrument_key, interval, directory, path)
+
+
+def _apply(path, records):
+    """update_series() on an existing file; None when the file needs a rebuild instead."""
+    record_size = records.dtype.itemsize
+    with open(path, "r+b") as f:
+        raw = f.read(HEADER_SIZE)
+        if len(raw) < HEADER_SIZE:
+            return None
+        header = np.frombuffer(raw, dtype=HEADER_DTYPE)
+        if header["magic"][0] != SERIES_MAGIC:
+            return None
+        count = int(header["count"][0])
+        if not count or os.path.getsize(path) < HEADER_SIZE + count * record_size:
+            return None
+
+        stored = np.memmap(f, dtype=records.dtype, mode="r", offset=HEADER_SIZE, shape=(count,))
+        last_ts = int(stored["ts"][-1])
+        newer = records[records["ts"] > last_ts]
+        older = records[records["ts"] <= last_ts]
+        idx = np.searchsorted(stored["ts"], older["ts"])
+        found = idx < count
+        found[found] = stored["ts"][idx[found]] == older["ts"][found]
+        if not found.all():
+            return None   # a bar missing in the middle: only a rebuild keeps ts order
+        changed = [i for i in range(len(older)) if stored[idx[i]].tobytes() != older[i].tobytes()]
+        del stored
+
+        # Revised bars: one fixed-width record rewritten in place
+        for i in changed:
+            f.seek(HEADER_SIZE + int(idx[i]) * record_size)
+            f.write(older[i].tobytes())
+
+        if len(newer):
+            if os.path.getsize(path) < HEADER_SIZE + (count + len(newer)) * record_size:
+                f.truncate(_capacity_bytes(count + len(newer)))
+            f.seek(HEADER_SIZE + count * record_size)
+            f.write(newer.tobytes())
+            f.flush()
+            # Publish: readers only look at records below the count
+            f.seek(HEADER_DTYPE.fields["count"][1])
+            f.write(np.int64(count + len(newer)).tobytes())
+        f.flush()
+    return len(changed) + len(newer)
+
+
+def update_series(instrument_key: str, interval: str, records, directory=ARCHIVE_DIR):
+    """
+    Apply records just written to the day files: newer bars are appended, bars with a
+    stored ts are overwritten in place, and a bar missing in the middle triggers a rebuild.
+    Returns the number of records appended or changed.
+    """
+    if not len(records):
+        return 0
+    path = series_path(instrument_key, interval, directory)
+    with file_lock(f"{path}.lock"):
+        applied = _apply(path, records) if os.path.exists(path) else None
+        if applied is None:
+            _rebuild(instrument_key, interval, directory, path)
+            return len(records)
+        return applied
@@ -0,0 +1,330 @@
+# ============================================
+# FILE: app/tasks/candle_store.py
+# PURPOSE: Incremental candle store (fixed-width binary records in Redis)
+# ============================================
+#
+# One Redis STRING per instrument/interval ("candles:<key>:<interval>") holds
+# consecutive 56-byte records <ts_ms:int64><open><high><low><close><volume><oi:float64>
+# in timestamp order. Record i lives at byte offset i * RECORD_SIZE, so:
+#   append          -> APPEND                     O(1) amortized
+#   last-bar update -> SETRANGE at the last slot  O(1)
+#   range read      -> GETRANGE (+ binary search on ts)
+# Updating the forming bar costs the same at 1,000 or 100,000 candles.
+# Writes that depend on what is stored (upsert_candles, the retention trim) run
+# as Lua scripts, so a backfill and merge_hist_live writing the same series can
+# never interleave between a read and the write based on it.
+#
+# Retention: Redis keeps a hot window of the newest HOT_WINDOW_BARS candles
+# (longest indicator lookback + margin). enforce_retention() moves older candles
+# to day files on disk (app/tasks/candle_archive.py) in batches, and
+# read_candles() stitches archive + hot window back together transparently.
+# Closed bars are also mirrored into a memory-mapped series file
+# (app/tasks/candle_mmap.py); reads that end at or before the newest archived
+# bar are answered from that mapping without touching Redis.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from app.tasks.utils import redis_client
+from app.tasks.indicators import SMA_PERIODS
+
+# --- CONFIG ---
+HOT_WINDOW_MARGIN_BARS = int(os.getenv("CANDLE_HOT_WINDOW_MARGIN_BARS", "400"))
+HOT_WINDOW_BARS = int(os.getenv("CANDLE_HOT_WINDOW_BARS", str(max(SMA_PERIODS) + HOT_WINDOW_MARGIN_BARS)))
+# Archive in batches (about one session of 1m bars) so trimming stays amortized O(1)
+COMPACT_BATCH_BARS = int(os.getenv("CANDLE_COMPACT_BATCH_BARS", "375"))
+
+CANDLE_DTYPE = np.dtype([
+    ("ts", "<i8"),        # bar start, epoch milliseconds
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<f8"),
+    ("oi", "<f8"),
+])
+RECORD_SIZE = CANDLE_DTYPE.itemsize   # 56 bytes
+CANDLE_COLUMNS = ["timestamp", "open", "high", "low", "close", "volume", "oi"]
+
+
+# --- Lua (atomic read-modify-write on one series) ---
+# ts is decoded from its 8 little-endian bytes (exact for epoch ms, no struct library needed)
+_LUA_TS = """
+local key, size = KEYS[1], tonumber(ARGV[1])
+local function ts_of(raw, i)
+    local value = 0
+    for k = i + 7, i, -1 do value = value * 256 + string.byte(raw, k) end
+    return value
+end
+local function ts_at(index)
+    return ts_of(redis.call('GETRANGE', key, index * size, index * size + 7), 1)
+end
+local function search(count, ts)
+    local lo, hi = 0, count
+    while lo < hi do
+        local mid = math.floor((lo + hi) / 2)
+        if ts_at(mid) < ts then lo = mid + 1 else hi = mid end
+    end
+    return lo
+end
+"""
+
+# ARGV[2] = ts-sorted records -> {appended, updated}
+UPSERT_SCRIPT = _LUA_TS + """
+local records = ARGV[2]
+local count = math.floor(redis.call('STRLEN', key) / size)
+local last_ts = nil
+if count > 0 then last_ts = ts_at(count - 1) end
+local appended, updated = 0, 0
+for offset = 1, #records, size do
+    local record = string.sub(records, offset, offset + size - 1)
+    local ts = ts_of(record, 1)
+    if last_ts == nil or ts > last_ts then
+        redis.call('APPEND', key, record)
+        count, last_ts, appended = count + 1, ts, appended + 1
+    elseif ts == last_ts then
+        redis.call('SETRANGE', key, (count - 1) * size, record)
+        updated = updated + 1
+    else
+        local index = search(count, ts)
+        if ts_at(index) == ts then
+            redis.call('SETRANGE', key, index * size, record)
+        else
+            -- Missing minute in the middle: rewrite only the tail after it
+            local tail = redis.call('GETRANGE', key, index * size, -1)
+            redis.call('SETRANGE', key, index * size, record .. tail)
+            count = count + 1
+        end
+        updated = updated + 1
+    end
+end
+return {appended, updated}
+"""
+
+# ARGV[2] = cutoff ts: drop every record older than it -> the dropped bytes
+TRIM_SCRIPT = _LUA_TS + """
+local count = math.floor(redis.call('STRLEN', key) / size)
+local cut = search(count, tonumber(ARGV[2]))
+if cut == 0 then return '' end
+local dropped = redis.call('GETRANGE', key, 0, cut * size - 1)
+redis.call('SET', key, redis.call('GETRANGE', key, cut * size, -1))
+return dropped
+"""
+
+
+def candle_store_key(instrument_key: str, interval: str = "1m"):
+    return f"candles:{instrument_key}:{interval}"
+
+
+def interval_to_ms(interval: str):
+    """'1m' -> 60000, '15m' -> 900000, '1h' -> 3600000, '1d' -> 86400000."""
+    units = {"m": 60_000, "h": 3_600_000, "d": 86_400_000}
+    return int(interval[:-1]) * units[interval[-1]]
+
+
+# Higher timeframes are aligned to the 09:15 IST session open (so 60m bars are
+# 09:15, 10:15, ...); 1970-01-01 09:15 IST is 03:45 UTC.
+SESSION_ANCHOR_MS = 13_500_000
+
+
+def bucket_start(ts_ms, interval_ms):
+    """Start (epoch ms) of the interval bucket containing ts_ms; works on ints and numpy arrays."""
+    return ts_ms - (ts_ms - SESSION_ANCHOR_MS) % interval_ms
+
+
+def resample_records(records, interval_ms):
+    """Vectorized roll-up of ts-sorted candle records into `interval_ms` buckets."""
+    if not len(records):
+        return np.zeros(0, dtype=CANDLE_DTYPE)
+    buckets = bucket_start(records["ts"], interval_ms)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(records)] - 1
+
+    out = np.zeros(len(starts), dtype=CANDLE_DTYPE)
+    out["ts"] = buckets[starts]
+    out["open"] = records["open"][starts]
+    out["high"] = np.maximum.reduceat(records["high"], starts)
+    out["low"] = np.minimum.reduceat(records["low"], starts)
+    out["close"] = records["close"][ends]
+    out["volume"] = np.add.reduceat(records["volume"], starts)
+    out["oi"] = records["oi"][ends]
+    return out
+
+
+def _pack(bars):
+    """dicts with ts (epoch ms) + OHLCV(+oi) -> packed records."""
+    records = np.zeros(len(bars), dtype=CANDLE_DTYPE)
+    for i, bar in enumerate(bars):
+        records[i] = (
+            int(bar["ts"]), bar["open"], bar["high"], bar["low"], bar["close"],
+            bar.get("volume", 0) or 0, bar.get("oi", 0) or 0,
+        )
+    return records
+
+
+def records_from_frame(df):
+    """Vectorized DataFrame (epoch-ms `ts` column + OHLCV/oi) -> packed records."""
+    records = np.zeros(len(df), dtype=CANDLE_DTYPE)
+    records["ts"] = df["ts"].to_numpy(dtype="<i8")
+    for name in CANDLE_DTYPE.names[1:]:
+        if name in df:
+            records[name] = pd.to_numeric(df[name], errors="coerce").fillna(0).to_numpy(dtype="<f8")
+    return records
+
+
+def _unpack(raw):
+    usable = len(raw) - len(raw) % RECORD_SIZE
+    return np.frombuffer(raw[:usable], dtype=CANDLE_DTYPE)
+
+
+# --- Reads ---
+def candle_count(instrument_key: str, interval: str = "1m", client=None):
+    """Number of candles in the Redis hot window (archived days not included)."""
+    client = client or redis_client
+    return client.strlen(candle_store_key(instrument_key, interval)) // RECORD_SIZE
+
+
+def _ts_at(client, key, index):
+    raw = client.getrange(key, index * RECORD_SIZE, index * RECORD_SIZE + 7)
+    return int(np.frombuffer(raw, dtype="<i8")[0])
+
+
+def _search(client, key, count, ts_ms):
+    """First record index whose ts >= ts_ms (binary search, O(log n) GETRANGEs of 8 bytes)."""
+    lo, hi = 0, count
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if _ts_at(client, key, mid) < ts_ms:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def last_candle(instrument_key: str, interval: str = "1m", client=None):
+    """The newest record as a dict (ts in epoch ms), or None."""
+    client = client or redis_client
+    raw = client.getrange(candle_store_key(instrument_key, interval), -RECORD_SIZE, -1)
+    if len(raw) < RECORD_SIZE:
+        return None
+    record = _unpack(raw)[0]
+    return {name: record[name].item() for name in CANDLE_DTYPE.names}
+
+
+def read_candles(instrument_key: str, interval: str = "1m", start_ms=None, end_ms=None, count=None, client=None):
+    """
+    Structured array (CANDLE_DTYPE) of candles with start_ms <= ts < end_ms.
+    `count` keeps only the newest `count` of them (e.g. count=100 for the SMA window).
+    Ranges reaching past the hot window are completed from the disk archive.
+    Fully archived ranges come back as a read-only view of the mapped series.
+    """
+    from app.tasks.candle_archive import read_archive
+    from app.tasks.candle_mmap import mapped_candles
+
+    if end_ms is not None:
+        mapped = mapped_candles(instrument_key, interval, start_ms, end_ms, count)
+        # Served from the mapping only when the bar just before end_ms is already archived
+        if mapped is not None and len(mapped) and (count is None or len(mapped) == count):
+            newest = mapped_candles(instrument_key, interval, count=1)
+            if newest["ts"][0] >= end_ms - interval_to_ms(interval):
+                return mapped
+
+    client = client or redis_client
+    key = candle_store_key(instrument_key, interval)
+    total = client.strlen(key) // RECORD_SIZE
+    hot = np.zeros(0, dtype=CANDLE_DTYPE)
+    first = 0
+    if total:
+        first = _search(client, key, total, start_ms) if start_ms is not None else 0
+        last = _search(client, key, total, end_ms) if end_ms is not None else total
+        if count is not None:
+            first = max(first, last - count)
+        if first < last:
+            hot = _unpack(client.getrange(key, first * RECORD_SIZE, last * RECORD_SIZE - 1))
+
+    # Older candles live on disk once the range starts before the hot window
+    remaining = None if count is None else count - len(hot)
+    if first > 0 or remaining == 0:
+        return hot
+    older_end = end_ms
+    if total:
+        hot_start = _ts_at(client, key, 0)
+        older_end = hot_start if end_ms is None else min(end_ms, hot_start)
+    older = read_archive(instrument_key, interval, start_ms=start_ms, end_ms=older_end, count=remaining)
+    return np.concatenate([older, hot]) if len(older) else hot
+
+
+def candles_to_frame(records, tz="Asia/Kolkata"):
+    """Structured candle array -> DataFrame with a tz-aware `timestamp` column."""
+    df = pd.DataFrame({name: records[name] for name in CANDLE_DTYPE.names[1:]})
+    df.insert(0, "timestamp", pd.to_datetime(records["ts"], unit="ms", utc=True).tz_convert(tz))
+    return df
+
+
+# --- Writes (single writer per series) ---
+def replace_candles(instrument_key: str, interval: str, bars, client=None):
+    """Overwrite a series in one SET (initial seed from historical data)."""
+    client = client or redis_client
+    records = bars if isinstance(bars, np.ndarray) else _pack(bars)
+    records = np.sort(records, order="ts")
+    if len(records):
+        # keep the last record of duplicated timestamps
+        keep = np.append(records["ts"][1:] != records["ts"][:-1], True)
+        records = records[keep]
+    client.set(candle_store_key(instrument_key, interval), records.tobytes())
+    return len(records)
+
+
+def upsert_candles(instrument_key: str, interval: str, bars, client=None):
+    """
+    Insert or replace bars by timestamp. Returns (appended, updated).
+    Newer-than-last bars are APPENDed, the last bar is SETRANGEd in place;
+    an older timestamp (a backfilled minute) is located by binary search and
+    overwritten, or spliced in when it is missing. One atomic script call.
+    """
+    client = client or redis_client
+    records = bars if isinstance(bars, np.ndarray) else _pack(bars)
+    if not len(records):
+        return 0, 0
+
+    upsert = client.register_script(UPSERT_SCRIPT)
+    appended, updated = upsert(keys=[candle_store_key(instrument_key, interval)],
+                               args=[RECORD_SIZE, np.sort(records, order="ts").tobytes()])
+    return int(appended), int(updated)
+
+
+def enforce_retention(instrument_key: str, interval: str = "1m", hot_bars=HOT_WINDOW_BARS,
+                      batch_bars=COMPACT_BATCH_BARS, client=None):
+    """
+    Move candles older than the newest `hot_bars` to the disk archive once the
+    hot window has grown by `batch_bars`. Returns the number of candles archived.
+    Archive first, trim second: a crash in between only re-archives (deduplicated).
+    The trim drops records by ts in one script, so bars written meanwhile are kept
+    and a bar spliced into the archived range is archived as well.
+    """
+    from app.tasks.candle_archive import append_archive, insert_archive
+
+    client = client or redis_client
+    key = candle_store_key(instrument_key, interval)
+    count = client.strlen(key) // RECORD_SIZE
+    if count <= hot_bars + batch_bars:
+        return 0
+
+    cut = count - hot_bars
+    raw = client.getrange(key, 0, cut * RECORD_SIZE - 1)
+    evicted = _unpack(raw)
+    append_archive(instrument_key, interval, evicted)
+
+    trim = client.register_script(TRIM_SCRIPT)
+    dropped = trim(keys=[key], args=[RECORD_SIZE, int(evicted["ts"][-1]) + 1])
+    if dropped != raw:
+        # Bars revised or backfilled between the read and the trim
+        insert_archive(instrument_key, interval, _unpack(dropped))
+    return len(dropped) // RECORD_SIZE
+
+
+def delete_candles(instrument_key: str, interval: str = "1m", client=None):
+    client = client or redis_client
+    client.delete(candle_store_key(instrument_key, interval))
@@ -0,0 +1,262 @@
+# ============================================
+# FILE: app/tasks/history_backfill.py
+# PURPOSE: Gap-aware backfill of the local 1m candle archive from HistoryV3Api
+# ============================================
+#
+# The archive (app/tasks/candle_archive.py) keeps one file per instrument and
+# IST day plus a coverage index. backfill_history() works out which sessions in
+# a date range are not covered yet, groups them into contiguous ranges and asks
+# the history API only for those. Each fetched day is merged into its file and
+# marked covered (a session with no candles, e.g. a suspended instrument, is
+# covered with 0 bars; holidays from the trading calendar are never requested), so a repeated or interrupted backfill resumes where it
+# stopped and never downloads a day twice.
+#
+# backfill_many() spreads (instrument x date range) jobs over a bounded thread
+# pool. Every request first takes a token from HISTORY_LIMITER, the one
+# RateLimiter of this process, sized to the Upstox API limits, and 429 / 5xx /
+# network errors are retried with backoff.
+
+import os
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytz
+from urllib3.exceptions import MaxRetryError, ProtocolError
+
+from app.tasks.candle_archive import ARCHIVE_DIR, ist_day_numbers, load_coverage, mark_covered, write_day
+from app.tasks.candle_mmap import rebuild_series
+from app.tasks.candle_codec import normalize_timestamps, to_epoch_ms
+from app.tasks.candle_store import records_from_frame
+from app.tasks.trading_calendar import sessions_between
+
+# --- CONFIG ---
+MAX_DAYS_PER_REQUEST = 28      # HistoryV3Api serves up to one month of 1m candles per call
+HISTORY_INTERVAL = ("minutes", "1")
+SESSION_END = (15, 30)
+HISTORY_WORKERS = int(os.getenv("HISTORY_WORKERS", "8"))
+# "<requests>/<seconds>" windows, all enforced at once (Upstox: 50/s, 500/min, 2000/30min)
+HISTORY_RATE_LIMITS = os.getenv("HISTORY_RATE_LIMITS", "50/1,500/60,2000/1800")
+HISTORY_MAX_RETRIES = int(os.getenv("HISTORY_MAX_RETRIES", "5"))
+HISTORY_BACKOFF_SECONDS = 1.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+NETWORK_ERRORS = (OSError, ConnectionError, MaxRetryError, ProtocolError)
+CANDLE_COLUMNS = ["timestamp", "open", "high", "low", "close", "volume", "oi"]
+
+IST = pytz.timezone("Asia/Kolkata")
+
+
+def session_days(start_day, end_day):
+    """NSE sessions from start_day to end_day (inclusive): no weekends, no exchange holidays."""
+    return sessions_between(start_day, end_day)
+
+
+def last_complete_day(now=None):
+    """Newest day whose session has ended (today only after 15:30 IST)."""
+    now = now or datetime.now(IST)
+    if (now.hour, now.minute) >= SESSION_END:
+        return now.date()
+    return now.date() - timedelta(days=1)
+
+
+def missing_days(instrument_key, start_day, end_day, interval="1m", directory=ARCHIVE_DIR, now=None):
+    """Sessions in [start_day, end_day] that are not in the coverage index (unfinished days excluded)."""
+    end_day = min(end_day, last_complete_day(now))
+    covered = load_coverage(instrument_key, interval, directory)
+    return [d for d in session_days(start_day, end_day) if d.strftime("%Y-%m-%d") not in covered]
+
+
+def day_ranges(days, max_days=MAX_DAYS_PER_REQUEST):
+    """Group sorted missing days into (from_day, to_day) ranges of consecutive sessions."""
+    ranges = []
+    for day in days:
+        if ranges:
+            start, end = ranges[-1]
+            contiguous = not session_days(end + timedelta(days=1), day - timedelta(days=1))
+            if contiguous and (day - start).days < max_days:
+                ranges[-1] = (start, day)
+                continue
+        ranges.append((day, day))
+    return ranges
+
+
+def candles_to_records(candles):
+    """HistoryV3Api candle rows ([timestamp, o, h, l, c, v, oi], newest first) -> sorted records."""
+    df = pd.DataFrame(candles, columns=CANDLE_COLUMNS)
+    df["ts"] = to_epoch_ms(normalize_timestamps(df["timestamp"], tz=IST.zone))
+    records = records_from_frame(df)
+    records.sort(order="ts")
+    return records
+
+
+def fetch_range(api_instance, instrument_key, from_day, to_day):
+    """One HistoryV3Api call for [from_day, to_day]; returns sorted records."""
+    response = api_instance.get_historical_candle_data1(
+        instrument_key,
+        HISTORY_INTERVAL[0],
+        HISTORY_INTERVAL[1],
+        to_day.strftime("%Y-%m-%d"),
+        from_day.strftime("%Y-%m-%d"),
+    )
+    candles = response.data.candles if (response and response.data and response.data.candles) else []
+    return candles_to_records(candles)
+
+
+def store_range(instrument_key, from_day, to_day, records, interval="1m", directory=ARCHIVE_DIR):
+    """
+    Write fetched records into their day files and mark every session of the range covered.
+    The mapped series is left to the caller: rebuild it once after the last range.
+    """
+    days = ist_day_numbers(records["ts"])
+    bars = {}
+    for day in session_days(from_day, to_day):
+        number = (day - datetime(1970, 1, 1).date()).days
+        chunk = records[days == number]
+        bars[day] = write_day(instrument_key, interval, day, chunk, directory) if len(chunk) else 0
+    mark_covered(instrument_key, interval, bars, directory=directory)
+    return sum(bars.values())
+
+
+class TokenBucket:
+    """`rate` tokens per second up to `capacity`; acquire() blocks until a token is free."""
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.clock = clock
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def _wait_time(self):
+        """Take a token and return 0, or return how long until one is available."""
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            wait = self._wait_time()
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """Several token buckets (per second / minute / 30 min) shared by every worker thread."""
+
+    def __init__(self, limits=HISTORY_RATE_LIMITS):
+        self.buckets = []
+        for limit in limits.split(","):
+            count, seconds = (float(x) for x in limit.strip().split("/"))
+            self.buckets.append(TokenBucket(count / seconds, count))
+
+    def acquire(self):
+        for bucket in self.buckets:
+            bucket.acquire()
+
+
+# One limiter per process: every backfill call and thread in this process shares it,
+# which covers all tasks of the gevent Celery worker (start.sh). Separate processes
+# (a second worker, prefork children) each hold their own buckets.
+HISTORY_LIMITER = RateLimiter()
+
+
+def is_retryable(error):
+    """429 / 5xx from the API, a network error, or an API error that never got an HTTP status (0 / None)."""
+    if isinstance(error, NETWORK_ERRORS):
+        return True
+    if not hasattr(error, "status"):
+        return False
+    return error.status in RETRY_STATUSES or error.status in (0, None)
+
+
+def fetch_with_retry(api_instance, instrument_key, from_day, to_day, limiter, retries=HISTORY_MAX_RETRIES):
+    """fetch_range() behind the rate limiter, retried with exponential backoff + jitter."""
+    for attempt in range(retries + 1):
+        limiter.acquire()
+        try:
+            return fetch_range(api_instance, instrument_key, from_day, to_day)
+        except Exception as e:
+            if attempt == retries or not is_retryable(e):
+                raise
+            delay = HISTORY_BACKOFF_SECONDS * 2 ** attempt * (1 + random.random())
+            print(f"[BACKFILL] 🔁 {instrument_key} {from_day}..{to_day}: status "
+                  f"{getattr(e, 'status', None)}, retry {attempt + 1}/{retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def backfill_many(instrument_keys, start_day, end_day, api_instance, interval="1m", directory=ARCHIVE_DIR,
+                  workers=HISTORY_WORKERS, limiter=None):
+    """
+    Backfill the missing sessions of [start_day, end_day] for every instrument on a thread pool.
+    Returns {instrument_key: {"missing_days", "requests", "bars", "failed"}}.
+
+    Requests are paced by `limiter`, by default HISTORY_LIMITER, the process-wide limiter,
+    so concurrent backfills in one process stay within HISTORY_RATE_LIMITS together. The
+    buckets are in memory: run one backfilling process at a time, or split the limits
+    between processes.
+    """
+    limiter = limiter or HISTORY_LIMITER
+    summaries, jobs = {}, []
+    for key in dict.fromkeys(instrument_keys):
+        missing = missing_days(key, start_day, end_day, interval, directory)
+        summaries[key] = {"missing_days": len(missing), "requests": 0, "bars": 0, "failed": []}
+        jobs.extend((key, from_day, to_day) for from_day, to_day in day_ranges(missing))
+    if not jobs:
+        return summaries
+
+    # One writer per instrument at a time: day files and coverage.json are per instrument
+    locks = {key: threading.Lock() for key in summaries}
+    pending = Counter(key for key, _, _ in jobs)
+
+    def run(key, from_day, to_day):
+        records = fetch_with_retry(api_instance, key, from_day, to_day, limiter)
+        with locks[key]:
+            return len(records), store_range(key, from_day, to_day, records, interval, directory)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(run, *job): job for job in jobs}
+        for future in as_completed(futures):
+            key, from_day, to_day = futures[future]
+            label = f"{from_day:%Y-%m-%d}..{to_day:%Y-%m-%d}"
+            summary = summaries[key]
+            try:
+                fetched, bars = future.result()
+                summary["requests"] += 1
+                summary["bars"] += bars
+                print(f"[BACKFILL] ✅ {key} {label}: {fetched} candle(s)")
+            except Exception as e:
+                # ApiException carries the HTTP status/body; the other ranges carry on
+                status = getattr(e, "status", None)
+                print(f"[BACKFILL] ❌ {key} {label} failed (status {status}): {getattr(e, 'body', e)}")
+                summary["failed"].append(label)
+
+            pending[key] -= 1
+            if not pending[key] and summary["bars"]:
+                # Older days land mid-series: one rebuild per instrument, after its last range
+                with locks[key]:
+                    rebuild_series(key, interval, directory)
+    print(f"[BACKFILL] 📥 {len(jobs)} range(s) for {len(summaries)} instrument(s) "
+          f"in {time.monotonic() - started:.1f}s with {workers} worker(s)")
+    return summaries
+
+
+def backfill_history(instrument_key, start_day, end_day, api_instance, interval="1m", directory=ARCHIVE_DIR,
+                     limiter=None):
+    """
+    Fetch only the sessions of [start_day, end_day] missing from the local archive.
+    Returns {"missing_days", "requests", "bars", "failed"}.
+    """
+    return backfill_many([instrument_key], start_day, end_day, api_instance, interval, directory,
+                         limiter=limiter)[instrument_key]
@@ -0,0 +1,633 @@
+# ============================================
+# FILE: app/tasks/indicators.py
+# PURPOSE: Incremental indicator engines and registry (O(1) update per closed bar)
+# ============================================
+#
+# SMAEngine keeps the last max(period) closes in a ring buffer plus one running
+# sum per period, so a new closed bar costs a few additions instead of a
+# rolling().mean() over the whole history. Only the small engine state
+# (sma_state:<key>:<interval>) and the latest values (sma_latest:<key>:<interval>)
+# are persisted.
+
+import json
+import math
+
+from app.tasks.candle_archive import DAY_MS, IST_OFFSET_MS
+from app.tasks.utils import redis_client
+
+# --- CONFIG ---
+SMA_PERIODS = (10, 25, 50, 100)
+SMA_LATEST_TTL = 300   # same lifetime the full sma_data JSON used to have
+
+
+class SMAEngine:
+    """Running-sum SMAs over one ring buffer of the last max(periods) closes."""
+
+    def __init__(self, periods=SMA_PERIODS):
+        self.periods = tuple(sorted(periods))
+        self.size = self.periods[-1]
+        self.ring = [0.0] * self.size
+        self.count = 0                          # closes seen so far
+        self.sums = {p: 0.0 for p in self.periods}    # of the finite closes in each window
+        self.nans = {p: 0 for p in self.periods}      # NaN closes in each window (SMA is None)
+        self.last_ts = None                     # ts (epoch ms) of the last close folded in
+
+    def update(self, close, ts=None):
+        """Fold one closed bar in. O(len(periods)); O(size) once per ring wrap."""
+        size = self.size
+        idx = self.count % size
+        ring = self.ring
+        for p in self.periods:
+            if self.count >= p:
+                leaving = ring[(idx - p) % size]   # close leaving the window
+                if math.isnan(leaving):
+                    self.nans[p] -= 1
+                else:
+                    self.sums[p] -= leaving
+            if math.isnan(close):
+                self.nans[p] += 1
+            else:
+                self.sums[p] += close
+        ring[idx] = close
+        self.count += 1
+        self.last_ts = ts
+
+        # Re-add the sums once per wrap so float rounding never accumulates
+        if idx == size - 1:
+            self._resum()
+        return self.values()
+
+    def _resum(self):
+        last = (self.count - 1) % self.size
+        for p in self.periods:
+            window = [self.ring[(last - k) % self.size] for k in range(min(p, self.count))]
+            self.sums[p] = sum(c for c in window if not math.isnan(c))
+            self.nans[p] = sum(1 for c in window if math.isnan(c))
+
+    @property
+    def last_close(self):
+        return self.ring[(self.count - 1) % self.size] if self.count else None
+
+    def values(self):
+        """{"sma_10": float|None, ...}; None until `period` closes have been seen or while one is NaN."""
+        return {f"sma_{p}": (self.sums[p] / p if self.count >= p and not self.nans[p] else None)
+                for p in self.periods}
+
+    def window(self):
+        """The buffered closes, oldest first."""
+        n = min(self.count, self.size)
+        start = self.count - n
+        return [self.ring[i % self.size] for i in range(start, self.count)]
+
+    # --- Persistence ---
+    def to_state(self):
+        return {"periods": list(self.periods), "count": self.count, "last_ts": self.last_ts, "window": self.window()}
+
+    @classmethod
+    def from_state(cls, state):
+        engine = cls(state["periods"])
+        window = state["window"]
+        # Lay the window out where update() would have put it, then rebuild the sums
+        for offset, close in enumerate(window):
+            engine.ring[(state["count"] - len(window) + offset) % engine.size] = close
+        engine.count = state["count"]
+        engine.last_ts = state["last_ts"]
+        if engine.count:
+            engine._resum()
+        return engine
+
+
+def sma_state_key(instrument_key: str, interval: str = "1m"):
+    return f"sma_state:{instrument_key}:{interval}"
+
+
+def sma_latest_key(instrument_key: str, interval: str = "1m"):
+    return f"sma_latest:{instrument_key}:{interval}"
+
+
+def load_sma_engine(instrument_key: str, interval: str = "1m", periods=SMA_PERIODS, client=None):
+    """Restore a persisted engine, or None when there is none (or the periods changed)."""
+    client = client or redis_client
+    raw = client.get(sma_state_key(instrument_key, interval))
+    if not raw:
+        return None
+    try:
+        state = json.loads(raw)
+        if tuple(state["periods"]) != tuple(sorted(periods)):
+            return None
+        return SMAEngine.from_state(state)
+    except Exception as e:
+        print(f"[SMA] ⚠️ Discarding unreadable SMA state for {instrument_key}: {e}")
+        return None
+
+
+def save_sma_engine(engine, instrument_key: str, interval: str = "1m", version=None, client=None):
+    """Persist the engine state and the latest values in one round-trip. Returns the latest payload."""
+    client = client or redis_client
+    latest = {"ts": engine.last_ts, "close": engine.last_close, "version": version}
+    latest.update(engine.values())
+
+    pipe = client.pipeline(transaction=False)
+    pipe.set(sma_state_key(instrument_key, interval), json.dumps(engine.to_state()))
+    pipe.set(sma_latest_key(instrument_key, interval), json.dumps(latest), ex=SMA_LATEST_TTL)
+    pipe.execute()
+    return latest
+
+
+def get_latest_sma(instrument_key: str, interval: str = "1m", client=None):
+    """{"ts", "close", "version", "sma_10", ...} of the last closed bar, or None."""
+    client = client or redis_client
+    raw = client.get(sma_latest_key(instrument_key, interval))
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except Exception as e:
+        print(f"[SMA] ⚠️ Invalid latest SMA payload for {instrument_key}: {e}")
+        return None
+
+
+def get_latest_smas(instrument_keys, interval: str = "1m", client=None):
+    """{instrument_key: latest SMA payload or None} in one MGET round-trip."""
+    client = client or redis_client
+    keys = list(instrument_keys)
+    if not keys:
+        return {}
+    result = {}
+    for key, raw in zip(keys, client.mget([sma_latest_key(k, interval) for k in keys])):
+        try:
+            result[key] = json.loads(raw) if raw else None
+        except Exception as e:
+            print(f"[SMA] ⚠️ Invalid latest SMA payload for {key}: {e}")
+            result[key] = None
+    return result
+
+
+# ============================================
+# Indicator registry
+# ============================================
+#
+# Every indicator folds one closed bar in O(1) (`update(bar)`), declares how many
+# bars it needs to warm up (`warmup`), and round-trips through a small JSON state.
+# Strategies request (name, params) specs per instrument/interval; the indicator
+# task computes the union of all requests once and caches the values in
+# indicator_latest:<key>:<interval>, so two strategies asking for EMA(20) share
+# one computation.
+
+INDICATOR_LATEST_TTL = SMA_LATEST_TTL
+INDICATOR_REQUEST_TTL = 86400
+INDICATOR_REGISTRY = {}
+
+
+def register_indicator(name):
+    """Class decorator: make an Indicator available to specs under `name`."""
+    def wrap(cls):
+        cls.name = name
+        INDICATOR_REGISTRY[name] = cls
+        return cls
+    return wrap
+
+
+def _fmt(value):
+    return f"{value:g}" if isinstance(value, (int, float)) else str(value)
+
+
+def _skipped(bar):
+    """A bar with a NaN close is left out of the recursive indicators (their value carries over)."""
+    return math.isnan(bar["close"])
+
+
+class Indicator:
+    """Base class: subclasses set `warmup` and implement update() / value()."""
+
+    name = None
+    warmup = 1   # closed bars to replay on a cold start for a stable value
+
+    def __init__(self, **params):
+        self.params = params
+        self.count = 0
+
+    @property
+    def spec_id(self):
+        """Canonical id, e.g. "ema:period=20" (defaults filled in)."""
+        args = ",".join(f"{k}={_fmt(v)}" for k, v in sorted(self.params.items()))
+        return f"{self.name}:{args}" if args else self.name
+
+    def update(self, bar):
+        raise NotImplementedError
+
+    def value(self):
+        raise NotImplementedError
+
+    def to_state(self):
+        return {k: (v.to_state() if isinstance(v, Indicator) else v)
+                for k, v in vars(self).items() if k != "params"}
+
+    @classmethod
+    def from_state(cls, params, state):
+        indicator = cls(**params)
+        for k, v in state.items():
+            current = getattr(indicator, k, None)
+            if isinstance(current, Indicator):
+                v = type(current).from_state(current.params, v)
+            setattr(indicator, k, v)
+        return indicator
+
+
+@register_indicator("ema")
+class EMA(Indicator):
+    """Exponential moving average of the close, seeded with the SMA of the first `period` closes."""
+
+    def __init__(self, period=20):
+        super().__init__(period=period)
+        self.warmup = 3 * period
+        self.ema = None
+        self._seed = 0.0
+
+    def push(self, x):
+        period = self.params["period"]
+        self.count += 1
+        if self.count < period:
+            self._seed += x
+        elif self.count == period:
+            self.ema = (self._seed + x) / period
+        else:
+            self.ema += 2.0 / (period + 1) * (x - self.ema)
+        return self.ema
+
+    def update(self, bar):
+        if _skipped(bar):
+            return self.value()
+        return self.push(bar["close"])
+
+    def value(self):
+        return self.ema
+
+
+@register_indicator("rsi")
+class RSI(Indicator):
+    """Wilder's RSI of the close."""
+
+    def __init__(self, period=14):
+        super().__init__(period=period)
+        self.warmup = 4 * period + 1
+        self.prev_close = None
+        self.avg_gain = 0.0
+        self.avg_loss = 0.0
+
+    def update(self, bar):
+        if _skipped(bar):
+            return self.value()
+        close = bar["close"]
+        if self.prev_close is not None:
+            period = self.params["period"]
+            change = close - self.prev_close
+            gain, loss = max(change, 0.0), max(-change, 0.0)
+            self.count += 1
+            if self.count <= period:   # plain average over the first `period` changes
+                self.avg_gain += gain / period
+                self.avg_loss += loss / period
+            else:
+                self.avg_gain = (self.avg_gain * (period - 1) + gain) / period
+                self.avg_loss = (self.avg_loss * (period - 1) + loss) / period
+        self.prev_close = close
+        return self.value()
+
+    def value(self):
+        if self.count < self.params["period"]:
+            return None
+        if self.avg_loss == 0:
+            return 100.0
+        return 100.0 - 100.0 / (1.0 + self.avg_gain / self.avg_loss)
+
+
+@register_indicator("atr")
+class ATR(Indicator):
+    """Wilder's average true range."""
+
+    def __init__(self, period=14):
+        super().__init__(period=period)
+        self.warmup = 4 * period
+        self.prev_close = None
+        self.atr = None
+        self._seed = 0.0
+
+    def update(self, bar):
+        if _skipped(bar):
+            return self.value()
+        high, low = bar["high"], bar["low"]
+        tr = high - low
+        if self.prev_close is not None:
+            tr = max(tr, abs(high - self.prev_close), abs(low - self.prev_close))
+        self.prev_close = bar["close"]
+
+        period = self.params["period"]
+        self.count += 1
+        if self.count < period:
+            self._seed += tr
+        elif self.count == period:
+            self.atr = (self._seed + tr) / period
+        else:
+            self.atr = (self.atr * (period - 1) + tr) / period
+        return self.atr
+
+    def value(self):
+        return self.atr
+
+
+@register_indicator("supertrend")
+class Supertrend(Indicator):
+    """ATR bands around (high+low)/2 that only tighten while the trend holds."""
+
+    def __init__(self, period=10, multiplier=3):
+        super().__init__(period=period, multiplier=multiplier)
+        self.atr = ATR(period)
+        self.warmup = self.atr.warmup + 1
+        self.upper = None
+        self.lower = None
+        self.direction = 1     # 1 = up (price above the lower band), -1 = down
+        self.prev_close = None
+
+    def update(self, bar):
+        if _skipped(bar):
+            return self.value()
+        atr = self.atr.update(bar)
+        close = bar["close"]
+        if atr is not None:
+            mid = (bar["high"] + bar["low"]) / 2
+            upper = mid + self.params["multiplier"] * atr
+            lower = mid - self.params["multiplier"] * atr
+            if self.upper is not None:
+                if not (upper < self.upper or self.prev_close > self.upper):
+                    upper = self.upper
+                if not (lower > self.lower or self.prev_close < self.lower):
+                    lower = self.lower
+                if self.direction == 1 and close < lower:
+                    self.direction = -1
+                elif self.direction == -1 and close > upper:
+                    self.direction = 1
+            self.upper, self.lower = upper, lower
+            self.count += 1
+        self.prev_close = close
+        return self.value()
+
+    def value(self):
+        if self.upper is None:
+            return None
+        line = self.lower if self.direction == 1 else self.upper
+        return {"supertrend": line, "direction": self.direction, "upper": self.upper, "lower": self.lower}
+
+
+@register_indicator("bollinger")
+class Bollinger(Indicator):
+    """SMA(period) +/- k population standard deviations, from running sums over a ring buffer."""
+
+    def __init__(self, period=20, k=2):
+        super().__init__(period=period, k=k)
+        self.warmup = period
+        self.ring = [0.0] * period
+        self.total = 0.0      # of the finite closes in the window
+        self.total_sq = 0.0
+        self.nans = 0         # NaN closes in the window (bands are None), as in SMAEngine
+
+    def update(self, bar):
+        close = bar["close"]
+        period = self.params["period"]
+        idx = self.count % period
+        if self.count >= period:
+            old = self.ring[idx]
+            if math.isnan(old):
+                self.nans -= 1
+            else:
+                self.total -= old
+                self.total_sq -= old * old
+        self.ring[idx] = close
+        if math.isnan(close):
+            self.nans += 1
+        else:
+            self.total += close
+            self.total_sq += close * close
+        self.count += 1
+        if idx == period - 1:   # re-add once per wrap so rounding never accumulates
+            finite = [x for x in self.ring if not math.isnan(x)]
+            self.total = sum(finite)
+            self.total_sq = sum(x * x for x in finite)
+        return self.value()
+
+    def value(self):
+        period = self.params["period"]
+        if self.count < period or self.nans:
+            return None
+        mid = self.total / period
+        std = max(self.total_sq / period - mid * mid, 0.0) ** 0.5
+        band = self.params["k"] * std
+        return {"mid": mid, "upper": mid + band, "lower": mid - band}
+
+
+@register_indicator("macd")
+class MACD(Indicator):
+    """EMA(fast) - EMA(slow), its EMA(signal) and the histogram."""
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        super().__init__(fast=fast, slow=slow, signal=signal)
+        self.fast = EMA(fast)
+        self.slow = EMA(slow)
+        self.signal = EMA(signal)
+        self.warmup = self.slow.warmup + signal
+        self.macd = None
+
+    def update(self, bar):
+        if _skipped(bar):
+            return self.value()
+        fast, slow = self.fast.update(bar), self.slow.update(bar)
+        self.count += 1
+        if fast is not None and slow is not None:
+            self.macd = fast - slow
+            self.signal.push(self.macd)
+        return self.value()
+
+    def value(self):
+        if self.macd is None:
+            return None
+        signal = self.signal.value()
+        return {"macd": self.macd, "signal": signal, "hist": None if signal is None else self.macd - signal}
+
+
+@register_indicator("vwap")
+class VWAP(Indicator):
+    """Session VWAP of the typical price, reset at each IST trading day (None without volume)."""
+
+    warmup = 375   # one full session of 1m bars
+
+    def __init__(self):
+        super().__init__()
+        self.day = None
+        self.pv = 0.0
+        self.volume = 0.0
+
+    def update(self, bar):
+        if _skipped(bar):
+            return self.value()
+        day = (int(bar["ts"]) + IST_OFFSET_MS) // DAY_MS
+        if day != self.day:
+            self.day, self.pv, self.volume = day, 0.0, 0.0
+        volume = bar.get("volume", 0) or 0
+        self.pv += (bar["high"] + bar["low"] + bar["close"]) / 3 * volume
+        self.volume += volume
+        self.count += 1
+        return self.value()
+
+    def value(self):
+        return self.pv / self.volume if self.volume else None
+
+
+def build_indicator(spec):
+    """{"name": "ema", "period": 20} (or an "ema" string) -> a fresh Indicator."""
+    if isinstance(spec, str):
+        spec = {"name": spec}
+    params = {k: v for k, v in spec.items() if k != "name"}
+    try:
+        cls = INDICATOR_REGISTRY[spec["name"]]
+    except KeyError:
+        raise ValueError(f"Unknown indicator: {spec['name']}") from None
+    return cls(**params)
+
+
+def spec_id(spec):
+    return build_indicator(spec).spec_id
+
+
+class IndicatorSet:
+    """All indicators requested for one instrument/interval, fed the same closed bars."""
+
+    def __init__(self, indicators=()):
+        self.indicators = {ind.spec_id: ind for ind in indicators}
+        self.last_ts = None
+        self.last_close = None
+
+    @property
+    def warmup(self):
+        return max((ind.warmup for ind in self.indicators.values()), default=0)
+
+    def add(self, indicator):
+        self.indicators.setdefault(indicator.spec_id, indicator)
+
+    def update(self, bar):
+        for indicator in self.indicators.values():
+            indicator.update(bar)
+        self.last_ts = int(bar["ts"])
+        self.last_close = bar["close"]
+
+    def values(self):
+        return {sid: ind.value() for sid, ind in self.indicators.items()}
+
+
+def indicator_state_key(instrument_key: str, interval: str = "1m"):
+    return f"indicator_state:{instrument_key}:{interval}"
+
+
+def indicator_latest_key(instrument_key: str, interval: str = "1m"):
+    return f"indicator_latest:{instrument_key}:{interval}"
+
+
+def _requests_prefix(instrument_key, interval):
+    return f"indicators:req:{instrument_key}:{interval}:"
+
+
+def _owners_key(instrument_key, interval):
+    return f"indicators:owners:{instrument_key}:{interval}"
+
+
+def request_indicators(owner: str, instrument_key: str, interval: str, specs, timeout: int = INDICATOR_REQUEST_TTL,
+                       client=None):
+    """Ask for `specs` to be kept up to date for this series on behalf of `owner` (a strategy / user)."""
+    client = client or redis_client
+    specs = [{"name": s} if isinstance(s, str) else dict(s) for s in specs]
+    for spec in specs:
+        build_indicator(spec)   # reject unknown names / params at request time
+    pipe = client.pipeline()
+    pipe.sadd(_owners_key(instrument_key, interval), owner)
+    pipe.setex(_requests_prefix(instrument_key, interval) + owner, timeout, json.dumps(specs))
+    pipe.execute()
+
+
+def load_requested_specs(instrument_key: str, interval: str = "1m", client=None):
+    """{spec_id: spec} over every live owner's request; expired owners are dropped."""
+    client = client or redis_client
+    owners = sorted(o.decode() if isinstance(o, bytes) else o for o in client.smembers(_owners_key(instrument_key, interval)))
+    if not owners:
+        return {}
+    prefix = _requests_prefix(instrument_key, interval)
+    raws = client.mget([prefix + owner for owner in owners])
+
+    specs, expired = {}, []
+    for owner, raw in zip(owners, raws):
+        if raw is None:
+            expired.append(owner)
+            continue
+        try:
+            for spec in json.loads(raw):
+                specs.setdefault(spec_id(spec), spec)
+        except Exception as e:
+            print(f"[INDICATORS] ⚠️ Invalid indicator request from {owner}: {e}")
+    if expired:
+        client.srem(_owners_key(instrument_key, interval), *expired)
+    return specs
+
+
+def load_indicator_set(instrument_key: str, interval: str, specs, client=None):
+    """Restore the persisted set for `specs` ({spec_id: spec}); ids without state are returned as missing."""
+    client = client or redis_client
+    indicator_set = IndicatorSet()
+    ids = list(specs)
+    raw_meta, *raws = client.hmget(indicator_state_key(instrument_key, interval), ["_meta"] + ids) if ids else [None]
+    if raw_meta:
+        meta = json.loads(raw_meta)
+        indicator_set.last_ts, indicator_set.last_close = meta["last_ts"], meta["last_close"]
+
+    missing = []
+    for sid, raw in zip(ids, raws):
+        if not raw or not raw_meta:
+            missing.append(sid)
+            continue
+        try:
+            template = build_indicator(specs[sid])
+            indicator_set.add(type(template).from_state(template.params, json.loads(raw)))
+        except Exception as e:
+            print(f"[INDICATORS] ⚠️ Discarding unreadable state for {sid}: {e}")
+            missing.append(sid)
+    return indicator_set, missing
+
+
+def save_indicator_set(indicator_set, instrument_key: str, interval: str = "1m", version=None, client=None):
+    """Persist every state and the latest values in one round-trip. Returns {spec_id: value}."""
+    client = client or redis_client
+    values = indicator_set.values()
+    meta = {"last_ts": indicator_set.last_ts, "last_close": indicator_set.last_close}
+    state = {sid: json.dumps(ind.to_state()) for sid, ind in indicator_set.indicators.items()}
+    latest = {sid: json.dumps(value) for sid, value in values.items()}
+    latest["_meta"] = json.dumps(dict(meta, ts=indicator_set.last_ts, version=version))
+
+    state_key = indicator_state_key(instrument_key, interval)
+    latest_key = indicator_latest_key(instrument_key, interval)
+    pipe = client.pipeline(transaction=False)
+    pipe.delete(state_key)   # drop indicators nobody requests any more
+    pipe.hset(state_key, mapping=dict(state, _meta=json.dumps(meta)))
+    pipe.delete(latest_key)
+    pipe.hset(latest_key, mapping=latest)
+    pipe.expire(latest_key, INDICATOR_LATEST_TTL)
+    pipe.execute()
+    return values
+
+
+def get_indicator_values(instrument_key: str, interval: str = "1m", specs=None, client=None):
+    """Cached values of the last closed bar: {spec_id: value} (all cached ones when specs is None)."""
+    client = client or redis_client
+    key = indicator_latest_key(instrument_key, interval)
+    if specs is None:
+        raw = {(k.decode() if isinstance(k, bytes) else k): v for k, v in client.hgetall(key).items()}
+        raw.pop("_meta", None)
+    else:
+        ids = [spec_id(s) for s in specs]
+        raw = dict(zip(ids, client.hmget(key, ids)))
+    return {sid: (json.loads(v) if v is not None else None) for sid, v in raw.items()}
@@ -0,0 +1,128 @@
+# app/tasks/streamer/backfill.py
+# PURPOSE: Fill the 1m bars missed while the feed socket was down.
+#
+# After a reconnect the streamer asks HistoryV3Api for the candles of the outage
+# window, one trading session at a time (intraday candles for today, historical
+# candles for an earlier day when the gap crossed midnight). The bars are
+# XADDed to the bar streams for live consumers and written straight into the
+# candle store and the archive: merge_hist_live only picks up stream bars newer
+# than its last bar, so bars older than a post-reconnect live bar would
+# otherwise never reach the store.
+
+import asyncio
+from datetime import datetime
+
+import numpy as np
+from upstox_client.rest import ApiException
+
+from app.tasks.candle_archive import insert_archive
+from app.tasks.candle_store import CANDLE_DTYPE, candle_count, upsert_candles
+from app.tasks.history_backfill import fetch_range
+from app.tasks.task_1_fetch_hist import get_historical_api_instance
+from app.tasks.trading_calendar import IST, SESSION_MINUTES, session_open_ms, sessions_between
+
+BACKFILL_CONCURRENCY = 4
+
+
+def session_windows(start_ms, end_ms):
+    """Split [start_ms, end_ms) into (day, start, end) windows clipped to each trading session."""
+    start_day = datetime.fromtimestamp(start_ms / 1000, IST).date()
+    end_day = datetime.fromtimestamp((end_ms - 1) / 1000, IST).date()
+    windows = []
+    for day in sessions_between(start_day, end_day):
+        opening = session_open_ms(day)
+        window = (day, max(start_ms, opening), min(end_ms, opening + SESSION_MINUTES * 60_000))
+        if window[1] < window[2]:
+            windows.append(window)
+    return windows
+
+
+def fetch_session_bars(api_instance, instrument_key, day, start_ms, end_ms):
+    """1m bars of one session window: intraday candles for today, historical candles before."""
+    if day == datetime.now(IST).date():
+        return fetch_intraday_bars(api_instance, instrument_key, start_ms, end_ms)
+    records = fetch_range(api_instance, instrument_key, day, day)
+    records = records[(records["ts"] >= start_ms) & (records["ts"] < end_ms)]
+    return [
+        {"ts": int(r["ts"]), "open": float(r["open"]), "high": float(r["high"]), "low": float(r["low"]),
+         "close": float(r["close"]), "volume": int(r["volume"]), "ticks": 0, "backfilled": 1}
+        for r in records
+    ]
+
+
+def store_backfilled_bars(instrument_key, bars):
+    """Splice the bars into the 1m candle store (any position) and the disk archive."""
+    if not bars or not candle_count(instrument_key, "1m"):
+        return   # not seeded yet: the first merge seeds the full history
+    upsert_candles(instrument_key, "1m", bars)
+    records = np.zeros(len(bars), dtype=CANDLE_DTYPE)
+    for name in ("ts", "open", "high", "low", "close", "volume"):
+        records[name] = [bar[name] for bar in bars]
+    insert_archive(instrument_key, "1m", records)
+
+
+def fetch_intraday_bars(api_instance, instrument_key, start_ms, end_ms):
+    """Return today's 1m candles of `instrument_key` with start_ms <= ts < end_ms, oldest first."""
+    response = api_instance.get_intra_day_candle_data(instrument_key, "minutes", 1)
+    candles = (
+        response.data.candles
+        if (response and response.data and response.data.candles)
+        else []
+    )
+
+    bars = []
+    for candle in candles:
+        # [timestamp, open, high, low, close, volume, oi]
+        ts = int(datetime.fromisoformat(candle[0]).timestamp() * 1000)
+        if start_ms <= ts < end_ms:
+            bars.append({
+                "ts": ts,
+                "open": float(candle[1]),
+                "high": float(candle[2]),
+                "low": float(candle[3]),
+                "close": float(candle[4]),
+                "volume": int(candle[5] or 0),
+                "ticks": 0,
+                "backfilled": 1,
+            })
+    bars.sort(key=lambda bar: bar["ts"])
+    return bars
+
+
+async def backfill_gap(aggregator, access_token, instrument_keys, start_ms, end_ms):
+    """Backfill [start_ms, end_ms) for every instrument. Returns the number of bars added."""
+    # Only trading sessions have candles: nothing to ask for on holidays, nights or before 09:15
+    windows = session_windows(start_ms, end_ms) if end_ms > start_ms else []
+    if not windows or not instrument_keys:
+        return 0
+
+    api_instance = get_historical_api_instance(access_token)
+    if not api_instance:
+        print("⚠️ Backfill skipped: no access token.")
+        return 0
+
+    semaphore = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+
+    async def _one(instrument_key, day, window_start, window_end):
+        async with semaphore:
+            try:
+                bars = await asyncio.to_thread(
+                    fetch_session_bars, api_instance, instrument_key, day, window_start, window_end)
+                await asyncio.to_thread(store_backfilled_bars, instrument_key, bars)
+            except ApiException as e:
+                print(f"❌ Backfill API error for {instrument_key} (Status {e.status}): {e.body}")
+                return 0
+            except Exception as e:
+                print(f"❌ Backfill failed for {instrument_key}: {e}")
+                return 0
+        for bar in bars:
+            aggregator.add_closed_bar(instrument_key, bar)
+        return len(bars)
+
+    counts = await asyncio.gather(*(
+        _one(key, *window) for window in windows for key in sorted(instrument_keys)
+    ))
+    total = sum(counts)
+    print(f"🩹 Backfilled {total} bar(s) for {len(instrument_keys)} instrument(s) "
+          f"between {datetime.fromtimestamp(start_ms / 1000)} and {datetime.fromtimestamp(end_ms / 1000)}")
+    return total
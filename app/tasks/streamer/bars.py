@@ -0,0 +1,141 @@
+# app/tasks/streamer/bars.py
+# PURPOSE: Aggregate every tick into 1-minute OHLC bars inside the streamer.
+#
+# The forming bar of each instrument lives in a Redis hash (bar_forming:*) and
+# every closed bar is XADDed to a per-instrument Redis Stream (bars:*), so
+# downstream tasks read exact bars at the minute boundary instead of sampling LTP.
+
+import asyncio
+import os
+import time
+
+from app.tasks.utils import bar_stream_key, forming_bar_key
+
+# --- CONFIG ---
+BAR_INTERVAL = "1m"
+BAR_INTERVAL_MS = 60_000
+# Bars of instruments that stop ticking are closed this long after the boundary.
+BAR_CLOSE_GRACE_MS = int(os.getenv("STREAMER_BAR_CLOSE_GRACE_MS", "1500"))
+BAR_STREAM_MAXLEN = int(os.getenv("STREAMER_BAR_STREAM_MAXLEN", "5000"))
+BAR_CLOSE_CHECK_SECONDS = 0.5
+
+
+class BarAggregator:
+    """Keeps one forming bar per instrument and emits it when the minute ends."""
+
+    def __init__(self, writer, interval=BAR_INTERVAL, interval_ms=BAR_INTERVAL_MS, clock=None):
+        self.writer = writer
+        # Callable returning "now" in epoch ms; replay swaps in a simulated clock
+        self.clock = clock or (lambda: int(time.time() * 1000))
+        self.interval = interval
+        self.interval_ms = interval_ms
+        self._bars = {}         # instrument -> forming bar dict
+        self._last_closed = {}  # instrument -> ts of the last closed bar
+        self._last_ltt = {}     # instrument -> ltt of the last counted trade
+        self._last_vtt = {}     # instrument -> cumulative day volume at the last tick
+        self.late_ticks = 0
+        self.bars_closed = 0
+        # Callables (instrument, interval, bar) run after a bar is closed; must not block
+        self.close_listeners = []
+
+    def on_tick(self, tick, now_ms=None):
+        """Fold one Tick into its instrument's forming bar."""
+        ts_ms = tick.ltt or now_ms or self.clock()
+        bar_ts = ts_ms - ts_ms % self.interval_ms
+        instrument = tick.instrument
+
+        if bar_ts <= self._last_closed.get(instrument, -1):
+            self.late_ticks += 1
+            return None
+
+        bar = self._bars.get(instrument)
+        if bar is not None and bar_ts > bar["ts"]:
+            self._close(instrument, bar)
+            bar = None
+
+        ltp = tick.ltp
+        if bar is None:
+            bar = {"ts": bar_ts, "open": ltp, "high": ltp, "low": ltp, "close": ltp, "volume": 0, "ticks": 0}
+            self._bars[instrument] = bar
+        else:
+            if ltp > bar["high"]:
+                bar["high"] = ltp
+            if ltp < bar["low"]:
+                bar["low"] = ltp
+            bar["close"] = ltp
+
+        bar["volume"] += self._traded_since_last_tick(instrument, tick)
+        bar["ticks"] += 1
+
+        self.writer.hset(forming_bar_key(instrument, self.interval), dict(bar, closed=0))
+        return bar
+
+    def _traded_since_last_tick(self, instrument, tick):
+        """
+        Volume between this tick and the previous one. The cumulative day volume (vtt)
+        counts every trade, including trades sharing an ltt and those of dropped or
+        conflated frames. Without vtt (ltpc mode; indices report ltq = 0) fall back
+        to ltq, counting a repeated last-traded-time once.
+        """
+        vtt = tick.vtt
+        if vtt:
+            previous = self._last_vtt.get(instrument)
+            self._last_vtt[instrument] = vtt
+            if previous is not None and vtt >= previous:
+                return vtt - previous
+            # First tick seen (or the day's volume restarted): only this trade is ours
+            return tick.ltq or 0
+        if tick.ltq and tick.ltt != self._last_ltt.get(instrument):
+            self._last_ltt[instrument] = tick.ltt
+            return tick.ltq
+        return 0
+
+    def _close(self, instrument, bar):
+        self.writer.xadd(bar_stream_key(instrument, self.interval), bar, maxlen=BAR_STREAM_MAXLEN)
+        self.writer.hset(forming_bar_key(instrument, self.interval), dict(bar, closed=1))
+        self._last_closed[instrument] = bar["ts"]
+        self.bars_closed += 1
+        self._notify_close(instrument, bar)
+
+    def add_closed_bar(self, instrument, bar):
+        """Publish a bar that was not built from ticks (e.g. backfilled after an outage)."""
+        forming = self._bars.get(instrument)
+        if forming is not None and bar["ts"] >= forming["ts"]:
+            return  # live ticks already own this minute
+        self.writer.xadd(bar_stream_key(instrument, self.interval), bar, maxlen=BAR_STREAM_MAXLEN)
+        self._last_closed[instrument] = max(self._last_closed.get(instrument, -1), bar["ts"])
+        self.bars_closed += 1
+        self._notify_close(instrument, bar)
+
+    def _notify_close(self, instrument, bar):
+        for listener in self.close_listeners:
+            try:
+                listener(instrument, self.interval, bar)
+            except Exception as e:
+                print(f"⚠️ Bar close listener failed for {instrument}: {e}")
+
+    def drop_forming(self):
+        """Discard forming bars (their ticks stopped mid-minute). Returns the earliest dropped ts."""
+        earliest = min((bar["ts"] for bar in self._bars.values()), default=None)
+        self._bars.clear()
+        return earliest
+
+    def close_due(self, now_ms=None):
+        """Close bars whose minute has ended (plus grace) even without a new tick."""
+        now_ms = now_ms or self.clock()
+        closed = []
+        for instrument, bar in list(self._bars.items()):
+            if now_ms >= bar["ts"] + self.interval_ms + BAR_CLOSE_GRACE_MS:
+                self._close(instrument, bar)
+                del self._bars[instrument]
+                closed.append((instrument, bar))
+        return closed
+
+    def forming_bars(self):
+        return {instrument: dict(bar) for instrument, bar in self._bars.items()}
+
+    async def run(self, stop_requested):
+        """Periodic boundary check so quiet instruments still close on time."""
+        while not stop_requested():
+            self.close_due()
+            await asyncio.sleep(BAR_CLOSE_CHECK_SECONDS)
@@ -0,0 +1,161 @@
+# app/tasks/streamer/conflation.py
+# PURPOSE: Per-consumer delivery policies between the decoder and tick consumers.
+#
+# The receive loop hands every decoded tick to one TickConflator. Each consumer
+# (LTP keys, pub/sub, bar aggregator) is registered with its own policy:
+#   every          -> every tick, as received
+#   on_change      -> only ticks whose ltp differs from the last one delivered
+#   latest:<ms>    -> the latest tick per instrument, at most once per <ms>
+# so CPU and Redis writes follow what each consumer needs, not the raw feed rate.
+# Policies are set with STREAMER_POLICY_<CONSUMER>, e.g. STREAMER_POLICY_LTP=latest:500.
+
+import asyncio
+import os
+import time
+from collections import namedtuple
+
+from app.tasks.streamer.writer import STREAMER_METRICS_KEY
+
+EVERY_TICK = "every"
+ON_CHANGE = "on_change"
+LATEST = "latest"
+
+ConsumerPolicy = namedtuple("ConsumerPolicy", ["mode", "interval_ms"])
+
+
+def parse_policy(spec):
+    """'every' | 'on_change' | 'latest:<ms>' -> ConsumerPolicy."""
+    mode, _, interval = spec.strip().lower().partition(":")
+    if mode in (EVERY_TICK, ON_CHANGE) and not interval:
+        return ConsumerPolicy(mode, 0)
+    if mode == LATEST and interval:
+        interval_ms = float(interval)
+        if interval_ms > 0:
+            return ConsumerPolicy(LATEST, interval_ms)
+    raise ValueError(f"Invalid consumer policy {spec!r} (expected every, on_change or latest:<ms>)")
+
+
+# --- CONFIG ---
+LTP_POLICY = parse_policy(os.getenv("STREAMER_POLICY_LTP", "latest:250"))
+PUBSUB_POLICY = parse_policy(
+    os.getenv("STREAMER_POLICY_PUBSUB", f"latest:{os.getenv('STREAMER_PUBLISH_INTERVAL_MS', '100')}")
+)
+# Bars need every trade for high/low/volume; conflating them trades accuracy for CPU.
+BARS_POLICY = parse_policy(os.getenv("STREAMER_POLICY_BARS", "every"))
+# The journal stores raw frames for replay, so anything but "every" would make it lossy.
+JOURNAL_POLICY = parse_policy(os.getenv("STREAMER_POLICY_JOURNAL", "every"))
+METRICS_PUBLISH_SECONDS = 1.0
+MAX_IDLE_SECONDS = 0.5
+
+
+class _Consumer:
+    __slots__ = ("name", "deliver", "on_batch", "mode", "interval_ms",
+                 "pending", "last_ltp", "next_due_ms", "received", "delivered")
+
+    def __init__(self, name, deliver, policy, on_batch):
+        self.name = name
+        self.deliver = deliver
+        self.on_batch = on_batch
+        self.mode = policy.mode
+        self.interval_ms = policy.interval_ms
+        self.pending = {}      # instrument -> (tick, now_ms), LATEST only
+        self.last_ltp = {}     # instrument -> last delivered ltp, ON_CHANGE only
+        self.next_due_ms = 0
+        self.received = 0
+        self.delivered = 0
+
+
+class TickConflator:
+    """Fans decoded ticks out to consumers, each at the rate its policy allows."""
+
+    def __init__(self, writer=None, clock=None, metrics_key=STREAMER_METRICS_KEY):
+        self.writer = writer
+        # Callable returning "now" in epoch ms; replay swaps in a simulated clock
+        self.clock = clock or (lambda: int(time.time() * 1000))
+        self.metrics_key = metrics_key
+        self._immediate = []   # EVERY_TICK / ON_CHANGE consumers
+        self._interval = []    # LATEST consumers
+        self._last_metrics_publish = 0.0
+
+    def register(self, name, deliver, policy, on_batch=None):
+        """deliver(tick, now_ms) per delivered tick; on_batch(now_ms) after each delivery round."""
+        consumer = _Consumer(name, deliver, policy, on_batch)
+        (self._interval if policy.mode == LATEST else self._immediate).append(consumer)
+        print(f"🔌 Tick consumer '{name}' -> {policy.mode}"
+              + (f" every {policy.interval_ms:g}ms" if policy.mode == LATEST else ""))
+        return consumer
+
+    # --- Receive loop side ---
+    def on_ticks(self, ticks, now_ms=None):
+        """Route one frame's ticks, then deliver interval consumers that are due."""
+        now_ms = self.clock() if now_ms is None else now_ms
+        if ticks:
+            for consumer in self._immediate:
+                consumer.received += len(ticks)
+                sent = 0
+                if consumer.mode == EVERY_TICK:
+                    for tick in ticks:
+                        consumer.deliver(tick, now_ms)
+                    sent = len(ticks)
+                else:
+                    last_ltp = consumer.last_ltp
+                    for tick in ticks:
+                        if last_ltp.get(tick.instrument) != tick.ltp:
+                            last_ltp[tick.instrument] = tick.ltp
+                            consumer.deliver(tick, now_ms)
+                            sent += 1
+                consumer.delivered += sent
+                if sent and consumer.on_batch is not None:
+                    consumer.on_batch(now_ms)
+
+            for consumer in self._interval:
+                consumer.received += len(ticks)
+                pending = consumer.pending
+                for tick in ticks:
+                    pending[tick.instrument] = (tick, now_ms)
+
+        self.flush_due(now_ms)
+
+    def flush_due(self, now_ms=None, force=False):
+        """Deliver the latest pending tick per instrument to every LATEST consumer that is due."""
+        now_ms = self.clock() if now_ms is None else now_ms
+        for consumer in self._interval:
+            if not consumer.pending or (not force and now_ms < consumer.next_due_ms):
+                continue
+            batch, consumer.pending = consumer.pending, {}
+            for tick, tick_ms in batch.values():
+                consumer.deliver(tick, tick_ms)
+            consumer.delivered += len(batch)
+            consumer.next_due_ms = now_ms + consumer.interval_ms
+            if consumer.on_batch is not None:
+                consumer.on_batch(now_ms)
+
+    def _seconds_until_due(self, now_ms):
+        waits = [c.next_due_ms - now_ms for c in self._interval if c.pending]
+        if not waits:
+            return MAX_IDLE_SECONDS
+        return min(MAX_IDLE_SECONDS, max(0.0, min(waits) / 1000.0))
+
+    # --- Metrics ---
+    def metrics(self):
+        snapshot = {}
+        for consumer in self._immediate + self._interval:
+            snapshot[f"conflate_{consumer.name}_in"] = consumer.received
+            snapshot[f"conflate_{consumer.name}_out"] = consumer.delivered
+        return snapshot
+
+    def publish_metrics(self, force=False):
+        now = time.monotonic()
+        if self.writer is None or (not force and now - self._last_metrics_publish < METRICS_PUBLISH_SECONDS):
+            return
+        self._last_metrics_publish = now
+        self.writer.hset(self.metrics_key, self.metrics())
+
+    async def run(self, stop_requested):
+        """Timer for quiet periods: deliver pending ticks once their interval has passed."""
+        while not stop_requested():
+            self.flush_due()
+            self.publish_metrics()
+            await asyncio.sleep(self._seconds_until_due(self.clock()))
+        self.flush_due(force=True)
+        self.publish_metrics(force=True)
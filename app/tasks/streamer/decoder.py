@@ -0,0 +1,131 @@
+# app/tasks/streamer/decoder.py
+# PURPOSE: Hot-path decoding of FeedResponse frames into compact tick records.
+#
+# MessageToDict builds a nested dict with camelCase keys (and stringified
+# int64s) for every frame. Here we read the protobuf fields directly and reuse
+# one FeedResponse object across frames, so the per-tick cost is a field read.
+
+from collections import namedtuple
+
+from app.websocket.market_data_v3 import MarketDataFeedV3_pb2 as pb
+
+# ltt = last traded time (epoch ms), cp = previous close, ltq = last traded quantity,
+# vtt = cumulative traded volume of the day (full / option_greeks feeds; None otherwise)
+Tick = namedtuple("Tick", ["instrument", "ltp", "ltt", "cp", "ltq", "vtt"], defaults=(None,))
+
+# Reused for every frame. The streamer decodes on a single event loop, so one
+# instance is safe; call sites on other threads must pass their own message.
+_FEED_RESPONSE = pb.FeedResponse()
+
+GREEK_FIELDS = ("delta", "theta", "gamma", "vega", "rho")
+
+
+def _vtt_of(feed, kind):
+    """Cumulative day volume where the feed mode carries it (not ltpc / index feeds)."""
+    if kind == "firstLevelWithGreeks":
+        return feed.firstLevelWithGreeks.vtt
+    if kind == "fullFeed" and feed.fullFeed.WhichOneof("FullFeedUnion") == "marketFF":
+        return feed.fullFeed.marketFF.vtt
+    return None
+
+
+def _ltpc_of(feed):
+    """Return the LTPC sub-message of a Feed whatever its mode, or None."""
+    kind = feed.WhichOneof("FeedUnion")
+    if kind == "ltpc":
+        return feed.ltpc
+    if kind == "firstLevelWithGreeks":
+        return feed.firstLevelWithGreeks.ltpc
+    if kind == "fullFeed":
+        full_kind = feed.fullFeed.WhichOneof("FullFeedUnion")
+        if full_kind == "marketFF":
+            return feed.fullFeed.marketFF.ltpc
+        if full_kind == "indexFF":
+            return feed.fullFeed.indexFF.ltpc
+    return None
+
+
+# --- Full / option_greeks snapshots (flat numeric fields for Redis hashes) ---
+def _add_greeks(fields, greeks):
+    for name in GREEK_FIELDS:
+        fields[name] = getattr(greeks, name)
+
+
+def _add_quote(fields, level, quote):
+    fields[f"bid_p_{level}"] = quote.bidP
+    fields[f"bid_q_{level}"] = quote.bidQ
+    fields[f"ask_p_{level}"] = quote.askP
+    fields[f"ask_q_{level}"] = quote.askQ
+
+
+def _add_ohlc(fields, market_ohlc):
+    # e.g. interval "1d" -> ohlc_1d_open, "I1" -> ohlc_I1_close
+    for candle in market_ohlc.ohlc:
+        prefix = f"ohlc_{candle.interval}"
+        fields[f"{prefix}_open"] = candle.open
+        fields[f"{prefix}_high"] = candle.high
+        fields[f"{prefix}_low"] = candle.low
+        fields[f"{prefix}_close"] = candle.close
+        fields[f"{prefix}_vol"] = candle.vol
+        fields[f"{prefix}_ts"] = candle.ts
+
+
+def _snapshot_of(feed, kind, ltpc):
+    fields = {"ltp": ltpc.ltp, "ltt": ltpc.ltt, "ltq": ltpc.ltq, "cp": ltpc.cp, "mode": feed.requestMode}
+
+    if kind == "firstLevelWithGreeks":
+        flg = feed.firstLevelWithGreeks
+        _add_quote(fields, 1, flg.firstDepth)
+        _add_greeks(fields, flg.optionGreeks)
+        fields["vtt"] = flg.vtt
+        fields["oi"] = flg.oi
+        fields["iv"] = flg.iv
+        return fields
+
+    full = feed.fullFeed
+    if full.WhichOneof("FullFeedUnion") == "indexFF":
+        _add_ohlc(fields, full.indexFF.marketOHLC)
+        return fields
+
+    mff = full.marketFF
+    for level, quote in enumerate(mff.marketLevel.bidAskQuote, start=1):
+        _add_quote(fields, level, quote)
+    _add_greeks(fields, mff.optionGreeks)
+    _add_ohlc(fields, mff.marketOHLC)
+    fields["atp"] = mff.atp
+    fields["vtt"] = mff.vtt
+    fields["oi"] = mff.oi
+    fields["iv"] = mff.iv
+    fields["tbq"] = mff.tbq
+    fields["tsq"] = mff.tsq
+    return fields
+
+
+def decode_frame(buffer, message=None):
+    """Parse a raw feed frame into (ticks, snapshots).
+
+    ticks     -> Tick records for every feed with ltp > 0
+    snapshots -> {instrument: {field: number}} for full / option_greeks feeds only
+    """
+    feed_response = _FEED_RESPONSE if message is None else message
+    feed_response.ParseFromString(buffer)
+
+    ticks = []
+    snapshots = {}
+    for instrument, feed in feed_response.feeds.items():
+        ltpc = _ltpc_of(feed)
+        if ltpc is None:
+            continue
+        ltp = ltpc.ltp
+        kind = feed.WhichOneof("FeedUnion")
+        if ltp:
+            ticks.append(Tick(instrument, ltp, ltpc.ltt, ltpc.cp, ltpc.ltq, _vtt_of(feed, kind)))
+
+        if kind != "ltpc":
+            snapshots[instrument] = _snapshot_of(feed, kind, ltpc)
+    return ticks, snapshots
+
+
+def decode_ticks(buffer, message=None):
+    """Parse a raw feed frame and return a list of Tick records (ltp > 0 only)."""
+    return decode_frame(buffer, message)[0]
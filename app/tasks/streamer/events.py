@@ -0,0 +1,85 @@
+# app/tasks/streamer/events.py
+# PURPOSE: Turn bar closes into Celery pipeline runs the moment they happen.
+#
+# BarAggregator calls on_bar_close() from the receive loop (no I/O there); a
+# background task hands the events to Celery in a worker thread, so a slow
+# broker never blocks the socket. Only the newest close per instrument/interval
+# is kept while a send is pending: the pipeline always works from the latest bar.
+# Everything pending at a flush goes out as one batch task, so a watchlist of
+# 50 instruments closing the same minute costs one pipeline run, not 50.
+# The closed bars reach Redis through the streamer's write coalescer: the
+# dispatcher syncs that writer first, so a worker never runs before the
+# bars:* XADD it reads has executed.
+
+import asyncio
+import os
+
+from celery import Celery
+
+# --- CONFIG ---
+PIPELINE_ENABLED = os.getenv("STREAMER_BAR_CLOSE_PIPELINE", "1") == "1"
+PIPELINE_TASK = "app.tasks.task_pipeline.on_bars_close"
+# Timeframes whose closes start the pipeline (3m/5m/... closes are still published as bars:*)
+PIPELINE_INTERVALS = [
+    i.strip() for i in os.getenv("STREAMER_PIPELINE_INTERVALS", "1m").split(",") if i.strip()
+]
+BROKER_URL = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
+
+
+class BarCloseDispatcher:
+    """Queues (instrument, interval, bar_ts) events and sends them to the Celery pipeline."""
+
+    def __init__(self, broker_url=BROKER_URL, task_name=PIPELINE_TASK, intervals=PIPELINE_INTERVALS,
+                 place_orders=True, writer=None):
+        self.task_name = task_name
+        self.writer = writer      # RedisWriteCoalescer holding the bars:* XADDs
+        self.intervals = set(intervals)
+        self.place_orders = place_orders
+        self._celery = Celery("streamer", broker=broker_url)
+        self._pending = {}        # (instrument, interval) -> newest bar_ts
+        self._wake = asyncio.Event()
+        self.events_sent = 0
+        self.events_conflated = 0
+
+    def on_bar_close(self, instrument, interval, bar):
+        if interval not in self.intervals:
+            return
+        key = (instrument, interval)
+        if key in self._pending:
+            self.events_conflated += 1
+        self._pending[key] = max(bar["ts"], self._pending.get(key, bar["ts"]))
+        self._wake.set()
+
+    def _send(self, events):
+        batch = [[instrument, interval, bar_ts] for (instrument, interval), bar_ts in events.items()]
+        kwargs = {} if self.place_orders else {"place_orders": False}
+        self._celery.send_task(self.task_name, args=[batch], kwargs=kwargs)
+
+    async def flush(self):
+        if not self._pending:
+            return 0
+        if self.writer is not None and not await self.writer.sync():
+            return 0   # the closed bars are not in Redis yet; retry on the next wake-up
+        events, self._pending = self._pending, {}
+        try:
+            await asyncio.to_thread(self._send, events)
+        except Exception as e:
+            # Keep the newest event per series and retry on the next wake-up
+            for key, bar_ts in events.items():
+                self._pending[key] = max(bar_ts, self._pending.get(key, bar_ts))
+            print(f"❌ Failed to dispatch bar-close pipeline: {e}")
+            return 0
+        self.events_sent += len(events)
+        return len(events)
+
+    async def run(self, stop_requested):
+        while not stop_requested():
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=1.0)
+            except asyncio.TimeoutError:
+                if not self._pending:
+                    continue
+            self._wake.clear()
+            if not await self.flush():
+                await asyncio.sleep(1)
+        await self.flush()
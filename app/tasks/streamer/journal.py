@@ -0,0 +1,169 @@
+# app/tasks/streamer/journal.py
+# PURPOSE: Append-only journal of every raw feed frame, one file per trading day.
+#
+# Layout under STREAMER_JOURNAL_DIR (default data/journal):
+#   YYYY-MM-DD.ticks  -> records of <recv_ts_ms:int64><length:uint32><protobuf frame>
+#   YYYY-MM-DD.idx    -> sparse index of <recv_ts_ms:int64><byte offset:uint64>
+# The receive loop only appends to an in-memory buffer; a background task
+# writes the buffer out in a worker thread, so the socket is never blocked.
+
+import asyncio
+import bisect
+import os
+import struct
+from datetime import datetime, timedelta
+
+import pytz
+
+# --- CONFIG ---
+JOURNAL_ENABLED = os.getenv("STREAMER_JOURNAL_ENABLED", "0") == "1"
+JOURNAL_DIR = os.getenv("STREAMER_JOURNAL_DIR", os.path.join("data", "journal"))
+JOURNAL_FLUSH_SECONDS = 0.25
+JOURNAL_INDEX_EVERY_MS = 1000   # one index entry per second of frames
+
+RECORD_HEADER = struct.Struct("<qI")
+INDEX_ENTRY = struct.Struct("<qQ")
+IST = pytz.timezone("Asia/Kolkata")
+
+
+def journal_paths(day, directory=JOURNAL_DIR):
+    """(data_path, index_path) for a trading day (date or 'YYYY-MM-DD')."""
+    name = day if isinstance(day, str) else day.strftime("%Y-%m-%d")
+    return os.path.join(directory, f"{name}.ticks"), os.path.join(directory, f"{name}.idx")
+
+
+class TickJournal:
+    """Buffered, day-rotated writer of raw frames with a sparse time index."""
+
+    def __init__(self, directory=JOURNAL_DIR, index_every_ms=JOURNAL_INDEX_EVERY_MS):
+        self.directory = directory
+        self.index_every_ms = index_every_ms
+
+        self._day = None
+        self._day_end_ms = -1
+        self._offset = 0              # byte offset of the next record in today's file
+        self._last_index_ms = None
+        self._data = bytearray()
+        self._index = bytearray()
+        self._sealed = []             # [(day, data, index)] of rotated days not yet written
+        self._files = {}              # day -> (data_file, index_file), used by the writer thread only
+
+        self.frames_written = 0
+        self.bytes_written = 0
+
+    # --- Receive loop side (no I/O) ---
+    def _rotate(self, recv_ms):
+        if self._day is not None and (self._data or self._index):
+            self._sealed.append((self._day, self._data, self._index))
+            self._data, self._index = bytearray(), bytearray()
+
+        now = datetime.fromtimestamp(recv_ms / 1000, IST)
+        self._day = now.date()
+        next_midnight = IST.localize(datetime.combine(self._day + timedelta(days=1), datetime.min.time()))
+        self._day_end_ms = int(next_midnight.timestamp() * 1000)
+
+        # Appending to an existing file after a restart: continue from its size
+        data_path, _ = journal_paths(self._day, self.directory)
+        self._offset = os.path.getsize(data_path) if os.path.exists(data_path) else 0
+        self._last_index_ms = None
+
+    def append(self, frame, recv_ms):
+        if recv_ms >= self._day_end_ms or self._day is None:
+            self._rotate(recv_ms)
+
+        if self._last_index_ms is None or recv_ms - self._last_index_ms >= self.index_every_ms:
+            self._index += INDEX_ENTRY.pack(recv_ms, self._offset)
+            self._last_index_ms = recv_ms
+
+        self._data += RECORD_HEADER.pack(recv_ms, len(frame))
+        self._data += frame
+        self._offset += RECORD_HEADER.size + len(frame)
+        self.frames_written += 1
+
+    # --- Writer side ---
+    def _open(self, day):
+        if day not in self._files:
+            os.makedirs(self.directory, exist_ok=True)
+            data_path, index_path = journal_paths(day, self.directory)
+            self._files[day] = (open(data_path, "ab"), open(index_path, "ab"))
+        return self._files[day]
+
+    def _write_chunks(self, chunks):
+        for day, data, index in chunks:
+            data_file, index_file = self._open(day)
+            if data:
+                data_file.write(data)
+                data_file.flush()
+            # Index entries point at bytes already on disk, so write them second
+            if index:
+                index_file.write(index)
+                index_file.flush()
+            self.bytes_written += len(data)
+
+        # Close files of rotated days
+        for day in [d for d in self._files if d != self._day]:
+            for f in self._files.pop(day):
+                f.close()
+
+    async def flush(self):
+        chunks = self._sealed
+        if self._data or self._index:
+            chunks = chunks + [(self._day, self._data, self._index)]
+        self._sealed = []
+        self._data, self._index = bytearray(), bytearray()
+        if chunks:
+            await asyncio.to_thread(self._write_chunks, chunks)
+
+    def close(self):
+        for files in self._files.values():
+            for f in files:
+                f.close()
+        self._files = {}
+
+    async def run(self, stop_requested):
+        try:
+            while not stop_requested():
+                await asyncio.sleep(JOURNAL_FLUSH_SECONDS)
+                try:
+                    await self.flush()
+                except Exception as e:
+                    print(f"❌ Tick journal write failed: {e}")
+        finally:
+            await self.flush()
+            self.close()
+
+
+# --- Reader side ---
+def _seek_offset(index_path, start_ms):
+    """Byte offset of the last indexed record at or before start_ms (0 if none)."""
+    if start_ms is None or not os.path.exists(index_path):
+        return 0
+    with open(index_path, "rb") as f:
+        raw = f.read()
+    usable = len(raw) - len(raw) % INDEX_ENTRY.size
+    entries = [INDEX_ENTRY.unpack_from(raw, pos) for pos in range(0, usable, INDEX_ENTRY.size)]
+    pos = bisect.bisect_right([ts for ts, _ in entries], start_ms) - 1
+    return entries[pos][1] if pos >= 0 else 0
+
+
+def iter_journal(day, start_ms=None, end_ms=None, directory=JOURNAL_DIR):
+    """Yield (recv_ts_ms, frame_bytes) for one day, optionally limited to [start_ms, end_ms)."""
+    data_path, index_path = journal_paths(day, directory)
+    if not os.path.exists(data_path):
+        return
+
+    with open(data_path, "rb") as f:
+        f.seek(_seek_offset(index_path, start_ms))
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            recv_ms, length = RECORD_HEADER.unpack(header)
+            frame = f.read(length)
+            if len(frame) < length:
+                break  # truncated tail (crash mid-write)
+            if end_ms is not None and recv_ms >= end_ms:
+                break
+            if start_ms is not None and recv_ms < start_ms:
+                continue
+            yield recv_ms, frame
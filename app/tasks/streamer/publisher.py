@@ -0,0 +1,33 @@
+# app/tasks/streamer/publisher.py
+# PURPOSE: Publish conflated ticks on Redis pub/sub for the web tier.
+#
+# Only the latest tick per instrument is kept between publishes, and one batch
+# message goes out per delivery round of the conflator (STREAMER_POLICY_PUBSUB,
+# latest every 100ms by default) through the shared writer.
+
+import json
+import time
+
+from app.tasks.utils import TICK_CHANNEL
+
+
+class TickPublisher:
+    """Latest-tick-per-instrument batches on the TICK_CHANNEL pub/sub channel."""
+
+    def __init__(self, writer, channel=TICK_CHANNEL):
+        self.writer = writer
+        self.channel = channel
+        self._latest = {}
+        self.batches_published = 0
+
+    def on_tick(self, tick, now_ms=None):
+        self._latest[tick.instrument] = {"ltp": tick.ltp, "cp": tick.cp}
+
+    def publish_pending(self, now_ms=None):
+        if not self._latest:
+            return False
+        batch, self._latest = self._latest, {}
+        message = json.dumps({"ts": now_ms or int(time.time() * 1000), "ticks": batch})
+        self.writer.publish(self.channel, message)
+        self.batches_published += 1
+        return True
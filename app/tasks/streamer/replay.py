@@ -0,0 +1,194 @@
+# app/tasks/streamer/replay.py
+# PURPOSE: Drive the live pipeline from recorded feed frames instead of the socket.
+#
+# Frames are read from the tick journal (data/journal/YYYY-MM-DD.ticks) and pushed
+# through streamer.process_frame, i.e. the same decode, LTP write and bar path as
+# live data.
+#
+# A replay never touches live state: every write goes to the replay Redis database
+# (STREAMER_REPLAY_REDIS_DB, never 0), ticks are published on "<TICK_CHANNEL>:replay",
+# and the live bar-close dispatcher is detached. With --pipeline, closed bars start
+# the Celery pipeline (merge, SMA, trend) on a broker in the replay database with
+# order placement disabled; run a worker against that database for it:
+#   REDIS_DB=1 REDIS_URL=redis://127.0.0.1:6379/1 CANDLE_ARCHIVE_DIR=data/replay_candles \
+#       celery -A celery_app worker
+# merge_hist_live reads the recorded time from REPLAY_CLOCK_KEY there.
+#
+# Usage:
+#   python -m app.tasks.streamer.replay 2025-11-13 --speed 10
+#   python -m app.tasks.streamer.replay 2025-11-13 --speed max --simulated-clock
+#   python -m app.tasks.streamer.replay 2025-11-13 --from 09:15 --to 10:30
+#   python -m app.tasks.streamer.replay 2025-11-13 --simulated-clock --pipeline
+
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime
+
+import pytz
+import redis.asyncio as aioredis
+
+from app.tasks.streamer.journal import iter_journal, JOURNAL_DIR
+from app.tasks.streamer.events import BarCloseDispatcher
+from app.tasks.streamer import streamer
+from app.tasks.utils import REPLAY_CLOCK_KEY, TICK_CHANNEL
+
+# --- CONFIG ---
+REPLAY_REDIS_DB = int(os.getenv("STREAMER_REPLAY_REDIS_DB", "1"))
+IST = pytz.timezone("Asia/Kolkata")
+YIELD_EVERY_FRAMES = 200   # as-fast-as-possible mode still lets the writer flush
+
+
+class SimulatedClock:
+    """Epoch-ms clock that follows the recorded timeline instead of wall time."""
+
+    def __init__(self):
+        self.current_ms = None
+
+    def advance(self, recv_ms):
+        self.current_ms = recv_ms
+
+    def now_ms(self):
+        return self.current_ms if self.current_ms is not None else int(time.time() * 1000)
+
+
+def _parse_speed(value):
+    if str(value).lower() in ("max", "inf", "0"):
+        return None
+    speed = float(value)
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be > 0 or 'max'")
+    return speed
+
+
+def _session_ms(day, hhmm):
+    if not hhmm:
+        return None
+    naive = datetime.strptime(f"{day} {hhmm}", "%Y-%m-%d %H:%M")
+    return int(IST.localize(naive).timestamp() * 1000)
+
+
+async def replay_frames(frames, speed=None, clock=None):
+    """Feed (recv_ms, frame) pairs into the streamer pipeline. Returns stats."""
+    loop = asyncio.get_running_loop()
+    aggregator = streamer.bar_aggregator
+    resampler = streamer.timeframe_resampler
+    writer = streamer.ltp_writer
+
+    first_recv_ms = None
+    wall_start = loop.time()
+    frames_sent = ticks_sent = 0
+
+    for recv_ms, frame in frames:
+        if first_recv_ms is None:
+            first_recv_ms = recv_ms
+
+        if speed is not None:
+            # Keep the recorded spacing between frames, compressed by `speed`
+            target = (recv_ms - first_recv_ms) / 1000.0 / speed
+            delay = target - (loop.time() - wall_start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        elif frames_sent % YIELD_EVERY_FRAMES == 0:
+            await asyncio.sleep(0)
+
+        if clock is not None:
+            clock.advance(recv_ms)
+            writer.set(REPLAY_CLOCK_KEY, str(recv_ms))
+            ticks = streamer.process_frame(frame, now_ms=recv_ms, journal=False)
+            aggregator.close_due(recv_ms)
+            resampler.close_due(recv_ms)
+        else:
+            ticks = streamer.process_frame(frame, journal=False)
+
+        frames_sent += 1
+        ticks_sent += len(ticks)
+
+    # Close whatever is still forming at the end of the recording
+    if clock is not None and clock.current_ms is not None:
+        aggregator.close_due(clock.current_ms + aggregator.interval_ms * 2)
+        resampler.close_due(clock.current_ms + max(resampler.intervals.values(), default=0) * 2)
+
+    elapsed = loop.time() - wall_start
+    return {"frames": frames_sent, "ticks": ticks_sent, "seconds": elapsed}
+
+
+def isolate(redis_db=REPLAY_REDIS_DB, pipeline=False):
+    """Point the streamer at the replay database; returns the replay dispatcher (None without --pipeline)."""
+    if redis_db == 0:
+        raise ValueError("replay must not write to the live Redis database 0")
+    streamer.ltp_writer.redis = aioredis.Redis(host="127.0.0.1", port=6379, db=redis_db)
+    streamer.tick_publisher.channel = f"{TICK_CHANNEL}:replay"
+
+    listeners = (streamer.bar_aggregator.close_listeners, streamer.timeframe_resampler.close_listeners)
+    live = streamer.bar_close_dispatcher
+    if live is not None:
+        for callbacks in listeners:
+            if live.on_bar_close in callbacks:
+                callbacks.remove(live.on_bar_close)
+    if not pipeline:
+        return None
+
+    dispatcher = BarCloseDispatcher(broker_url=f"redis://127.0.0.1:6379/{redis_db}", place_orders=False,
+                                    writer=streamer.ltp_writer)
+    for callbacks in listeners:
+        callbacks.append(dispatcher.on_bar_close)
+    return dispatcher
+
+
+async def replay(days, speed=None, simulated_clock=False, start=None, end=None, directory=JOURNAL_DIR,
+                 pipeline=False, redis_db=REPLAY_REDIS_DB):
+    dispatcher = isolate(redis_db, pipeline)
+    clock = None
+    if simulated_clock:
+        clock = SimulatedClock()
+        streamer.bar_aggregator.clock = clock.now_ms
+        streamer.tick_conflator.clock = clock.now_ms
+        streamer.timeframe_resampler.clock = clock.now_ms
+
+    stopped = [False]
+    writer_task = asyncio.create_task(streamer.ltp_writer.run(lambda: stopped[0]))
+    conflator_task = asyncio.create_task(streamer.tick_conflator.run(lambda: stopped[0]))
+    dispatcher_task = asyncio.create_task(dispatcher.run(lambda: stopped[0])) if dispatcher is not None else None
+    totals = {"frames": 0, "ticks": 0, "seconds": 0.0}
+    try:
+        for day in days:
+            print(f"▶️ Replaying {day} at {'max' if speed is None else f'{speed:g}x'} speed into Redis db {redis_db}...")
+            frames = iter_journal(day, _session_ms(day, start), _session_ms(day, end), directory)
+            stats = await replay_frames(frames, speed=speed, clock=clock)
+            for key in totals:
+                totals[key] += stats[key]
+            rate = stats["ticks"] / stats["seconds"] if stats["seconds"] else 0
+            print(f"✅ {day}: {stats['frames']} frames, {stats['ticks']} ticks in {stats['seconds']:.2f}s ({rate:,.0f} ticks/sec)")
+    finally:
+        stopped[0] = True
+        await conflator_task
+        if dispatcher_task is not None:
+            await dispatcher_task
+        await writer_task
+        # The conflator's last delivery may land after the writer's final drain
+        await streamer.ltp_writer.flush()
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded feed frames through the streamer pipeline.")
+    parser.add_argument("days", nargs="+", help="Trading day(s) to replay, YYYY-MM-DD")
+    parser.add_argument("--speed", type=_parse_speed, default=1.0, help="1, 10, ... or 'max' (default 1)")
+    parser.add_argument("--simulated-clock", action="store_true",
+                        help="Drive bar closing and receive times from the recorded timeline")
+    parser.add_argument("--from", dest="start", help="Session start HH:MM (IST)")
+    parser.add_argument("--to", dest="end", help="Session end HH:MM (IST)")
+    parser.add_argument("--dir", default=JOURNAL_DIR, help="Journal directory")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Send bar closes to the Celery pipeline in the replay database (orders disabled)")
+    parser.add_argument("--redis-db", type=int, default=REPLAY_REDIS_DB, help="Replay Redis database (not 0)")
+    args = parser.parse_args(argv)
+
+    asyncio.run(replay(args.days, args.speed, args.simulated_clock, args.start, args.end, args.dir,
+                       args.pipeline, args.redis_db))
+
+
+if __name__ == "__main__":
+    main()
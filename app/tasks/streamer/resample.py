@@ -0,0 +1,124 @@
+# app/tasks/streamer/resample.py
+# PURPOSE: Roll every closed 1m bar into higher-timeframe bars (3m/5m/15m/60m).
+#
+# The resampler listens to BarAggregator closes, so no extra API calls or
+# recomputation are needed. Each timeframe gets the same Redis layout as 1m:
+# a forming hash (bar_forming:<key>:<tf>) and a stream of closed bars
+# (bars:<key>:<tf>). Closes are also passed to close listeners (e.g. the
+# bar-close pipeline dispatcher) as events.
+
+import asyncio
+import os
+import time
+from datetime import datetime
+
+import pytz
+
+from app.tasks.candle_store import bucket_start, interval_to_ms
+from app.tasks.streamer.bars import BAR_CLOSE_GRACE_MS, BAR_STREAM_MAXLEN
+from app.tasks.utils import bar_stream_key, forming_bar_key
+
+# --- CONFIG ---
+RESAMPLE_INTERVALS = [
+    i.strip() for i in os.getenv("STREAMER_RESAMPLE_INTERVALS", "3m,5m,15m,60m").split(",") if i.strip()
+]
+SESSION_CLOSE = (15, 30)   # the last bucket of the day ends at the 15:30 IST close
+RESAMPLE_CHECK_SECONDS = 1.0
+# Longer than the 1m grace, so the bucket's last minute is in before a timed close
+RESAMPLE_CLOSE_GRACE_MS = BAR_CLOSE_GRACE_MS + 3000
+
+IST = pytz.timezone("Asia/Kolkata")
+
+
+def bucket_end(start_ms, interval_ms):
+    """End of a bucket, cut at the session close (the 15:15 60m bar ends at 15:30)."""
+    day = datetime.fromtimestamp(start_ms / 1000, IST)
+    close = day.replace(hour=SESSION_CLOSE[0], minute=SESSION_CLOSE[1], second=0, microsecond=0)
+    close_ms = int(close.timestamp() * 1000)
+    end_ms = start_ms + interval_ms
+    return close_ms if start_ms < close_ms < end_ms else end_ms
+
+
+class TimeframeResampler:
+    """One forming bucket per instrument and timeframe, built from closed 1m bars."""
+
+    def __init__(self, writer, intervals=RESAMPLE_INTERVALS, source_interval="1m", clock=None):
+        self.writer = writer
+        self.source_interval = source_interval
+        self.intervals = {interval: interval_to_ms(interval) for interval in intervals}
+        self.clock = clock or (lambda: int(time.time() * 1000))
+        self._buckets = {}       # (instrument, interval) -> {"ts", "end", "minutes": {ts: bar}}
+        self._last_closed = {}   # (instrument, interval) -> ts of the last closed bucket
+        self.close_listeners = []
+        self.late_bars = 0
+        self.bars_closed = 0
+
+    # --- Listener for 1m closes (BarAggregator.close_listeners) ---
+    def on_bar_close(self, instrument, interval, bar):
+        if interval != self.source_interval:
+            return
+        for tf, tf_ms in self.intervals.items():
+            self._fold(instrument, tf, tf_ms, bar)
+
+    def _fold(self, instrument, tf, tf_ms, bar):
+        key = (instrument, tf)
+        start = bucket_start(bar["ts"], tf_ms)
+        if start <= self._last_closed.get(key, -1):
+            self.late_bars += 1
+            return
+
+        bucket = self._buckets.get(key)
+        if bucket is not None and start > bucket["ts"]:
+            self._close(key, bucket)
+            bucket = None
+        if bucket is None:
+            bucket = {"ts": start, "end": bucket_end(start, tf_ms), "minutes": {}}
+            self._buckets[key] = bucket
+
+        # Keyed by minute, so a backfilled minute replaces the live one
+        bucket["minutes"][bar["ts"]] = bar
+        merged = self._merge(bucket)
+        if bar["ts"] + interval_to_ms(self.source_interval) >= bucket["end"]:
+            self._close(key, bucket)
+        else:
+            self.writer.hset(forming_bar_key(instrument, tf), dict(merged, closed=0))
+
+    @staticmethod
+    def _merge(bucket):
+        minutes = [bucket["minutes"][ts] for ts in sorted(bucket["minutes"])]
+        return {
+            "ts": bucket["ts"],
+            "open": minutes[0]["open"],
+            "high": max(m["high"] for m in minutes),
+            "low": min(m["low"] for m in minutes),
+            "close": minutes[-1]["close"],
+            "volume": sum(m.get("volume", 0) for m in minutes),
+            "ticks": sum(m.get("ticks", 0) for m in minutes),
+        }
+
+    def _close(self, key, bucket):
+        instrument, tf = key
+        bar = self._merge(bucket)
+        self.writer.xadd(bar_stream_key(instrument, tf), bar, maxlen=BAR_STREAM_MAXLEN)
+        self.writer.hset(forming_bar_key(instrument, tf), dict(bar, closed=1))
+        self._buckets.pop(key, None)
+        self._last_closed[key] = bucket["ts"]
+        self.bars_closed += 1
+        for listener in self.close_listeners:
+            try:
+                listener(instrument, tf, bar)
+            except Exception as e:
+                print(f"⚠️ {tf} close listener failed for {instrument}: {e}")
+
+    def close_due(self, now_ms=None):
+        """Close buckets whose end has passed (instrument stopped ticking, session over)."""
+        now_ms = self.clock() if now_ms is None else now_ms
+        due = [(key, b) for key, b in self._buckets.items() if now_ms >= b["end"] + RESAMPLE_CLOSE_GRACE_MS]
+        for key, bucket in due:
+            self._close(key, bucket)
+        return len(due)
+
+    async def run(self, stop_requested):
+        while not stop_requested():
+            self.close_due()
+            await asyncio.sleep(RESAMPLE_CHECK_SECONDS)
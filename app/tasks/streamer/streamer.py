@@ -1,32 +1,104 @@
 # streamer.py (FIXED VERSION)
 import asyncio
 import json
+import os
+import random
 import ssl
+import time
 import websockets
 import requests
-from google.protobuf.json_format import MessageToDict
 from app.websocket.market_data_v3 import MarketDataFeedV3_pb2 as pb
+from app.tasks.streamer.decoder import decode_frame
+from app.tasks.streamer.writer import RedisWriteCoalescer
+from app.tasks.streamer.bars import BarAggregator
+from app.tasks.streamer.backfill import backfill_gap
+from app.tasks.streamer.writer import STREAMER_METRICS_KEY
+from app.tasks.streamer.journal import TickJournal, JOURNAL_ENABLED
+from app.tasks.streamer.publisher import TickPublisher
+from app.tasks.streamer.events import BarCloseDispatcher, PIPELINE_ENABLED
+from app.tasks.streamer.resample import TimeframeResampler
+from app.tasks.streamer.conflation import (
+    TickConflator,
+    EVERY_TICK,
+    LTP_POLICY,
+    PUBSUB_POLICY,
+    BARS_POLICY,
+    JOURNAL_POLICY,
+)
+from app.tasks.utils import snapshot_key
 from app.tasks._shutdown_manager import initialize_signal_handler, is_shutdown_requested
 from app import cache 
+from app.tasks.streamer.subscriptions import (
+    SubscriptionManager,
+    STREAMER_WATCHLIST,
+    STREAMER_WATCHLIST_MODE,
+    WATCHLIST_OWNER,
+    load_subscription_requests,
+    watch_subscriptions,
+)
 import redis
+import redis.asyncio as aioredis
 
 
 redis_client = redis.Redis(host="127.0.0.1", port=6379, db=0)
+# Tick writes go through the async client so Redis round-trips never block recv()
+async_redis_client = aioredis.Redis(host="127.0.0.1", port=6379, db=0)
+ltp_writer = RedisWriteCoalescer(async_redis_client)
+bar_aggregator = BarAggregator(ltp_writer)
+# 3m/5m/15m/60m bars rolled up from every closed 1m bar
+timeframe_resampler = TimeframeResampler(ltp_writer)
+bar_aggregator.close_listeners.append(timeframe_resampler.on_bar_close)
+# Conflated ticks on Redis pub/sub, relayed to browsers by app/market_bridge.py
+tick_publisher = TickPublisher(ltp_writer)
+# Every closed bar starts the merge -> SMA -> trend -> orders Celery pipeline
+bar_close_dispatcher = BarCloseDispatcher(writer=ltp_writer) if PIPELINE_ENABLED else None
+if bar_close_dispatcher is not None:
+    bar_aggregator.close_listeners.append(bar_close_dispatcher.on_bar_close)
+    timeframe_resampler.close_listeners.append(bar_close_dispatcher.on_bar_close)
+# Optional raw-frame journal (STREAMER_JOURNAL_ENABLED=1)
+tick_journal = TickJournal() if JOURNAL_ENABLED else None
+if JOURNAL_POLICY.mode != EVERY_TICK:
+    raise ValueError("STREAMER_POLICY_JOURNAL must be 'every': the journal records raw frames for replay")
+
+LTP_TTL_SECONDS = 50
+
+
+def write_ltp(tick, now_ms=None):
+    ltp_writer.set(f"LTP:{tick.instrument}", json.dumps({"ltp": str(tick.ltp)}), ex=LTP_TTL_SECONDS)
+
+
+# Each consumer gets ticks at its own policy (STREAMER_POLICY_LTP / _PUBSUB / _BARS)
+tick_conflator = TickConflator(ltp_writer)
+tick_conflator.register("ltp", write_ltp, LTP_POLICY)
+tick_conflator.register("pubsub", tick_publisher.on_tick, PUBSUB_POLICY, on_batch=tick_publisher.publish_pending)
+tick_conflator.register("bars", bar_aggregator.on_tick, BARS_POLICY)
+
+# --- Reconnect policy (full-jitter exponential backoff) ---
+RECONNECT_BASE_SECONDS = float(os.getenv("STREAMER_RECONNECT_BASE_SECONDS", "1"))
+RECONNECT_MAX_SECONDS = float(os.getenv("STREAMER_RECONNECT_MAX_SECONDS", "60"))
 
 initialize_signal_handler()
 
+# Shared across reconnects so the socket is re-subscribed to the same set.
+subscription_manager = SubscriptionManager()
+subscription_manager.set_owner_keys(WATCHLIST_OWNER, STREAMER_WATCHLIST, mode=STREAMER_WATCHLIST_MODE)
+
+
+def read_access_token():
+    with open("access_token.txt", "r") as f:
+        return f.read().strip()
+
 
 def get_market_data_feed_authorize_v3():
     """Get authorization for market data feed."""
-    with open("access_token.txt", "r") as f:
-        access_token = f.read().strip()
+    access_token = read_access_token()
 
     headers = {
         'Accept': 'application/json',
         'Authorization': f'Bearer {access_token}'
     }
     url = 'https://api.upstox.com/v3/feed/market-data-feed/authorize'
-    api_response = requests.get(url=url, headers=headers)
+    api_response = requests.get(url=url, headers=headers, timeout=10)
     api_response.raise_for_status()
     return api_response.json()
 
@@ -38,59 +110,163 @@ def decode_protobuf(buffer):
     return feed_response
 
 
-async def fetch_market_data():
-    """Fetch market data using WebSocket and store LTPs in cache."""
+def process_frame(message, now_ms=None, journal=True):
+    """Decode one raw feed frame and hand its ticks to the conflator (LTP, pub/sub, bars).
 
-    ssl_context = ssl.create_default_context()
-    ssl_context.check_hostname = False
-    ssl_context.verify_mode = ssl.CERT_NONE
+    `now_ms` overrides the receive time (replay); `journal=False` skips the tick journal.
+    """
+    now_ms = now_ms or int(time.time() * 1000)
+    if journal and tick_journal is not None:
+        tick_journal.append(message, now_ms)
+
+    ticks, snapshots = decode_frame(message)
+    tick_conflator.on_ticks(ticks, now_ms)
 
-    response = get_market_data_feed_authorize_v3()
+    # Depth / OHLC / OI / IV / greeks of full and option_greeks feeds -> numeric hash
+    for instrument, fields in snapshots.items():
+        ltp_writer.hset(snapshot_key(instrument), fields)
+    return ticks
 
-    async with websockets.connect(response ["data"]["authorized_redirect_uri"], ssl=ssl_context) as websocket:
-        print("✅ Connection established")
 
-        # Subscribe to instrument
-        data = {
-            "guid": "someguid",
-            "method": "sub",
-            "data": {
-                "mode": "ltpc",
-                "instrumentKeys": ["NSE_INDEX|Nifty 50"]
-            }
-        }
-        await websocket.send(json.dumps(data).encode("utf-8"))
+async def stream_connection(websocket):
+    """Subscribe and run the receive loop until the socket closes or shutdown is requested."""
+    # Subscribe to the watchlist plus every instrument requested by other tasks
+    subscription_manager.reset_socket()
+    requests_by_owner = await asyncio.to_thread(load_subscription_requests, redis_client)
+    for owner, keys in requests_by_owner.items():
+        subscription_manager.set_owner_keys(owner, keys)
+    await subscription_manager.sync(websocket)
 
+    # Incremental sub/unsub on this socket as option strikes and trades change
+    watcher = asyncio.create_task(
+        watch_subscriptions(subscription_manager, websocket, redis_client, is_shutdown_requested)
+    )
+    try:
         while not is_shutdown_requested():
             try:
                 message = await websocket.recv()
-                decoded_data = decode_protobuf(message)
-                data_dict = MessageToDict(decoded_data)
 
-                # ✅ Extract LTP if available
-                feeds = data_dict.get("feeds", {})
-                for instrument, info in feeds.items():
-                    ltp = info.get("ltpc", {}).get("ltp")
-                    if ltp:
-
-                        payload_dict = {"ltp": str(ltp)}
-                        payload_json_str = json.dumps(payload_dict)
-
-
-                        cache_key = f"LTP:{instrument}"
-                        # --- FIX: Use the defined variable payload_json_str ---
-                        redis_client.setex(cache_key, 50, payload_json_str) 
-                        
-                        print(f"📈 Updated {cache_key} = {ltp}")
+                # ✅ Decode and queue writes; ltp_writer flushes them in one pipeline
+                process_frame(message)
 
             except websockets.ConnectionClosed:
-                print("⚠️ Connection closed, retrying...")
-                await asyncio.sleep(2)
-                return await fetch_market_data()
+                raise
             except Exception as e:
                 print(f"❌ Error in WebSocket loop: {e}")
                 await asyncio.sleep(2)
+    finally:
+        watcher.cancel()
+
+
+def publish_connection_metrics(**fields):
+    ltp_writer.hset(STREAMER_METRICS_KEY, fields)
+
+
+async def fetch_market_data():
+    """Supervised feed loop: reconnects with jittered exponential backoff and backfills gaps."""
+
+    ssl_context = ssl.create_default_context()
+    ssl_context.check_hostname = False
+    ssl_context.verify_mode = ssl.CERT_NONE
+
+    attempt = 0
+    reconnects = 0
+    downtime_ms_total = 0
+    disconnected_at_ms = None
+    gap_start_ms = None
+    backfill_tasks = set()
+
+    while not is_shutdown_requested():
+        try:
+            # Authorization is a blocking HTTP call; keep it off the event loop
+            response = await asyncio.to_thread(get_market_data_feed_authorize_v3)
+
+            async with websockets.connect(response["data"]["authorized_redirect_uri"], ssl=ssl_context) as websocket:
+                print("✅ Connection established")
+                attempt = 0
+
+                if disconnected_at_ms is not None:
+                    now_ms = int(time.time() * 1000)
+                    downtime_ms = now_ms - disconnected_at_ms
+                    downtime_ms_total += downtime_ms
+                    reconnects += 1
+                    publish_connection_metrics(
+                        connected=1,
+                        reconnects=reconnects,
+                        downtime_ms_last=downtime_ms,
+                        downtime_ms_total=downtime_ms_total,
+                    )
+                    print(f"🔁 Reconnected after {downtime_ms / 1000:.1f}s (reconnect #{reconnects})")
+
+                    # Minutes [gap start, current minute) were never seen on the socket
+                    gap_end_ms = now_ms - now_ms % 60_000
+                    task = asyncio.create_task(backfill_gap(
+                        bar_aggregator,
+                        await asyncio.to_thread(read_access_token),
+                        subscription_manager.active_keys(),
+                        gap_start_ms,
+                        gap_end_ms,
+                    ))
+                    backfill_tasks.add(task)
+                    task.add_done_callback(backfill_tasks.discard)
+                    disconnected_at_ms = None
+                else:
+                    publish_connection_metrics(connected=1)
+
+                await stream_connection(websocket)
+
+        except websockets.ConnectionClosed:
+            print("⚠️ Connection closed, retrying...")
+        except Exception as e:
+            print(f"❌ Feed connection failed: {e}")
+
+        if is_shutdown_requested():
+            break
+
+        if disconnected_at_ms is None:
+            disconnected_at_ms = int(time.time() * 1000)
+            # Forming bars stopped mid-minute; the backfill replaces them with exact bars
+            earliest_forming = bar_aggregator.drop_forming()
+            gap_start_ms = earliest_forming if earliest_forming is not None else disconnected_at_ms - disconnected_at_ms % 60_000
+            publish_connection_metrics(connected=0)
+
+        delay = random.uniform(0, min(RECONNECT_MAX_SECONDS, RECONNECT_BASE_SECONDS * (2 ** min(attempt, 16))))
+        attempt += 1
+        print(f"⏳ Reconnecting in {delay:.1f}s (attempt {attempt})")
+        await asyncio.sleep(delay)
+
+
+async def main():
+    """Run the feed loop with the Redis write coalescer alongside it."""
+    writer_task = asyncio.create_task(ltp_writer.run(is_shutdown_requested))
+    bars_task = asyncio.create_task(bar_aggregator.run(is_shutdown_requested))
+    resample_task = asyncio.create_task(timeframe_resampler.run(is_shutdown_requested))
+    conflator_task = asyncio.create_task(tick_conflator.run(is_shutdown_requested))
+    journal_task = (
+        asyncio.create_task(tick_journal.run(is_shutdown_requested)) if tick_journal is not None else None
+    )
+    dispatcher_task = (
+        asyncio.create_task(bar_close_dispatcher.run(is_shutdown_requested))
+        if bar_close_dispatcher is not None else None
+    )
+    try:
+        await fetch_market_data()
+    finally:
+        bars_task.cancel()
+        resample_task.cancel()
+        conflator_task.cancel()
+        tick_conflator.flush_due(force=True)
+        tick_conflator.publish_metrics(force=True)
+        if journal_task is not None:
+            journal_task.cancel()
+            await asyncio.gather(journal_task, return_exceptions=True)
+        if dispatcher_task is not None:
+            dispatcher_task.cancel()
+            await asyncio.gather(dispatcher_task, return_exceptions=True)
+        writer_task.cancel()
+        await ltp_writer.flush()
+        await ltp_writer.publish_metrics(force=True)
 
 
 if __name__ == "__main__":
-    asyncio.run(fetch_market_data())
+    asyncio.run(main())
@@ -0,0 +1,187 @@
+# app/tasks/streamer/subscriptions.py
+# PURPOSE: Reference-counted instrument subscriptions for the live feed socket.
+#
+# Several owners can ask for the same instrument (the static watchlist, the
+# ATM option chain, every user's active trade). The streamer keeps one socket
+# subscription per instrument and only sends `unsub` once the last owner drops it.
+# Each owner also picks a feed mode per instrument (ltpc / option_greeks / full);
+# the richest mode requested by any owner wins and is applied with `change_mode`.
+
+import asyncio
+import json
+import os
+import uuid
+from collections import Counter
+
+from app.tasks.utils import SUBSCRIPTION_OWNERS_KEY, SUBSCRIPTION_KEY_PREFIX
+
+# --- CONFIG ---
+# Comma separated instrument keys that are always streamed.
+STREAMER_WATCHLIST = [
+    k.strip() for k in os.getenv("STREAMER_WATCHLIST", "NSE_INDEX|Nifty 50").split(",") if k.strip()
+]
+STREAMER_WATCHLIST_MODE = os.getenv("STREAMER_WATCHLIST_MODE", "ltpc")
+SUBSCRIPTION_POLL_SECONDS = float(os.getenv("STREAMER_SUBSCRIPTION_POLL_SECONDS", "5"))
+WATCHLIST_OWNER = "watchlist"
+DEFAULT_MODE = "ltpc"
+# Richer modes include everything the poorer ones carry
+MODE_PRIORITY = {"ltpc": 0, "option_greeks": 1, "full": 2, "full_d30": 3}
+
+
+class SubscriptionManager:
+    """Tracks which owners need which instruments and diffs that against the socket."""
+
+    def __init__(self, mode=DEFAULT_MODE):
+        self.mode = mode
+        self._owner_keys = {}         # owner -> {instrument_key: mode}
+        self._ref_counts = Counter()  # instrument_key -> number of owners
+        self._subscribed = {}         # instrument_key -> mode currently on the socket
+        self._lock = asyncio.Lock()
+
+    # --- Owner bookkeeping ---
+    def set_owner_keys(self, owner, instrument_keys, mode=None):
+        """Replace the keys of `owner`, adjusting reference counts for the diff.
+
+        `instrument_keys` is either an iterable of keys (all in `mode`, default
+        the manager's mode) or a {instrument_key: mode} dict.
+        """
+        if isinstance(instrument_keys, dict):
+            new_keys = {k: (m or self.mode) for k, m in instrument_keys.items() if k}
+        else:
+            new_keys = {k: (mode or self.mode) for k in instrument_keys if k}
+        old_keys = self._owner_keys.get(owner, {})
+
+        for key in new_keys.keys() - old_keys.keys():
+            self._ref_counts[key] += 1
+        for key in old_keys.keys() - new_keys.keys():
+            self._ref_counts[key] -= 1
+            if self._ref_counts[key] <= 0:
+                del self._ref_counts[key]
+
+        if new_keys:
+            self._owner_keys[owner] = new_keys
+        else:
+            self._owner_keys.pop(owner, None)
+
+    def release_owner(self, owner):
+        self.set_owner_keys(owner, ())
+
+    def owners(self):
+        return set(self._owner_keys)
+
+    def ref_count(self, instrument_key):
+        return self._ref_counts.get(instrument_key, 0)
+
+    def active_keys(self):
+        """Instrument keys that at least one owner still needs."""
+        return set(self._ref_counts)
+
+    def desired_modes(self):
+        """{instrument_key: richest mode requested by any owner}."""
+        modes = {}
+        for keys in self._owner_keys.values():
+            for key, mode in keys.items():
+                current = modes.get(key)
+                if current is None or MODE_PRIORITY.get(mode, 0) > MODE_PRIORITY.get(current, 0):
+                    modes[key] = mode
+        return modes
+
+    def subscribed_keys(self):
+        return set(self._subscribed)
+
+    def subscribed_modes(self):
+        return dict(self._subscribed)
+
+    def reset_socket(self):
+        """Forget what was sent on the socket (call after a reconnect)."""
+        self._subscribed = {}
+
+    # --- Socket sync ---
+    @staticmethod
+    def _build_message(method, instrument_keys, mode=None):
+        data = {"instrumentKeys": sorted(instrument_keys)}
+        if mode:
+            data["mode"] = mode
+        return json.dumps({"guid": uuid.uuid4().hex, "method": method, "data": data}).encode("utf-8")
+
+    async def sync(self, websocket):
+        """Send only the incremental `sub` / `change_mode` / `unsub` needed to match the owners."""
+        async with self._lock:
+            desired = self.desired_modes()
+            to_unsub = self._subscribed.keys() - desired.keys()
+
+            to_sub, to_change = {}, {}
+            for key, mode in desired.items():
+                current = self._subscribed.get(key)
+                if current is None:
+                    to_sub.setdefault(mode, set()).add(key)
+                elif current != mode:
+                    to_change.setdefault(mode, set()).add(key)
+
+            for mode, keys in to_sub.items():
+                await websocket.send(self._build_message("sub", keys, mode))
+                self._subscribed.update(dict.fromkeys(keys, mode))
+                print(f"➕ Subscribed {len(keys)} instrument(s) [{mode}]: {sorted(keys)}")
+            for mode, keys in to_change.items():
+                await websocket.send(self._build_message("change_mode", keys, mode))
+                self._subscribed.update(dict.fromkeys(keys, mode))
+                print(f"🔀 Changed {len(keys)} instrument(s) to [{mode}]: {sorted(keys)}")
+            if to_unsub:
+                await websocket.send(self._build_message("unsub", to_unsub))
+                for key in to_unsub:
+                    del self._subscribed[key]
+                print(f"➖ Unsubscribed {len(to_unsub)} instrument(s): {sorted(to_unsub)}")
+
+
+def load_subscription_requests(redis_client):
+    """Read every registered owner and its requested {instrument_key: mode} from Redis.
+
+    Owners whose key has expired are removed from the owner set and returned
+    with an empty key list so the manager releases them.
+    """
+    owners = [o.decode("utf-8") if isinstance(o, bytes) else o
+              for o in redis_client.smembers(SUBSCRIPTION_OWNERS_KEY)]
+    if not owners:
+        return {}
+
+    raw_values = redis_client.mget([f"{SUBSCRIPTION_KEY_PREFIX}{o}" for o in owners])
+    requests = {}
+    expired = []
+    for owner, raw in zip(owners, raw_values):
+        if raw is None:
+            expired.append(owner)
+            requests[owner] = []
+            continue
+        try:
+            payload = json.loads(raw)
+            if isinstance(payload, dict):
+                mode = payload.get("mode") or DEFAULT_MODE
+                requests[owner] = {key: mode for key in payload.get("keys", [])}
+            else:
+                requests[owner] = {key: DEFAULT_MODE for key in payload}
+        except Exception:
+            print(f"⚠️ Invalid subscription payload for {owner}: {raw}")
+            requests[owner] = []
+
+    if expired:
+        redis_client.srem(SUBSCRIPTION_OWNERS_KEY, *expired)
+    return requests
+
+
+async def watch_subscriptions(manager, websocket, redis_client, stop_requested):
+    """Poll the shared subscription requests and push diffs on the live socket."""
+    while not stop_requested():
+        try:
+            requests = await asyncio.to_thread(load_subscription_requests, redis_client)
+            seen = set(requests)
+            for owner, keys in requests.items():
+                manager.set_owner_keys(owner, keys)
+            # Owners that disappeared completely (e.g. the owner set was flushed)
+            for owner in manager.owners() - seen - {WATCHLIST_OWNER}:
+                manager.release_owner(owner)
+            await manager.sync(websocket)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Subscription watcher error: {e}")
+        await asyncio.sleep(SUBSCRIPTION_POLL_SECONDS)
@@ -0,0 +1,190 @@
+# app/tasks/streamer/writer.py
+# PURPOSE: Non-blocking, coalesced Redis writes for the asyncio streamer.
+#
+# The receive loop only records "latest value per key" in memory. A separate
+# task flushes everything pending in ONE pipeline per loop turn (or every
+# STREAMER_FLUSH_INTERVAL_MS), so websocket reads never wait on Redis.
+# SET/HSET are coalesced per key; XADD and PUBLISH are kept in order.
+
+import asyncio
+import os
+import time
+from collections import Counter
+
+# --- CONFIG ---
+# 0 = flush on the next event-loop turn; >0 = batch writes for N milliseconds.
+FLUSH_INTERVAL_MS = float(os.getenv("STREAMER_FLUSH_INTERVAL_MS", "0"))
+METRICS_PUBLISH_SECONDS = 1.0
+STREAMER_METRICS_KEY = "streamer:metrics"
+
+
+class RedisWriteCoalescer:
+    """Buffers SET/HSET per key plus ordered XADD/PUBLISH and flushes them in a single pipeline."""
+
+    def __init__(self, redis_client, flush_interval_ms=FLUSH_INTERVAL_MS, metrics_key=STREAMER_METRICS_KEY):
+        self.redis = redis_client
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.metrics_key = metrics_key
+
+        self._pending = {}          # key -> (value, ttl_seconds)
+        self._hashes = {}           # key -> {field: value}
+        self._commands = []         # ordered, never coalesced (XADD, PUBLISH)
+        self._oldest_pending = None # perf_counter of the oldest unflushed write
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()   # one pipeline in flight at a time
+        self._last_metrics_publish = 0.0
+
+        # Exposed counters (also mirrored to the `streamer:metrics` Redis hash)
+        self.counters = Counter()
+        self.gauges = {
+            "write_backlog": 0,
+            "write_flush_ms_last": 0.0,
+            "write_latency_ms_last": 0.0,
+            "write_latency_ms_max": 0.0,
+        }
+
+    # --- Producer side (called from the receive loop, never awaits) ---
+    def set(self, key, value, ex=None):
+        if key in self._pending:
+            self.counters["writes_coalesced"] += 1
+        else:
+            self._mark_pending()
+        self._pending[key] = (value, ex)
+        self.counters["writes_queued"] += 1
+        self._wake.set()
+
+    def hset(self, key, mapping):
+        if key in self._hashes:
+            self.counters["writes_coalesced"] += 1
+            self._hashes[key].update(mapping)
+        else:
+            self._mark_pending()
+            self._hashes[key] = dict(mapping)
+        self.counters["writes_queued"] += 1
+        self._wake.set()
+
+    def xadd(self, stream, fields, maxlen=None):
+        self._mark_pending()
+        self._commands.append(("xadd", stream, dict(fields), maxlen))
+        self.counters["writes_queued"] += 1
+        self._wake.set()
+
+    def publish(self, channel, message):
+        self._mark_pending()
+        self._commands.append(("publish", channel, message, None))
+        self.counters["writes_queued"] += 1
+        self._wake.set()
+
+    def _mark_pending(self):
+        if self._oldest_pending is None:
+            self._oldest_pending = time.perf_counter()
+
+    @property
+    def backlog(self):
+        return len(self._pending) + len(self._hashes) + len(self._commands)
+
+    # --- Consumer side ---
+    def _queue_commands(self, pipe, batch, hashes, commands):
+        for key, (value, ex) in batch.items():
+            if ex:
+                pipe.set(key, value, ex=ex)
+            else:
+                pipe.set(key, value)
+        for key, mapping in hashes.items():
+            pipe.hset(key, mapping=mapping)
+        for name, target, payload, maxlen in commands:
+            if name == "xadd":
+                pipe.xadd(target, payload, maxlen=maxlen, approximate=True)
+            elif name == "publish":
+                pipe.publish(target, payload)
+
+    async def flush(self):
+        """Write everything pending in one pipeline. Returns the number of commands written.
+
+        Waits for a flush already in flight first, so on return every write queued
+        before the call has been sent (or put back for a retry when Redis failed).
+        """
+        async with self._flush_lock:
+            return await self._flush()
+
+    async def sync(self):
+        """Flush and report whether every write queued before the call reached Redis."""
+        errors = self.counters["write_errors"]
+        await self.flush()
+        return self.counters["write_errors"] == errors
+
+    async def _flush(self):
+        if not self.backlog:
+            return 0
+
+        batch, self._pending = self._pending, {}
+        hashes, self._hashes = self._hashes, {}
+        commands, self._commands = self._commands, []
+        oldest, self._oldest_pending = self._oldest_pending, None
+        size = len(batch) + len(hashes) + len(commands)
+        self.gauges["write_backlog"] = size
+
+        pipe = self.redis.pipeline(transaction=False)
+        self._queue_commands(pipe, batch, hashes, commands)
+
+        started = time.perf_counter()
+        try:
+            await pipe.execute()
+        except Exception as e:
+            # Keep the values that were not superseded meanwhile and retry next turn
+            for key, item in batch.items():
+                self._pending.setdefault(key, item)
+            for key, mapping in hashes.items():
+                mapping.update(self._hashes.get(key, {}))
+                self._hashes[key] = mapping
+            self._commands[:0] = commands
+            if self._oldest_pending is None or (oldest and oldest < self._oldest_pending):
+                self._oldest_pending = oldest
+            self.counters["write_errors"] += 1
+            print(f"❌ Redis pipeline flush failed ({size} commands): {e}")
+            return 0
+
+        finished = time.perf_counter()
+        latency_ms = (finished - (oldest or started)) * 1000.0
+        self.counters["write_flushes"] += 1
+        self.counters["writes_flushed"] += size
+        self.gauges["write_flush_ms_last"] = round((finished - started) * 1000.0, 3)
+        self.gauges["write_latency_ms_last"] = round(latency_ms, 3)
+        self.gauges["write_latency_ms_max"] = max(self.gauges["write_latency_ms_max"], round(latency_ms, 3))
+        return size
+
+    def metrics(self):
+        snapshot = dict(self.counters)
+        snapshot.update(self.gauges)
+        snapshot["write_backlog_now"] = self.backlog
+        return snapshot
+
+    async def publish_metrics(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_metrics_publish < METRICS_PUBLISH_SECONDS:
+            return
+        self._last_metrics_publish = now
+        try:
+            await self.redis.hset(self.metrics_key, mapping=self.metrics())
+        except Exception as e:
+            print(f"⚠️ Failed to publish streamer metrics: {e}")
+
+    async def run(self, stop_requested):
+        """Flush loop. Runs until `stop_requested()` is true, then drains."""
+        while not stop_requested():
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=METRICS_PUBLISH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+            # Let the receive loop finish its turn (or batch for N ms) before flushing
+            await asyncio.sleep(self.flush_interval)
+
+            written = await self.flush()
+            if not written and self.backlog:
+                await asyncio.sleep(1)  # Redis unavailable; back off before retrying
+            await self.publish_metrics()
+
+        await self.flush()
+        await self.publish_metrics(force=True)
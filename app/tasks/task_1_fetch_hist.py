@@ -3,20 +3,27 @@
 # ================================================================
 
 import os
-import json
-import pandas as pd
-from datetime import datetime
+from datetime import datetime, time, timedelta
 import pytz
 import upstox_client
-from upstox_client.rest import ApiException # <-- Import the specific error class
 from app.extensions import celery_app, cache
 from .utils import get_previous_working_day 
+from .candle_codec import encode_candles
+from .candle_archive import read_archive
+from .candle_store import candles_to_frame
+from .history_backfill import backfill_history, backfill_many, missing_days
 
 # --- CONFIG ---
 HIST_CACHE_TIMEOUT = 86400        # 24 hours
 NUM_HISTORICAL_DAYS = 4           # Fetch last 3 trading days
+HIST_ARCHIVE_DAYS = int(os.getenv("HIST_ARCHIVE_DAYS", "90"))   # depth of backfill_hist_archive
+HIST_BACKFILL_WATCHLIST = [
+    k.strip() for k in os.getenv("HIST_BACKFILL_WATCHLIST", "NSE_INDEX|Nifty 50").split(",") if k.strip()
+]
 ACCESS_TOKEN_FILE = os.getenv("STREAMER_ACCESS_TOKEN_FILE", "/mnt/c/Users/Jayendra/Desktop/ALGO4ALL/access_token.txt")
 
+IST = pytz.timezone("Asia/Kolkata")
+
 # --- HELPER: Read access token from file (Kept simple, as the issue is not here) ---
 def get_access_token_from_file():
     try:
@@ -41,33 +48,34 @@ def get_historical_api_instance(access_token):
     return upstox_client.HistoryV3Api(upstox_client.ApiClient(configuration))
 
 
+# --- HELPER: Cache the local archive range as historical_data ---
+def cache_from_archive(instrument_key, start_date, end_date):
+    """Read [start_date, end_date] from the local day files and cache it. Returns the row count."""
+    start_ms = int(IST.localize(datetime.combine(start_date, time.min)).timestamp() * 1000)
+    end_ms = int(IST.localize(datetime.combine(end_date + timedelta(days=1), time.min)).timestamp() * 1000)
+    df = candles_to_frame(read_archive(instrument_key, "1m", start_ms=start_ms, end_ms=end_ms))
+    if df.empty:
+        return 0
+    # Save the full DataFrame in the binary columnar candle format (app/tasks/candle_codec.py)
+    cache.set(f"historical_data:{instrument_key}", encode_candles(df), timeout=HIST_CACHE_TIMEOUT)
+    return len(df)
+
+
 # --- MAIN TASK ---
 @celery_app.task(bind=True)
 def fetch_hist_data(self, instrument_key="NSE_INDEX|Nifty 50", interval="1m"):
     """
-    Fetches last 2 trading days of historical candle data for given instrument.
+    Cache the last NUM_HISTORICAL_DAYS trading days of 1m candles for the given instrument.
+    Candles come from the local archive; only days missing there are fetched from HistoryV3Api.
     """
-    access_token = get_access_token_from_file()
-    if not access_token:
-        print("[TASK 1] ❌ Missing access token. Aborting historical fetch.")
-        return None
-
-    api_instance = get_historical_api_instance(access_token)
-    if not api_instance:
-        print("[TASK 1] ❌ Failed to initialize Upstox API instance.")
-        return None
-
     print(f"\n--- [TASK 1] Starting Historical Fetch for {instrument_key} ---")
 
     # --- Date Range Setup ---
-    ist = pytz.timezone("Asia/Kolkata")
-    today_date = datetime.now(ist).date()
+    today_date = datetime.now(IST).date()
     last_working_day = get_previous_working_day(today_date)
     day_iterator = last_working_day
     for _ in range(NUM_HISTORICAL_DAYS - 1):
         day_iterator = get_previous_working_day(day_iterator)
-    start_date_str = day_iterator.strftime("%Y-%m-%d")
-    end_date_str = last_working_day.strftime("%Y-%m-%d")
 
     # --- Cache Key ---
     hist_cache_key = f"historical_data:{instrument_key}" 
@@ -77,44 +85,64 @@ def fetch_hist_data(self, instrument_key="NSE_INDEX|Nifty 50", interval="1m"):
         print(f"[TASK 1] ✅ Cached data exists for {instrument_key}. Skipping API fetch.")
         return None
 
-    # --- API Fetch (VERBOSE DEBUGGING) ---
-    candles = []
-    try:
-        response = api_instance.get_historical_candle_data1(
-            instrument_key,
-            "minutes",
-            "1",
-            end_date_str,
-            start_date_str
-        )
-        candles = (
-            response.data.candles
-            if (response and response.data and response.data.candles)
-            else []
-        )
-        
-        if not candles:
-             print(f"[TASK 1] ⚠️ Upstox API returned 0 candles for {start_date_str} to {end_date_str}. Check market status.")
-             
-    except ApiException as e:
-        # CRITICAL DEBUG: Print the API-specific error body (401, 403, etc.)
-        print(f"[TASK 1] ❌ CRITICAL API Error (Status {e.status}): {e.body}")
-        
-    except Exception as e:
-        # Generic error handling
-        print(f"[TASK 1] ❌ Unexpected Error during API call: {e}")
-
-    # --- Process and Cache ---
-    if candles:
-        df = pd.DataFrame(
-            candles,
-            columns=["timestamp", "open", "high", "low", "close", "volume", "oi"],
-        )
-        # Save the full DataFrame as a JSON string to cache
-        cache.set(hist_cache_key, df.to_json(orient="records"), timeout=HIST_CACHE_TIMEOUT)
-        print(f"[TASK 1] ✅ Cached {len(df)} 1-min candles for {instrument_key}.")
+    # --- Backfill only the days the local archive does not cover ---
+    if backfill_archive(instrument_key, day_iterator, last_working_day) is None:
+        return None
+
+    # --- Process and Cache (from disk) ---
+    rows = cache_from_archive(instrument_key, day_iterator, last_working_day)
+    if rows:
+        print(f"[TASK 1] ✅ Cached {rows} 1-min candles for {instrument_key}.")
     else:
-        print(f"[TASK 1] ❌ No historical data returned for {instrument_key}. Data fetch failed.")
+        print(f"[TASK 1] ❌ No historical data available for {instrument_key}. Data fetch failed.")
 
     print("[TASK 1] Historical Fetch Complete.\n")
-    return None
\ No newline at end of file
+    return None
+
+
+def backfill_archive(instrument_key, start_date, end_date):
+    """Run the gap-aware backfill; returns its summary, or None when the API is unavailable."""
+    if not missing_days(instrument_key, start_date, end_date):
+        print(f"[TASK 1] 💾 {start_date}..{end_date} already archived locally for {instrument_key}.")
+        return {"missing_days": 0, "requests": 0, "bars": 0, "failed": []}
+
+    access_token = get_access_token_from_file()
+    if not access_token:
+        print("[TASK 1] ❌ Missing access token. Aborting historical fetch.")
+        return None
+
+    api_instance = get_historical_api_instance(access_token)
+    if not api_instance:
+        print("[TASK 1] ❌ Failed to initialize Upstox API instance.")
+        return None
+
+    summary = backfill_history(instrument_key, start_date, end_date, api_instance)
+    print(f"[TASK 1] 📥 Backfilled {summary['missing_days']} missing day(s) with {summary['requests']} "
+          f"request(s), {summary['bars']} candle(s); failed ranges: {summary['failed'] or 'none'}")
+    return summary
+
+
+@celery_app.task(bind=True)
+def backfill_hist_archive(self, instrument_keys=None, days=HIST_ARCHIVE_DAYS):
+    """
+    Extend the local 1m archive of a whole watchlist to the last `days` calendar days in one job:
+    (instrument x date range) requests run on a rate-limited thread pool (history_backfill.py).
+    """
+    instrument_keys = instrument_keys or HIST_BACKFILL_WATCHLIST
+    if isinstance(instrument_keys, str):
+        instrument_keys = [instrument_keys]
+    end_date = get_previous_working_day(datetime.now(IST).date() + timedelta(days=1))
+    start_date = end_date - timedelta(days=days)
+
+    access_token = get_access_token_from_file()
+    api_instance = get_historical_api_instance(access_token)
+    if not api_instance:
+        print("[TASK 1] ❌ Missing access token. Aborting archive backfill.")
+        return None
+
+    summaries = backfill_many(instrument_keys, start_date, end_date, api_instance)
+    failed = {key: s["failed"] for key, s in summaries.items() if s["failed"]}
+    print(f"[TASK 1] 📥 Archive backfill {start_date}..{end_date}: "
+          f"{sum(s['requests'] for s in summaries.values())} request(s), "
+          f"{sum(s['bars'] for s in summaries.values())} candle(s); failed: {failed or 'none'}")
+    return summaries
@@ -0,0 +1,80 @@
+# FILE: app/tasks/task_indicators.py
+import traceback
+import time
+from app.extensions import celery_app
+from app.tasks.candle_store import bucket_start, read_candles, interval_to_ms
+from app.tasks.utils import replay_clock_ms
+from app.tasks.indicators import (
+    IndicatorSet,
+    build_indicator,
+    load_requested_specs,
+    load_indicator_set,
+    save_indicator_set,
+)
+
+
+def _bars(records):
+    """Candle records -> plain dicts (what Indicator.update() reads)."""
+    fields = records.dtype.names
+    columns = [records[name].tolist() for name in fields]
+    return [dict(zip(fields, row)) for row in zip(*columns)]
+
+
+@celery_app.task(bind=True, ignore_result=False)
+def update_indicators(self, instrument_key="NSE_INDEX|Nifty 50", interval="1m", version=None):
+    """Fold newly closed candles into every requested indicator once and cache the latest values.
+
+    Indicators requested by several owners share one state; a newly requested one is warmed up
+    from its own `warmup` candles before joining the set.
+    """
+    specs = load_requested_specs(instrument_key, interval)
+    if not specs:
+        return None
+
+    now_ms = replay_clock_ms() or int(time.time() * 1000)   # the recorded clock during a replay
+    closed_before_ms = bucket_start(now_ms, interval_to_ms(interval))   # session-anchored grid (60m: 09:15, 10:15, ...)
+    if version is not None:
+        closed_before_ms = max(closed_before_ms, int(version) + interval_to_ms(interval))
+
+    try:
+        # 1️⃣ Restore the shared set; re-read its last bar to catch late revisions (merge / backfill)
+        indicator_set, missing = load_indicator_set(instrument_key, interval, specs)
+        new_candles = None
+        if indicator_set.last_ts is not None:
+            candles = read_candles(instrument_key, interval, start_ms=indicator_set.last_ts, end_ms=closed_before_ms)
+            if len(candles) and int(candles["ts"][0]) == indicator_set.last_ts \
+                    and candles["close"][0] == indicator_set.last_close:
+                new_candles = candles[1:]
+
+        if new_candles is None:
+            # 2️⃣ Cold start (or revised last bar): rebuild everything from the longest warm-up
+            indicator_set = IndicatorSet(build_indicator(spec) for spec in specs.values())
+            new_candles = read_candles(instrument_key, interval, end_ms=closed_before_ms, count=indicator_set.warmup)
+            print(f"[INDICATORS] ♻️ Rebuilding {len(specs)} indicator(s) for {instrument_key} {interval} "
+                  f"from {len(new_candles)} candles.")
+        elif missing:
+            # 2b) Newly requested indicators catch up to the set's last bar on their own warm-up window
+            for sid in missing:
+                indicator = build_indicator(specs[sid])
+                history = read_candles(instrument_key, interval, end_ms=indicator_set.last_ts + 1,
+                                       count=indicator.warmup)
+                for bar in _bars(history):
+                    indicator.update(bar)
+                indicator_set.add(indicator)
+            print(f"[INDICATORS] ➕ Warmed up {len(missing)} new indicator(s) for {instrument_key} {interval}.")
+    except Exception as e:
+        print(f"[INDICATORS] ❌ Error reading candle store: {e}\n{traceback.format_exc()}")
+        return None
+
+    # 3️⃣ O(1) per indicator per closed bar
+    for bar in _bars(new_candles):
+        indicator_set.update(bar)
+
+    try:
+        values = save_indicator_set(indicator_set, instrument_key, interval, version=version)
+    except Exception as e:
+        print(f"[INDICATORS] ❌ Failed to cache indicators: {e}\n{traceback.format_exc()}")
+        return None
+    print(f"[INDICATORS] ✅ {len(values)} indicator(s) for {instrument_key} {interval} "
+          f"updated with {len(new_candles)} closed bar(s).")
+    return values
@@ -1,75 +1,111 @@
 # app/tasks/task_merge.py (FINAL ROBUST VERSION)
-import os
 import pandas as pd
 import json
 from datetime import datetime
 import pytz
 from app.extensions import celery_app, cache
 from app.extensions import socketio
-from app.tasks.utils import get_live_ltp
-
-# Helper function to conditionally localize or convert timezone
-def localize_or_convert_to_ist(ts, ist):
-    if pd.isna(ts):
-        return ts
-    # If timestamp is naive (no tz info), localize it to IST
-    if ts.tzinfo is None or ts.tzinfo.utcoffset(ts) is None:
-        return ts.tz_localize(ist)
-    # If timestamp is tz-aware, convert it to IST
-    elif ts.tzinfo != ist:
-        return ts.tz_convert(ist)
-    return ts # Already in IST
+from app.tasks.utils import get_live_ltp, read_closed_bars, get_forming_bar, replay_clock_ms
+from app.tasks.candle_archive import append_archive, archive_dir
+from app.tasks.candle_codec import decode_candles, is_encoded, normalize_timestamps, to_epoch_ms
+from app.tasks.candle_store import (
+    last_candle,
+    read_candles,
+    candles_to_frame,
+    replace_candles,
+    records_from_frame,
+    resample_records,
+    interval_to_ms,
+    enforce_retention,
+    upsert_candles,
+    bucket_start,
+)
+
+def load_streamer_bars(instrument_key, interval, since_ms):
+    """
+    Exact OHLC bars built by the streamer: closed bars with ts >= since_ms plus
+    the bar that is still forming (ts in epoch ms). Returns [] when the streamer has none.
+    """
+    after_id = str(since_ms - 1) if since_ms is not None else "-"
+
+    bars = [bar for _, bar in read_closed_bars(instrument_key, interval, after_id=after_id)]
+    forming = get_forming_bar(instrument_key, interval)
+    if forming and not forming.get("closed"):
+        bars.append(forming)
+
+    if since_ms is not None:
+        bars = [bar for bar in bars if bar["ts"] >= since_ms]
+    # A backfilled bar is appended after the bar it replaces, so the last one wins
+    return list({bar["ts"]: bar for bar in bars}.values())
+
+def seed_from_historical(instrument_key, interval, ist):
+    """One-time base: copy historical_data (task_1_fetch_hist) into the candle store."""
+    if interval != "1m":
+        # historical_data is 1m: higher timeframes are rolled up from the 1m store
+        minutes = read_candles(instrument_key, "1m")
+        if not len(minutes) and seed_from_historical(instrument_key, "1m", ist):
+            minutes = read_candles(instrument_key, "1m")
+        seeded = replace_candles(instrument_key, interval, resample_records(minutes, interval_to_ms(interval)))
+        print(f"[merge_hist_live] ✅ Seeded {interval} candle store with {seeded} rows resampled from 1m.")
+        return seeded
+
+    cached = cache.get(f"historical_data:{instrument_key}")
+    if not cached:
+        print(f"[merge_hist_live] ⚠️ No historical data in cache for {instrument_key}")
+        return 0
+
+    try:
+        if is_encoded(cached):
+            df = decode_candles(cached, tz=ist.zone)
+        else:
+            # JSON written before the binary codec (expires with the 24h cache TTL)
+            df = pd.DataFrame(json.loads(cached.decode("utf-8") if isinstance(cached, bytes) else cached))
+            df["timestamp"] = normalize_timestamps(df["timestamp"], tz=ist.zone)
+        df = df.dropna(subset=["timestamp"])
+        df["ts"] = to_epoch_ms(df["timestamp"])
+        seeded = replace_candles(instrument_key, interval, records_from_frame(df))
+        print(f"[merge_hist_live] ✅ Seeded candle store with {seeded} historical rows.")
+        return seeded
+    except Exception as e:
+        print(f"[merge_hist_live] ❌ Error loading historical: {e}")
+        return 0
 
 @celery_app.task(bind=True, ignore_result=False)
-def merge_hist_live(self, instrument_key="NSE_INDEX|Nifty 50", interval="1m"):
+def merge_hist_live(self, instrument_key="NSE_INDEX|Nifty 50", interval="1m", version=None):
     """
-    Merge historical candle data with live LTP and persist merged_data.
+    Merge live bars into the incremental candle store (candles:<key>:<interval>).
+    Only the new / forming bars are written; the stored series is never re-serialized.
+    `version` is the bar-close stamp of the pipeline run (task_pipeline.on_bar_close).
     """
     ist = pytz.timezone("Asia/Kolkata")
-    now_ist = datetime.now(ist)
-    
-    hist_cache_key = f"historical_data:{instrument_key}"
-    merged_cache_key = f"merged_data:{instrument_key}:{interval}"
-
-    # 1) Prefer previously merged data (so merged grows). If not present, load historical.
-    df = None
-    merged_json = cache.get(merged_cache_key)
-    if merged_json:
-        if isinstance(merged_json, bytes):
-            merged_json = merged_json.decode("utf-8")
-        try:
-            df = pd.DataFrame(json.loads(merged_json))
-            df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
-            df["timestamp"] = df["timestamp"].apply(lambda ts: localize_or_convert_to_ist(ts, ist))
-            
-            df = df.sort_values("timestamp").reset_index(drop=True)
-            print(f"[merge_hist_live] ✅ Loaded existing merged_data with {len(df)} rows.")
-        except Exception as e:
-            print(f"[merge_hist_live] ⚠️ Failed to parse merged_data, falling back to historical: {e}")
-            df = None
-
-    # 2) If no merged data, load historical_data (one-time base)
-    if df is None:
-        hist_json = cache.get(hist_cache_key)
-        if not hist_json:
-            print(f"[merge_hist_live] ⚠️ No historical data in cache for {instrument_key}")
-            return None
-
-        if isinstance(hist_json, bytes):
-            hist_json = hist_json.decode("utf-8")
-
-        try:
-            df = pd.DataFrame(json.loads(hist_json))
-            df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
-            df["timestamp"] = df["timestamp"].apply(lambda ts: localize_or_convert_to_ist(ts, ist))
-            
-            df = df.sort_values("timestamp").reset_index(drop=True)
-            print(f"[merge_hist_live] ✅ Loaded historical_data with {len(df)} rows.")
-        except Exception as e:
-            print(f"[merge_hist_live] ❌ Error loading historical: {e}")
-            return None
-
-    # 3) Get live LTP
+    # A replay (app/tasks/streamer/replay.py) runs on the recorded clock, not wall time
+    clock_ms = replay_clock_ms()
+    now_ist = datetime.fromtimestamp(clock_ms / 1000, ist) if clock_ms else datetime.now(ist)
+
+    # 1) Seed the store from historical_data the first time
+    last = last_candle(instrument_key, interval)
+    since_ms = last["ts"] if last is not None else None   # bars from here on may close this run
+    if last is None:
+        if not seed_from_historical(instrument_key, interval, ist):
+            # No history (e.g. a fresh replay database): start the store from the streamer's bars
+            streamer_bars = load_streamer_bars(instrument_key, interval, None)
+            if not streamer_bars:
+                return None
+            upsert_candles(instrument_key, interval, streamer_bars)
+            print(f"[merge_hist_live] ✅ Seeded candle store with {len(streamer_bars)} streamer bar(s) (version={version})")
+            return _publish_merged(instrument_key, interval, new_bar=True, since_ms=None)
+        last = last_candle(instrument_key, interval)
+
+    # 2) Prefer the exact bars aggregated by the streamer from every tick
+    streamer_bars = load_streamer_bars(instrument_key, interval, last["ts"])
+    if streamer_bars:
+        appended, updated = upsert_candles(instrument_key, interval, streamer_bars)
+        last_bar_ts = pd.Timestamp(streamer_bars[-1]["ts"], unit="ms", tz="UTC").tz_convert(ist)
+        print(f"[merge_hist_live] ✅ Upserted {len(streamer_bars)} streamer bar(s) up to {last_bar_ts} "
+              f"(+{appended} new, {updated} updated, version={version})")
+        return _publish_merged(instrument_key, interval, new_bar=appended > 0, since_ms=since_ms)
+
+    # 2b) Fallback: sample the live LTP into the current minute
     live_data = get_live_ltp(instrument_key)
     if not live_data or "ltp" not in live_data:
         print(f"[merge_hist_live] ⚠️ No live LTP for {instrument_key}")
@@ -81,63 +117,62 @@ def merge_hist_live(self, instrument_key="NSE_INDEX|Nifty 50", interval="1m"):
         print(f"[merge_hist_live] ❌ Invalid LTP format: {live_data}")
         return None
 
-    # 4) Determine last timestamp and current minute timestamp
-    if df.empty:
-        last_ts = None
-    else:
-        last_ts = df["timestamp"].iloc[-1]
-
-    current_bar_ts = now_ist.replace(second=0, microsecond=0)
+    # 3) Determine the current bar timestamp (session-anchored for 3m/5m/15m/60m)
+    current_bar_ms = bucket_start(int(now_ist.timestamp() * 1000), interval_to_ms(interval))
+    current_bar_ts = datetime.fromtimestamp(current_bar_ms / 1000, ist)
 
-    # 5) CRITICAL FIX: Logic to UPDATE the last candle or APPEND a new one
-    
-    if last_ts is None or current_bar_ts > last_ts:
-        # CASE A: APPEND a new candle (first run OR a new minute boundary crossed)
-        new_row = {
-            "timestamp": current_bar_ts,  # store as datetime (Timestamp)
-            "open": ltp,
-            "high": ltp,
-            "low": ltp,
-            "close": ltp,
-            "volume": 0,
-            "oi": 0,
-        }
-        df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
+    # 4) UPDATE the last candle or APPEND a new one
+    if current_bar_ms > last["ts"]:
+        # CASE A: APPEND a new candle (a new bar boundary crossed)
+        bar = {"ts": current_bar_ms, "open": ltp, "high": ltp, "low": ltp, "close": ltp, "volume": 0, "oi": 0}
+        upsert_candles(instrument_key, interval, [bar])
         print(f"[merge_hist_live] ✅ Added new live candle @ {current_bar_ts} | LTP={ltp}")
+        return _publish_merged(instrument_key, interval, new_bar=True, since_ms=since_ms)
 
-    elif current_bar_ts == last_ts and not df.empty:
-        # CASE B: UPDATE the existing, in-progress candle (same minute)
-        last_idx = df.index[-1]
-        
-        df.at[last_idx, 'close'] = ltp
-        df.at[last_idx, 'high'] = max(df.at[last_idx, 'high'], ltp)
-        df.at[last_idx, 'low'] = min(df.at[last_idx, 'low'], ltp)
-        
+    if current_bar_ms == last["ts"]:
+        # CASE B: UPDATE the existing, in-progress candle (same bar)
+        bar = dict(last, high=max(last["high"], ltp), low=min(last["low"], ltp), close=ltp)
+        upsert_candles(instrument_key, interval, [bar])
         print(f"[merge_hist_live] ✅ Updated live candle @ {current_bar_ts} | LTP={ltp}")
+        return _publish_merged(instrument_key, interval, new_bar=False, since_ms=since_ms)
 
-    else:
-        print(f"[merge_hist_live] ⚠️ Skipping LTP operation. last_ts={last_ts}, current_bar_ts={current_bar_ts}")
+    print(f"[merge_hist_live] ⚠️ Skipping LTP operation. last_ts={last['ts']}, current_bar_ts={current_bar_ts}")
+    return None
 
-    # 6) Final check and sort
-    df = df.sort_values("timestamp").drop_duplicates(subset=["timestamp"], keep="last").reset_index(drop=True)
 
-    # 7) Persist merged_data to cache and disk
-    try:
-        cache.set(merged_cache_key, df.to_json(orient="records", date_format="iso"), timeout=300)
-        os.makedirs("data", exist_ok=True)
-        file_path = os.path.join("data", f"merged_data_{instrument_key.replace('|', '_')}_{interval}.csv")
-        df.to_csv(file_path, index=False)
-        print(f"[merge_hist_live] ✅ Saved merged candles ({len(df)}) to cache & {file_path}")
-    except Exception as e:
-        print(f"[merge_hist_live] ❌ Failed to persist merged data: {e}")
+def _publish_merged(instrument_key, interval, new_bar, since_ms=None):
+    # 5) Append the bars that closed this run to the data/candles/ day files.
+    #    Only bars from `since_ms` (the previous newest bar) are read and written,
+    #    so disk I/O per run no longer grows with history. since_ms=None (first
+    #    seed) writes the seeded history once.
+    if new_bar:
+        try:
+            newest = last_candle(instrument_key, interval)
+            closed = read_candles(instrument_key, interval, start_ms=since_ms, end_ms=newest["ts"])
+            written = append_archive(instrument_key, interval, closed, revise=True)
+            if written:
+                print(f"[merge_hist_live] 💾 Wrote {written} closed candle(s) to {archive_dir(instrument_key, interval)}")
+        except Exception as e:
+            print(f"[merge_hist_live] ❌ Failed to persist closed candles: {e}")
+
+    # Keep Redis to the hot window (older candles are already on disk)
+    if new_bar:
+        try:
+            archived = enforce_retention(instrument_key, interval)
+            if archived:
+                print(f"[merge_hist_live] 🗄️ Archived {archived} candle(s) older than the hot window to disk.")
+        except Exception as e:
+            print(f"[merge_hist_live] ❌ Candle retention failed: {e}")
 
     try:
+        tail = candles_to_frame(read_candles(instrument_key, interval, count=2))
+        tail["timestamp"] = tail["timestamp"].map(lambda ts: ts.isoformat())
         socketio.emit(
             "merged_data_update",
-            {"symbol": instrument_key, "interval": interval, "data": df.tail(2).to_dict(orient="records")},
+            {"symbol": instrument_key, "interval": interval, "data": tail.to_dict(orient="records")},
             namespace="/stream"
         )
     except Exception:
         pass
 
-    return None
\ No newline at end of file
+    return None
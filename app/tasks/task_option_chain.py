@@ -6,7 +6,6 @@
 import math
 import os
 import json 
-from datetime import datetime, timedelta
 import upstox_client
 from upstox_client.rest import ApiException
 from dotenv import load_dotenv
@@ -17,7 +16,8 @@ from app.extensions import celery_app, cache
 from .utils import (
     get_upstox_headers, 
     get_live_ltp,
-    get_next_tuesday
+    get_next_tuesday,
+    request_subscription
 )
 
 load_dotenv()
@@ -82,14 +82,9 @@ def fetch_option_data(self, prev_result=None):
         print(f"[TASK 9] 📈 Nifty LTP = {nifty_ltp_float:.2f}, ATM Strike = {atm_strike}")
 
         # 5️⃣ Smart Expiry Date Logic
-        today = datetime.now().date()
-        next_tuesday = get_next_tuesday() 
-
-        if today.weekday() == 1:  # Tuesday (0=Mon, 1=Tue, ..., 6=Sun)
-            # Skip today's expiry and move to next week
-            expiry_date = next_tuesday + timedelta(days=0)
-        else:
-            expiry_date = next_tuesday
+        # Next weekly expiry after today from the trading calendar: today's expiry is
+        # skipped, and a holiday Tuesday moves the expiry to the session before it
+        expiry_date = get_next_tuesday()
 
         expiry_date_str = expiry_date.strftime("%Y-%m-%d")
         print(f"[TASK 9] 📅 Selected Expiry = {expiry_date_str}")
@@ -163,6 +158,9 @@ def fetch_option_data(self, prev_result=None):
         
         # Save the result as a JSON string
         cache.set(GLOBAL_OPTION_KEY, json.dumps(result), timeout=CACHE_TIMEOUT)
+        # Keep the streamer subscribed to the current ATM strikes (old strikes are dropped);
+        # option_greeks mode puts IV / OI / greeks in snapshot:<key> for the strategy
+        request_subscription("option_chain", [atm_call_key, atm_put_key], timeout=CACHE_TIMEOUT, mode="option_greeks")
         print(f"[TASK 9] ✅ Cached ATM CALL: {atm_call_key} | PUT: {atm_put_key} (GLOBAL).")
         print("--- [TASK 9] Option Chain Fetch Complete ---")
         return result
@@ -16,7 +16,8 @@ from flask import current_app
 # --------------------------------------------------
 
 from app.models import User
-from .utils import get_upstox_headers, get_live_ltp
+from .utils import get_upstox_headers, get_live_ltp, request_subscription, release_subscription
+from .task_trend import trend_signal_key
 
 load_dotenv()
 
@@ -24,7 +25,7 @@ load_dotenv()
 NIFTY_INDEX_KEY = "NSE_INDEX|Nifty 50"
 NIFTY_50_NAME = "Nifty 50"
 
-TREND_SIGNAL_KEY = f"trend_signal:{NIFTY_INDEX_KEY}"   # written by task_trend.py
+TREND_SIGNAL_KEY = trend_signal_key(NIFTY_INDEX_KEY)   # written by task_trend.py
 GLOBAL_OPTION_KEY = "option_chain:GLOBAL"              # written by task_9_option_chain.py
 # active trade key pattern: f"active_trade_{user.id}"
 
@@ -167,6 +168,7 @@ def manage_orders(self, user_id: int):
                 "sma_25": signal_frame.get("sma_25"),
                 "sma_50": signal_frame.get("sma_50"),
                 "sma_100": signal_frame.get("sma_100"),
+                "version": signal_frame.get("version"),
             }
 
         final_trade_instruments = option_meta if option_meta else {}
@@ -227,6 +229,7 @@ def manage_orders(self, user_id: int):
                     cache.delete(active_trade_key)
                 except Exception:
                     pass
+                release_subscription(f"trade:{user.id}")
 
             # notify and return (skip new trades while square-off processed)
             try:
@@ -391,6 +394,9 @@ def decide_and_execute_trade(market_state, user, headers, active_trade_key):
     except Exception:
         print("    -> Warning: failed to cache active trade.")
 
+    # Keep a tick feed for the traded option even after the ATM strike moves on
+    request_subscription(f"trade:{user.id}", [instrument_token], timeout=86400)
+
     # Notify clients
     try:
         socketio.emit("trade_notification", {"message": f"{trade_type} Trade Entered! Entry: {entry_price}, SL: {stoploss_price}, TP: {target_price}"}, room=str(user.id))
@@ -432,6 +438,7 @@ def manage_active_trade(trade, market_state, user, headers, active_trade_key):
             cache.delete(active_trade_key)
         except Exception:
             pass
+        release_subscription(f"trade:{user.id}")
         try:
             socketio.emit("trade_notification", {"message": f"Exited {trade['type']} (Auto Square-Off)"}, room=str(user.id))
         except Exception:
@@ -454,6 +461,7 @@ def manage_active_trade(trade, market_state, user, headers, active_trade_key):
             cache.delete(active_trade_key)
         except Exception:
             pass
+        release_subscription(f"trade:{user.id}")
         try:
             socketio.emit("trade_notification", {"message": "User requested square-off. Exited active trade."}, room=str(user.id))
         except Exception:
@@ -497,6 +505,7 @@ def manage_active_trade(trade, market_state, user, headers, active_trade_key):
             cache.delete(active_trade_key)
         except Exception:
             pass
+        release_subscription(f"trade:{user.id}")
         try:
             socketio.emit("trade_notification", {"message": f"STOPLOSS HIT ({sl}). Exited {trade['type']}."}, room=str(user.id))
         except Exception:
@@ -514,6 +523,7 @@ def manage_active_trade(trade, market_state, user, headers, active_trade_key):
             cache.delete(active_trade_key)
         except Exception:
             pass
+        release_subscription(f"trade:{user.id}")
         try:
             socketio.emit("trade_notification", {"message": f"TARGET HIT ({tp}). Exited {trade['type']}."}, room=str(user.id))
         except Exception:
@@ -0,0 +1,151 @@
+# ============================================
+# FILE: app/tasks/task_pipeline.py
+# PURPOSE: Event-driven merge -> SMA -> trend -> orders chain, run once per closed bar
+# ============================================
+#
+# The streamer sends `on_bar_close` the moment a bar closes (see
+# app/tasks/streamer/events.py). Each run carries a version stamp, the closed
+# bar's start time in epoch ms, through every stage. A run whose version is not
+# newer than the last one started for the same series is dropped, so late or
+# duplicated events can never overwrite fresher results.
+#
+# `on_bars_close` takes every close the streamer flushed at once: merge and SMA
+# run per series, then the trend of all instruments is computed in one
+# vectorized pass. Order evaluation is only queued when a signal flipped (see
+# app/tasks/trend_transitions.py); the manage_orders beat covers the rest.
+#
+# `pipeline_fallback` is the low-frequency beat safety net: when no streamer
+# event claimed the last closed bar (streamer down, or
+# STREAMER_BAR_CLOSE_PIPELINE=0), it runs the same pipeline for that bar.
+
+import os
+import time
+from datetime import datetime
+import pytz
+
+from app.extensions import celery_app
+from app.models import User
+from app.tasks.utils import redis_client, replay_clock_ms
+from app.tasks.candle_store import bucket_start, interval_to_ms
+from app.tasks.trading_calendar import session_minute_index
+from app.tasks.task_merge import merge_hist_live
+from app.tasks.task_sma import calculate_sma_for_closed_bar
+from app.tasks.task_indicators import update_indicators
+from app.tasks.task_trend import analyze_trends
+from app.tasks.task_order_manager import manage_orders
+
+# --- CONFIG ---
+PIPELINE_VERSIONS_KEY = "pipeline:versions"   # sorted set: "<key>:<interval>" -> latest version
+# A bar must have been closed this long before the fallback takes it from the streamer
+FALLBACK_GRACE_MS = int(float(os.getenv("PIPELINE_FALLBACK_GRACE_SECONDS", "20")) * 1000)
+
+
+def claim_version(instrument_key: str, interval: str, version: int):
+    """True when `version` is newer than every run already started for this series."""
+    return bool(redis_client.zadd(PIPELINE_VERSIONS_KEY, {f"{instrument_key}:{interval}": version}, gt=True, ch=True))
+
+
+def current_version(instrument_key: str, interval: str):
+    score = redis_client.zscore(PIPELINE_VERSIONS_KEY, f"{instrument_key}:{interval}")
+    return int(score) if score is not None else None
+
+
+def _tag(instrument_key, interval, version):
+    ist = pytz.timezone("Asia/Kolkata")
+    bar_time = datetime.fromtimestamp(version / 1000, ist).strftime("%H:%M")
+    return f"[PIPELINE {instrument_key} {interval} v{version} ({bar_time})]"
+
+
+def superseded(instrument_key, interval, version):
+    latest = current_version(instrument_key, interval)
+    if latest is not None and latest > version:
+        print(f"{_tag(instrument_key, interval, version)} ⏭️ Superseded by v{latest}; stopping.")
+        return True
+    return False
+
+
+def prepare_series(instrument_key, interval, version):
+    """Merge, SMA and registry indicators for one closed bar. True when the trend stage can run."""
+    tag = _tag(instrument_key, interval, version)
+    if not claim_version(instrument_key, interval, version):
+        print(f"{tag} ⏭️ Skipped: a newer or identical bar was already processed.")
+        return False
+
+    merge_hist_live(instrument_key, interval, version=version)
+    if superseded(instrument_key, interval, version):
+        return False
+
+    if calculate_sma_for_closed_bar(instrument_key, interval, version=version) is None:
+        print(f"{tag} ⚠️ No SMA values; stopping before trend.")
+        return False
+    if superseded(instrument_key, interval, version):
+        return False
+
+    # Registry indicators requested by strategies (computed once, shared via indicator_latest:*)
+    update_indicators(instrument_key, interval, version=version)
+    return True
+
+
+def queue_order_evaluation(tag, signals):
+    # Orders run per user in parallel; the 20s beat keeps watching SL/TP between bars
+    user_ids = [user.id for user in User.query.filter_by(is_trading_on=True).all()]
+    for user_id in user_ids:
+        manage_orders.delay(user_id)
+    print(f"{tag} ✅ {signals} -> order evaluation queued for {len(user_ids)} user(s).")
+
+
+@celery_app.task(bind=True, ignore_result=True)
+def on_bars_close(self, events, place_orders=True):
+    """
+    Run the pipeline for a batch of [instrument_key, interval, bar_ts] closes in one task.
+    place_orders=False (replay) stops after the trend stage.
+    """
+    ready = {}   # interval -> {instrument_key: version}
+    for instrument_key, interval, bar_ts in events:
+        version = int(bar_ts)
+        if prepare_series(instrument_key, interval, version):
+            ready.setdefault(interval, {})[instrument_key] = version
+
+    signals = {}
+    for interval, versions in ready.items():
+        trends = analyze_trends(list(versions), interval=interval, versions=versions)
+        for instrument_key, trend in trends.items():
+            if trend["changed"] and not superseded(instrument_key, interval, versions[instrument_key]):
+                signals[f"{instrument_key}:{interval}"] = trend["signal"]
+
+    if signals and not place_orders:
+        print(f"[PIPELINE batch of {len(events)}] 🧪 {signals} (order placement disabled)")
+    elif signals:
+        queue_order_evaluation(f"[PIPELINE batch of {len(events)}]", signals)
+    return None
+
+
+@celery_app.task(bind=True, ignore_result=True)
+def on_bar_close(self, instrument_key="NSE_INDEX|Nifty 50", interval="1m", bar_ts=None):
+    """Run merge, SMA, trend and order evaluation in order for one closed bar."""
+    version = int(bar_ts)
+    if not prepare_series(instrument_key, interval, version):
+        return None
+
+    trend = analyze_trends([instrument_key], interval=interval, versions={instrument_key: version}).get(instrument_key)
+    if trend is None or not trend["changed"] or superseded(instrument_key, interval, version):
+        return None
+    queue_order_evaluation(_tag(instrument_key, interval, version), trend["signal"])
+    return None
+
+
+@celery_app.task(bind=True, ignore_result=True)
+def pipeline_fallback(self, instrument_key="NSE_INDEX|Nifty 50", interval="1m"):
+    """Beat safety net: run the pipeline for the last closed bar when no bar-close event claimed it."""
+    step = interval_to_ms(interval)
+    now_ms = (replay_clock_ms() or int(time.time() * 1000)) - FALLBACK_GRACE_MS
+    bar_ts = bucket_start(now_ms, step) - step   # the bar before the forming one
+    if session_minute_index(bar_ts) is None:
+        return None   # outside market hours or a holiday
+    latest = current_version(instrument_key, interval)
+    if latest is not None and latest >= bar_ts:
+        return None   # the streamer already ran it
+
+    print(f"{_tag(instrument_key, interval, bar_ts)} 🛟 No bar-close event from the streamer; running from beat.")
+    on_bars_close.run([[instrument_key, interval, bar_ts]])
+    return None
@@ -1,55 +1,62 @@
 # FILE: app/tasks/task_sma.py
-import pandas as pd
-import json
 import traceback
+import time
 from datetime import datetime
 import pytz
-from app.extensions import celery_app, cache
+from app.extensions import celery_app
+from app.tasks.candle_store import bucket_start, read_candles, interval_to_ms
+from app.tasks.utils import replay_clock_ms
+from app.tasks.indicators import SMAEngine, SMA_PERIODS, load_sma_engine, save_sma_engine, get_latest_sma
 
 @celery_app.task(bind=True, ignore_result=False)
-def calculate_sma_for_closed_bar(self, instrument_key="NSE_INDEX|Nifty 50", interval="1m"):
-    """Compute SMA(10,25,50,100) for entire merged candle data and cache full results."""
+def calculate_sma_for_closed_bar(self, instrument_key="NSE_INDEX|Nifty 50", interval="1m", version=None):
+    """Fold newly closed candles into the incremental SMA(10,25,50,100) engine and cache the latest values.
+
+    `version` (bar-close stamp, epoch ms) marks that bar as closed even if the wall clock lags the boundary.
+    """
     ist = pytz.timezone("Asia/Kolkata")
     now = datetime.now(ist).strftime("%Y-%m-%d %H:%M:%S")
     print(f"\n--- [TASK: SMA] Starting SMA calculation for {instrument_key} @ {now} ---")
 
-    merged_cache_key = f"merged_data:{instrument_key}:{interval}"
-    sma_cache_key = f"sma_data:{instrument_key}:{interval}"  # store full SMA data here
-
-    # 1️⃣ Fetch merged candle data
-    merged_json = cache.get(merged_cache_key)
-    if not merged_json:
-        print(f"    -> ⚠️ No merged data found in cache for {instrument_key}. Skipping SMA calc.")
-        return None
+    # Only bars whose interval has ended; the forming bar is left to the trend's LTP check
+    now_ms = replay_clock_ms() or int(time.time() * 1000)   # the recorded clock during a replay
+    closed_before_ms = bucket_start(now_ms, interval_to_ms(interval))   # session-anchored grid (60m: 09:15, 10:15, ...)
+    if version is not None:
+        closed_before_ms = max(closed_before_ms, int(version) + interval_to_ms(interval))
 
     try:
-        if isinstance(merged_json, bytes):
-            merged_json = merged_json.decode("utf-8")
-
-        data = json.loads(merged_json)
-        merged_df = pd.DataFrame(data)
-
-        # Ensure timestamp dtype
-        merged_df["timestamp"] = pd.to_datetime(merged_df["timestamp"], errors="coerce")
-        merged_df = merged_df.sort_values("timestamp").reset_index(drop=True)
-
-        # Ensure numeric close values
-        merged_df["close"] = pd.to_numeric(merged_df["close"], errors="coerce")
-
+        # 1️⃣ Restore the engine; re-read its last bar to catch late revisions (merge / backfill)
+        engine = load_sma_engine(instrument_key, interval)
+        new_candles = None
+        if engine is not None and engine.last_ts is not None:
+            candles = read_candles(instrument_key, interval, start_ms=engine.last_ts, end_ms=closed_before_ms)
+            if len(candles) and int(candles["ts"][0]) == engine.last_ts and candles["close"][0] == engine.last_close:
+                new_candles = candles[1:]
+
+        # 2️⃣ Cold start (or revised last bar): warm up from the last max(period) closed candles
+        if new_candles is None:
+            engine = SMAEngine(SMA_PERIODS)
+            new_candles = read_candles(instrument_key, interval, end_ms=closed_before_ms, count=engine.size)
+            print(f"    -> ♻️ Rebuilding SMA state from {len(new_candles)} candles.")
     except Exception as e:
-        print(f"    -> ❌ Error parsing merged data: {e}\n{traceback.format_exc()}")
+        print(f"    -> ❌ Error reading candle store: {e}\n{traceback.format_exc()}")
         return None
 
-    # 2️⃣ Compute SMAs on the FULL dataset
-    for period in [10, 25, 50, 100]:
-        merged_df[f"sma_{period}"] = merged_df["close"].rolling(window=period, min_periods=period).mean()
+    if not len(new_candles):
+        print(f"    -> ⏭️ No newly closed candles for {instrument_key}. SMA unchanged.")
+        return get_latest_sma(instrument_key, interval)
 
-    # 3️⃣ Cache the FULL SMA dataset
+    # 3️⃣ O(1) update per closed bar
+    for ts, close in zip(new_candles["ts"].tolist(), new_candles["close"].tolist()):
+        engine.update(close, ts)
+
+    # 4️⃣ Persist the small state + latest values only
     try:
-        cache.set(sma_cache_key, merged_df.to_json(orient="records", date_format="iso"), timeout=300)
-        print(f"    -> ✅ Cached FULL SMA(10,25,50,100) for {len(merged_df)} rows.")
+        latest = save_sma_engine(engine, instrument_key, interval, version=version)
+        print(f"    -> ✅ Updated SMA(10,25,50,100) with {len(new_candles)} closed bar(s): {latest}")
     except Exception as e:
         print(f"    -> ❌ Failed to cache SMA data: {e}\n{traceback.format_exc()}")
+        return None
 
     print(f"--- [TASK: SMA] Completed SMA Calculation for {instrument_key} ---\n")
-    return None
+    return latest
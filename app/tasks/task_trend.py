@@ -2,105 +2,133 @@
 # FILE: app/tasks/task_trend.py (FINAL CORRECTED VERSION)
 # PURPOSE: Analyze trend (Bullish/Bearish) using LTP + SMA values
 # ============================================
+#
+# The stacking rules are evaluated for a whole watchlist at once: the latest
+# LTP and SMA(10,25,50,100) of every instrument form one (n, 5) NumPy array,
+# and every signal is written in one cache round-trip. Each instrument (and
+# interval other than 1m) has its own trend_signal:* key. Signal flips are
+# recorded as events by app/tasks/trend_transitions.py.
 
 import json
-import pandas as pd
+import os
+import numpy as np
 from datetime import datetime
 import pytz
 
 from app.extensions import celery_app, cache
-from app.tasks.utils import get_live_ltp # <-- IMPORTANT: Use the helper to get LTP
+from app.tasks.utils import get_live_ltps # <-- IMPORTANT: one MGET for every LTP
+from app.tasks.indicators import get_latest_smas
+from app.tasks.trend_transitions import record_transitions
 
+# --- CONFIG ---
+TREND_WATCHLIST = [
+    k.strip() for k in os.getenv("TREND_WATCHLIST", "NSE_INDEX|Nifty 50").split(",") if k.strip()
+]
+TREND_SIGNAL_TTL = 120   # very short, as this runs on every bar close
+SMA_COLUMNS = ("sma_10", "sma_25", "sma_50", "sma_100")
 
-@celery_app.task(bind=True, ignore_result=False)
-def analyze_trend(self, instrument_key="NSE_INDEX|Nifty 50", short_period=10, long_period=100, interval="1m"):
+CALL_BUY, PUT_BUY, NEUTRAL = "CALL BUY", "PUT BUY", "NEUTRAL"
+
+
+def trend_signal_key(instrument_key: str, interval: str = "1m"):
+    """trend_signal:<key> for 1m (what the order manager reads), trend_signal:<key>:<interval> otherwise."""
+    return f"trend_signal:{instrument_key}" if interval == "1m" else f"trend_signal:{instrument_key}:{interval}"
+
+
+def trend_signals(values):
+    """
+    values: (n, 5) array of [LTP, SMA10, SMA25, SMA50, SMA100] rows -> n signals.
+      ✅ Bullish = LTP above every SMA and SMA(10) above SMA(25), SMA(50), SMA(100)
+      ✅ Bearish = LTP below every SMA and SMA(10) below SMA(25), SMA(50), SMA(100)
+    Rows with a missing (NaN) value are NEUTRAL.
+    """
+    values = np.asarray(values, dtype=float).reshape(-1, 5)
+    ltp, smas = values[:, :1], values[:, 1:]
+    with np.errstate(invalid="ignore"):
+        bullish = (ltp > smas).all(axis=1) & (smas[:, :1] > smas[:, 1:]).all(axis=1)
+        bearish = (ltp < smas).all(axis=1) & (smas[:, :1] < smas[:, 1:]).all(axis=1)
+    return np.where(bullish, CALL_BUY, np.where(bearish, PUT_BUY, NEUTRAL))
+
+
+def evaluate_trends(instrument_keys, interval="1m", versions=None):
     """
-    Analyze trend direction (CALL BUY / PUT BUY) based on:
-      ✅ Bullish = LTP > SMA(10) > SMA(25) > SMA(50) > SMA(100)
-      ✅ Bearish = LTP < SMA(10) < SMA(25) < SMA(50) < SMA(100)
+    Compute and cache the trend of every instrument in one pass.
+    Returns {instrument_key: payload}; instruments without an LTP or complete SMAs are left out.
+    payload["changed"] is True when the signal flipped (the flip is on the transition stream).
     """
     ist = pytz.timezone("Asia/Kolkata")
     now = datetime.now(ist).strftime("%Y-%m-%d %H:%M:%S")
+    versions = versions or {}
+    keys = list(dict.fromkeys(instrument_keys))
+
+    # --- Step 1: Latest SMA rows and LTPs, one round-trip each ---
+    latest_rows = get_latest_smas(keys, interval)
+    ltps = get_live_ltps(keys)
+
+    values = np.full((len(keys), 5), np.nan)
+    for i, key in enumerate(keys):
+        row = latest_rows.get(key) or {}
+        values[i, 0] = np.nan if ltps.get(key) is None else ltps[key]
+        values[i, 1:] = [np.nan if row.get(c) is None else row[c] for c in SMA_COLUMNS]
+
+    ready = ~np.isnan(values).any(axis=1)
+    for key in np.asarray(keys, dtype=object)[~ready]:
+        print(f"    -> ⚠️ No LTP or incomplete SMA data for {key}:{interval}. Skipping trend analysis.")
+    if not ready.any():
+        return {}
+
+    # --- Step 2: Vectorized stacking rules ---
+    signals = trend_signals(values[ready])
+
+    # --- Step 3: Record flips, then cache every signal in one pipeline ---
+    payloads = {}
+    for key, row, signal in zip(np.asarray(keys, dtype=object)[ready], values[ready].tolist(), signals.tolist()):
+        version = versions.get(key)
+        payloads[key] = {
+            "instrument": key,
+            "ltp": row[0],
+            "sma_10": row[1],
+            "sma_25": row[2],
+            "sma_50": row[3],
+            "sma_100": row[4],
+            "signal": signal,
+            "timestamp": now,
+            "version": version if version is not None else latest_rows[key].get("version"),
+        }
+    try:
+        flipped = {t["instrument"] for t in record_transitions(payloads, interval)}
+    except Exception as e:
+        print(f"    -> ⚠️ Failed to record trend transitions: {e}")
+        flipped = set(payloads)   # unknown: let consumers re-evaluate
+    for key, payload in payloads.items():
+        payload["changed"] = key in flipped
 
-    print(f"\n--- [TASK: TREND] Starting Trend Analysis for {instrument_key} @ {now} ---")
+    cache.set_many(
+        {trend_signal_key(key, interval): json.dumps(payload) for key, payload in payloads.items()},
+        timeout=TREND_SIGNAL_TTL,
+    )
+    return payloads
 
-    # --- Step 1: Fetch SMA Data ---
-    sma_cache_key = f"sma_data:{instrument_key}:{interval}"
-    sma_json = cache.get(sma_cache_key)
-    if not sma_json:
-        print(f"    -> ⚠️ No SMA data found in cache at {sma_cache_key}. Skipping trend analysis.")
-        return None
 
-    try:
-        sma_df = pd.DataFrame(json.loads(sma_json))
-        sma_df["timestamp"] = pd.to_datetime(sma_df["timestamp"])
-        sma_df = sma_df.sort_values("timestamp")
-        latest_row = sma_df.iloc[-1]
-    except Exception as e:
-        print(f"    -> ❌ Error parsing SMA data: {e}")
-        return None
+@celery_app.task(bind=True, ignore_result=False)
+def analyze_trends(self, instrument_keys=None, interval="1m", versions=None):
+    """Trend for a whole watchlist (TREND_WATCHLIST by default) in one task."""
+    instrument_keys = instrument_keys or TREND_WATCHLIST
+    print(f"\n--- [TASK: TREND] Starting Trend Analysis for {len(instrument_keys)} instrument(s) ({interval}) ---")
+    payloads = evaluate_trends(instrument_keys, interval, versions)
+    for key, payload in payloads.items():
+        flip = " (changed)" if payload["changed"] else ""
+        print(f"    -> ✅ {key}: {payload['signal']}{flip} | LTP: {payload['ltp']} | SMA10: {payload['sma_10']} "
+              f"| SMA25: {payload['sma_25']} | SMA50: {payload['sma_50']} | SMA100: {payload['sma_100']}")
+    print(f"--- [TASK: TREND] Completed Trend Analysis ({len(payloads)}/{len(instrument_keys)} signals) ---\n")
+    return payloads
 
-    # --- Step 2: Fetch Latest LTP (Using Helper) ---
-    # 💥 CRITICAL FIX: Use the get_live_ltp helper to retrieve and format the value
-    live_data = get_live_ltp(instrument_key) 
-    
-    if not live_data or "ltp" not in live_data:
-        print(f"    -> ⚠️ No live LTP found for {instrument_key}. Skipping trend analysis.")
-        return None
 
-    try:
-        # The helper returns {'ltp': 'value_string'}
-        ltp = float(live_data["ltp"])
-    except ValueError:
-        print(f"    -> ❌ Invalid LTP format returned by helper: {live_data['ltp']}")
-        return None
-    # ----------------------------------------------------
-
-    sma_10 = latest_row.get("sma_10")
-    sma_25 = latest_row.get("sma_25")
-    sma_50 = latest_row.get("sma_50")
-    sma_100 = latest_row.get("sma_100")
-
-    # Ensure all SMAs are available and not NaN (since rolling average produces NaNs at the start)
-    if any(pd.isna([sma_10, sma_25, sma_50, sma_100])):
-        print(f"    -> ⚠️ SMA data incomplete (NaNs present), skipping trend check.")
-        return None
-
-    # --- Step 3: Determine Trend (FINAL CORRECTED LOGIC) ---
-    trend_signal = "NEUTRAL"
-    
-    # SMAs Stacked Bullish
-    stacked_bullish = (sma_10 > sma_25) and (sma_10 > sma_50) and (sma_10 > sma_100)
-    
-    # SMAs Stacked Bearish
-    stacked_bearish = (sma_10 < sma_25) and (sma_10 < sma_50) and (sma_10 < sma_100)
-
-    # Bullish condition: LTP > ALL SMAs AND SMAs are Stacked Bullish
-    if (ltp > sma_10) and (ltp > sma_25) and (ltp > sma_50) and (ltp > sma_100) and stacked_bullish:
-        trend_signal = "CALL BUY"
-
-    # Bearish condition: LTP < ALL SMAs AND SMAs are Stacked Bearish
-    elif (ltp < sma_10) and (ltp < sma_25) and (ltp < sma_50) and (ltp < sma_100) and stacked_bearish:
-        trend_signal = "PUT BUY"
-
-    # --- Step 4: Cache Trend Result ---
-    trend_cache_key = "trend_signal:NSE_INDEX|Nifty 50"
-    trend_payload = {
-        "instrument": instrument_key,
-        "ltp": ltp,
-        "sma_10": sma_10,
-        "sma_25": sma_25,
-        "sma_50": sma_50,
-        "sma_100": sma_100,
-        "signal": trend_signal,
-        "timestamp": now,
-    }
-
-    # Cache the JSON payload. Timeout should be very short as this runs often.
-    cache.set(trend_cache_key, json.dumps(trend_payload), timeout=120) 
-    
-    print(f"    -> ✅ Trend: {trend_signal} | LTP: {ltp} | SMA10: {sma_10} | SMA25: {sma_25} | SMA50: {sma_50} | SMA100: {sma_100}")
-
-
-    print(f"--- [TASK: TREND] Completed Trend Analysis for {instrument_key} ---\n")
-    return trend_payload
\ No newline at end of file
+@celery_app.task(bind=True, ignore_result=False)
+def analyze_trend(self, instrument_key="NSE_INDEX|Nifty 50", short_period=10, long_period=100, interval="1m", version=None):
+    """
+    Analyze trend direction (CALL BUY / PUT BUY) for one instrument (see trend_signals()).
+    `version` is the bar-close stamp of the pipeline run; it is stored with the signal.
+    """
+    payloads = analyze_trends.run([instrument_key], interval=interval, versions={instrument_key: version})
+    return payloads.get(instrument_key)
@@ -0,0 +1,222 @@
+# ============================================
+# FILE: app/tasks/trading_calendar.py
+# PURPOSE: NSE trading calendar (sessions, minute-bar index, F&O expiries) from a local holiday file
+# ============================================
+#
+# Everything is precomputed once per process from NSE_HOLIDAY_FILE:
+#   - the session list plus a {date: position} index for every calendar day, so
+#     is_session / previous_session / next_session are dict lookups;
+#   - weekly expiries (EXPIRY_WEEKDAY, moved to the previous session when that
+#     day is a holiday) and monthly expiries (the last weekly expiry of the month),
+#     with a {date: next expiry} index for O(1) next_expiry;
+#   - the 09:15-15:30 minute grid, so session_minute_index is arithmetic.
+# Years without holidays in the file (e.g. the current year before its NSE
+# circular is added) fall back to "every weekday is a session"; load_calendar
+# warns loudly when that is the case for the current year.
+
+import json
+import os
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+import numpy as np
+import pytz
+
+# --- CONFIG ---
+NSE_HOLIDAY_FILE = os.getenv("NSE_HOLIDAY_FILE", os.path.join(os.path.dirname(__file__), "nse_holidays.json"))
+EXPIRY_WEEKDAY = int(os.getenv("NIFTY_EXPIRY_WEEKDAY", "1"))   # 0=Mon ... 1=Tue (Nifty weekly expiry)
+SESSION_OPEN = (9, 15)
+SESSION_CLOSE = (15, 30)
+SESSION_MINUTES = (SESSION_CLOSE[0] - SESSION_OPEN[0]) * 60 + SESSION_CLOSE[1] - SESSION_OPEN[1]   # 375
+
+IST = pytz.timezone("Asia/Kolkata")
+
+
+class TradingCalendar:
+    """Sessions and expiries of [start_year, end_year], indexed for O(1) lookups."""
+
+    def __init__(self, holidays, start_year, end_year, expiry_weekday=EXPIRY_WEEKDAY):
+        self.holidays = dict(holidays)
+        self.expiry_weekday = expiry_weekday
+        self.start = date(start_year, 1, 1)
+        self.end = date(end_year, 12, 31)
+
+        days = [self.start + timedelta(days=i) for i in range((self.end - self.start).days + 1)]
+        self.sessions = [d for d in days if d.weekday() < 5 and d not in self.holidays]
+        self._position = {}     # calendar day -> index of the first session on or after it
+        i = 0
+        for d in days:
+            while i < len(self.sessions) and self.sessions[i] < d:
+                i += 1
+            self._position[d] = i
+        self._session_set = set(self.sessions)
+
+        # Weekly expiry: the EXPIRY_WEEKDAY of each week, or the session before it on a holiday
+        weekly = []
+        for d in days:
+            if d.weekday() == expiry_weekday:
+                expiry = d if d in self._session_set else self._previous_in_range(d)
+                if expiry is not None and (not weekly or expiry > weekly[-1]):
+                    weekly.append(expiry)
+        self.weekly_expiries = weekly
+        self.monthly_expiries = [e for i, e in enumerate(weekly)
+                                 if i + 1 == len(weekly) or weekly[i + 1].month != e.month]
+        self._next_weekly = self._next_index(days, self.weekly_expiries)
+        self._next_monthly = self._next_index(days, self.monthly_expiries)
+
+    @staticmethod
+    def _next_index(days, expiries):
+        """{calendar day: first expiry on or after it}."""
+        index, i = {}, 0
+        for d in days:
+            while i < len(expiries) and expiries[i] < d:
+                i += 1
+            if i < len(expiries):
+                index[d] = expiries[i]
+        return index
+
+    def _previous_in_range(self, day):
+        i = self._position.get(day)
+        return self.sessions[i - 1] if i else None
+
+    def covers(self, day):
+        return self.start <= day <= self.end
+
+    # --- Sessions ---
+    def is_session(self, day):
+        if not self.covers(day):
+            return day.weekday() < 5
+        return day in self._session_set
+
+    def previous_session(self, day):
+        """The last session strictly before `day`."""
+        previous = self._previous_in_range(day) if self.covers(day) else None
+        if previous is not None:
+            return previous
+        day -= timedelta(days=1)
+        while not self.is_session(day):
+            day -= timedelta(days=1)
+        return day
+
+    def next_session(self, day):
+        """The first session strictly after `day`."""
+        following = day + timedelta(days=1)
+        if self.covers(following):
+            i = self._position[following]
+            if i < len(self.sessions):
+                return self.sessions[i]
+        while not self.is_session(following):
+            following += timedelta(days=1)
+        return following
+
+    def sessions_between(self, start, end):
+        """Sessions with start <= day <= end."""
+        if self.covers(start) and self.covers(end):
+            return self.sessions[self._position[start]:bisect_right(self.sessions, end)]
+        days, day = [], start
+        while day <= end:
+            if self.is_session(day):
+                days.append(day)
+            day += timedelta(days=1)
+        return days
+
+    # --- Expiries ---
+    def next_expiry(self, day, monthly=False, include_today=True):
+        """First weekly (or monthly) expiry on or after `day` (strictly after with include_today=False)."""
+        if not include_today:
+            day += timedelta(days=1)
+        index = self._next_monthly if monthly else self._next_weekly
+        if day in index:
+            return index[day]
+        # Past the precomputed range: plain weekday rule (no holiday adjustment)
+        while day.weekday() != self.expiry_weekday or not self.is_session(day):
+            day += timedelta(days=1)
+        if monthly:
+            while (day + timedelta(days=7)).month == day.month:
+                day += timedelta(days=7)
+        return day
+
+
+def load_calendar(path=NSE_HOLIDAY_FILE, year=None):
+    """Build the calendar for the years in the holiday file plus `year` (default: the current IST year)."""
+    year = year or datetime.now(IST).year
+    holidays = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            holidays = {date.fromisoformat(d): name for d, name in json.load(f).get("holidays", {}).items()}
+    except Exception as e:
+        print(f"⚠️ Trading calendar: could not load {path} ({e}); only weekends are skipped.")
+    years = {d.year for d in holidays}
+    if year not in years:
+        print(f"⚠️ Trading calendar: NO NSE HOLIDAYS FOR {year} in {path}; every weekday of {year} is "
+              f"treated as a session, so backfill and expiries will expect bars on holidays. "
+              f"Add {year} from the NSE holiday circular.")
+    years.add(year)
+    return TradingCalendar(holidays, min(years), max(years))
+
+
+_calendar = None
+
+
+def get_calendar():
+    global _calendar
+    if _calendar is None:
+        _calendar = load_calendar()
+    return _calendar
+
+
+def _as_date(day):
+    if day is None:
+        return datetime.now(IST).date()
+    return day.date() if isinstance(day, datetime) else day
+
+
+# --- Module-level lookups (the default calendar) ---
+def is_session(day=None):
+    return get_calendar().is_session(_as_date(day))
+
+
+def previous_session(day=None):
+    return get_calendar().previous_session(_as_date(day))
+
+
+def next_session(day=None):
+    return get_calendar().next_session(_as_date(day))
+
+
+def sessions_between(start, end):
+    return get_calendar().sessions_between(_as_date(start), _as_date(end))
+
+
+def next_expiry(day=None, monthly=False, include_today=True):
+    return get_calendar().next_expiry(_as_date(day), monthly=monthly, include_today=include_today)
+
+
+def session_open_ms(day):
+    """Epoch ms of 09:15 IST on `day`."""
+    opening = IST.localize(datetime.combine(_as_date(day), datetime.min.time()).replace(
+        hour=SESSION_OPEN[0], minute=SESSION_OPEN[1]))
+    return int(opening.timestamp() * 1000)
+
+
+def session_minute_index(ts):
+    """
+    Minute of the session (0 = 09:15 bar ... 374 = 15:29 bar) for an epoch-ms value or a
+    datetime; None outside market hours or on a non-session day.
+    """
+    when = ts.astimezone(IST) if isinstance(ts, datetime) else datetime.fromtimestamp(ts / 1000, IST)
+    index = (when.hour - SESSION_OPEN[0]) * 60 + when.minute - SESSION_OPEN[1]
+    if not 0 <= index < SESSION_MINUTES or not is_session(when.date()):
+        return None
+    return index
+
+
+@lru_cache(maxsize=64)
+def session_minutes(day):
+    """Epoch-ms start of every 1m bar of the session on `day` (empty on a non-session day)."""
+    minutes = np.zeros(0, dtype="<i8")
+    if is_session(day):
+        minutes = session_open_ms(day) + np.arange(SESSION_MINUTES, dtype="<i8") * 60_000
+    minutes.setflags(write=False)   # shared between callers through the cache
+    return minutes
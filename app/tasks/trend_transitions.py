@@ -0,0 +1,157 @@
+# ============================================
+# FILE: app/tasks/trend_transitions.py
+# PURPOSE: Record trend signal flips (NEUTRAL -> CALL BUY, ...) as events + audit log
+# ============================================
+#
+# The trend_signal:* cache keys only hold the current signal for 120s. Here every
+# change of signal per instrument/interval is:
+#   - appended to the Redis Stream TREND_TRANSITIONS_STREAM, so consumers can
+#     block on XREAD for the next flip instead of polling the cache, and
+#   - appended as one JSON line to a day file under TREND_LOG_DIR (the audit trail).
+# Each entry carries the inputs (LTP, SMAs, bar version) at the moment of the flip.
+# The last signal per series lives in the TREND_LAST_SIGNAL_KEY hash (no TTL),
+# so flips are detected across runs and worker restarts. The compare, the hash
+# update and the XADD of one series run in one script, so two workers evaluating
+# the same series never both record (or both miss) a flip.
+
+import json
+import os
+from datetime import datetime
+
+import pytz
+
+from app.tasks.utils import redis_client
+
+# --- CONFIG ---
+TREND_TRANSITIONS_STREAM = "trend:transitions"
+TREND_LAST_SIGNAL_KEY = "trend:last_signal"      # hash: "<key>:<interval>" -> signal
+TREND_STREAM_MAXLEN = int(os.getenv("TREND_STREAM_MAXLEN", "100000"))
+TREND_LOG_DIR = os.getenv("TREND_LOG_DIR", os.path.join("data", "trend_transitions"))
+INPUT_FIELDS = ("ltp", "sma_10", "sma_25", "sma_50", "sma_100", "version")
+
+IST = pytz.timezone("Asia/Kolkata")
+
+# KEYS: last-signal hash, stream; ARGV: series field, new signal, maxlen, then the
+# entry's field/value pairs. Returns the previous signal ('' for none), or false
+# when the series already holds the new signal.
+RECORD_SCRIPT = """
+local before = redis.call('HGET', KEYS[1], ARGV[1]) or ''
+if before == ARGV[2] then return false end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[3], '*', 'from', before, unpack(ARGV, 4))
+return before
+"""
+
+
+def _series(instrument_key, interval):
+    return f"{instrument_key}:{interval}"
+
+
+def _decode(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def append_transition_log(transitions, directory=TREND_LOG_DIR):
+    """Append transitions as JSON lines to <directory>/YYYY-MM-DD.jsonl (IST day of the flip)."""
+    if not transitions:
+        return
+    os.makedirs(directory, exist_ok=True)
+    by_day = {}
+    for t in transitions:
+        by_day.setdefault(t["at"][:10], []).append(json.dumps(t, separators=(",", ":")) + "\n")
+    for day, lines in by_day.items():
+        # One write per day file in append mode: concurrent workers never interleave a line
+        with open(os.path.join(directory, f"{day}.jsonl"), "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def record_transitions(payloads, interval="1m", client=None, log_dir=TREND_LOG_DIR):
+    """
+    Compare {instrument_key: trend payload} with the last known signals and record the flips.
+    Returns the transitions (dicts), oldest series first; unchanged signals cost one HMGET,
+    changed ones are compared again and recorded atomically per instrument/interval.
+    """
+    client = client or redis_client
+    keys = list(payloads)
+    if not keys:
+        return []
+    previous = client.hmget(TREND_LAST_SIGNAL_KEY, [_series(k, interval) for k in keys])
+
+    at = datetime.now(IST).isoformat(timespec="seconds")
+    candidates = []
+    for key, before in zip(keys, previous):
+        payload = payloads[key]
+        if _decode(before) == payload["signal"]:
+            continue
+        transition = {"instrument": key, "interval": interval, "from": None, "to": payload["signal"], "at": at}
+        transition.update({f: payload.get(f) for f in INPUT_FIELDS})
+        candidates.append(transition)
+    if not candidates:
+        return []
+
+    record = client.register_script(RECORD_SCRIPT)
+    pipe = client.pipeline(transaction=False)
+    for t in candidates:
+        fields = [x for k, v in t.items() if k != "from" for x in (k, "" if v is None else str(v))]
+        record(keys=[TREND_LAST_SIGNAL_KEY, TREND_TRANSITIONS_STREAM],
+               args=[_series(t["instrument"], interval), t["to"], TREND_STREAM_MAXLEN] + fields, client=pipe)
+
+    transitions = []
+    for t, before in zip(candidates, pipe.execute()):
+        if before is None:   # another worker recorded this flip first
+            continue
+        t["from"] = _decode(before) or None
+        transitions.append(t)
+    if not transitions:
+        return []
+
+    try:
+        append_transition_log(transitions, log_dir)
+    except Exception as e:
+        print(f"[TREND] ⚠️ Failed to write transition log: {e}")
+    return transitions
+
+
+def _parse_entry(entry_id, fields):
+    transition = {_decode(k): _decode(v) for k, v in fields.items()}
+    for name in INPUT_FIELDS:
+        value = transition.get(name)
+        transition[name] = None if value in (None, "") else (int(value) if name == "version" else float(value))
+    if transition.get("from") == "":
+        transition["from"] = None
+    transition["id"] = _decode(entry_id)
+    return transition
+
+
+def wait_for_transitions(last_id="$", block_ms=5000, count=100, client=None):
+    """
+    Block until transitions newer than `last_id` arrive (or `block_ms` passes).
+    Returns (transitions, last_id); pass last_id back in to continue without gaps.
+    """
+    client = client or redis_client
+    response = client.xread({TREND_TRANSITIONS_STREAM: last_id}, count=count, block=block_ms)
+    transitions = []
+    for _stream, entries in response or []:
+        for entry_id, fields in entries:
+            transitions.append(_parse_entry(entry_id, fields))
+            last_id = _decode(entry_id)
+    return transitions, last_id
+
+
+def read_transitions(instrument_key=None, interval=None, count=100, client=None):
+    """The newest `count` recorded transitions (optionally for one series), oldest first."""
+    client = client or redis_client
+    transitions = []
+    limit = count if instrument_key is None and interval is None else None
+    for entry_id, fields in client.xrevrange(TREND_TRANSITIONS_STREAM, count=limit):
+        transition = _parse_entry(entry_id, fields)
+        if instrument_key is not None and transition["instrument"] != instrument_key:
+            continue
+        if interval is not None and transition["interval"] != interval:
+            continue
+        transitions.append(transition)
+        if len(transitions) >= count:
+            break
+    return transitions[::-1]
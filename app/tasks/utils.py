@@ -5,20 +5,23 @@ import requests
 import certifi
 import redis, json 
 import pandas as pd 
-from datetime import date, datetime, timedelta, time
+from datetime import date, time
 from dotenv import load_dotenv
 from cryptography.fernet import Fernet
 # --- Import the core extensions for shared tasks ---
 from app.extensions import celery_app, cache # Note: No need for redis import here
 # --------------------------------------------------
 
-redis_client = redis.Redis(host="127.0.0.1", port=6379, db=0)
 # --- Configuration & Key Prefixes ---
 load_dotenv()
+# REDIS_DB=1 points a worker at the replay database (app/tasks/streamer/replay.py)
+redis_client = redis.Redis(host="127.0.0.1", port=6379, db=int(os.getenv("REDIS_DB", "0")))
 # Note: REDIS_URL and redis_client are removed as we use the Flask-Cache 'cache' instance.
 
 # --- CRITICAL FIX: Use the exact key prefix from the working streamer ---
 LTP_KEY_PREFIX = "LTP:" 
+# Epoch ms of the frame being replayed; only ever set in the replay database
+REPLAY_CLOCK_KEY = "replay:clock_ms"
 # -----------------------------------------------------------------------
 
 OWNER_USER_ID = os.environ.get('OWNER_USER_ID', 'GLOBAL_TRADER') # Read Owner ID from .env
@@ -146,41 +149,172 @@ def get_live_ltp(symbol: str):
 
     return None
 
+def get_live_ltps(symbols):
+    """{symbol: float LTP or None} for many symbols in one MGET round-trip."""
+    symbols = list(symbols)
+    if not symbols:
+        return {}
+    result = {}
+    for symbol, data in zip(symbols, redis_client.mget([f"{LTP_KEY_PREFIX}{s}" for s in symbols])):
+        try:
+            result[symbol] = float(json.loads(data)["ltp"]) if data else None
+        except Exception as e:
+            print(f"Error parsing LTP for {symbol}: {e} Data: {data}")
+            result[symbol] = None
+    return result
+
+# --- STREAMER SUBSCRIPTION REQUESTS ---
+# Producers (option chain, order manager) register the instruments they need
+# under an owner name. The streamer polls these keys and keeps the live socket
+# subscribed to the union of all owners (reference counted per instrument).
+SUBSCRIPTION_OWNERS_KEY = "streamer:sub_owners"
+SUBSCRIPTION_KEY_PREFIX = "streamer:sub:"
+
+def request_subscription(owner: str, instrument_keys, timeout: int = 86400, mode: str = "ltpc"):
+    """Ask the streamer to keep `instrument_keys` subscribed on behalf of `owner`.
+
+    mode: "ltpc" (price only), "option_greeks" or "full" (depth, OHLC, OI, IV, greeks).
+    """
+    keys = sorted({k for k in instrument_keys if k})
+    try:
+        pipe = redis_client.pipeline()
+        pipe.sadd(SUBSCRIPTION_OWNERS_KEY, owner)
+        pipe.setex(f"{SUBSCRIPTION_KEY_PREFIX}{owner}", timeout, json.dumps({"mode": mode, "keys": keys}))
+        pipe.execute()
+    except Exception as e:
+        print(f"[SUBSCRIPTION] ⚠️ Failed to register {owner}: {e}")
+
+def release_subscription(owner: str):
+    """Drop every instrument requested by `owner` (streamer unsubscribes unused keys)."""
+    try:
+        pipe = redis_client.pipeline()
+        pipe.srem(SUBSCRIPTION_OWNERS_KEY, owner)
+        pipe.delete(f"{SUBSCRIPTION_KEY_PREFIX}{owner}")
+        pipe.execute()
+    except Exception as e:
+        print(f"[SUBSCRIPTION] ⚠️ Failed to release {owner}: {e}")
+
+# --- LIVE TICK FAN-OUT ---
+# The streamer publishes conflated {"ts": ms, "ticks": {instrument: {"ltp", "cp"}}}
+# batches here; the web tier relays them to browsers (app/market_bridge.py).
+TICK_CHANNEL = "ticks:ltp"
+
+# --- FULL-MODE SNAPSHOTS (depth / OHLC / OI / IV / greeks) ---
+def snapshot_key(instrument_key: str):
+    """Redis hash of numeric fields written by the streamer for full / option_greeks feeds."""
+    return f"snapshot:{instrument_key}"
+
+def get_market_snapshots(instrument_keys, fields=None):
+    """
+    Bulk read of streamer snapshots in one round-trip.
+    Returns {instrument_key: {field: float}}; instruments without a snapshot are omitted.
+    `fields` limits the read to e.g. ("ltp", "iv", "delta").
+    """
+    instrument_keys = list(instrument_keys)
+    if not instrument_keys:
+        return {}
+    try:
+        pipe = redis_client.pipeline()
+        for key in instrument_keys:
+            if fields:
+                pipe.hmget(snapshot_key(key), list(fields))
+            else:
+                pipe.hgetall(snapshot_key(key))
+        results = pipe.execute()
+    except Exception as e:
+        print(f"[SNAPSHOT] ⚠️ Failed to read snapshots: {e}")
+        return {}
+
+    snapshots = {}
+    for key, raw in zip(instrument_keys, results):
+        if fields:
+            raw = {f: v for f, v in zip(fields, raw) if v is not None}
+        if not raw:
+            continue
+        snapshots[key] = {
+            (f.decode("utf-8") if isinstance(f, bytes) else f): float(v)
+            for f, v in raw.items()
+        }
+    return snapshots
+
+# --- LIVE BARS (built by the streamer from every tick) ---
+def bar_stream_key(instrument_key: str, interval: str = "1m"):
+    """Redis Stream holding one entry per CLOSED bar."""
+    return f"bars:{instrument_key}:{interval}"
+
+def forming_bar_key(instrument_key: str, interval: str = "1m"):
+    """Redis hash holding the bar that is still forming."""
+    return f"bar_forming:{instrument_key}:{interval}"
+
+def _decode_bar_fields(fields):
+    bar = {}
+    for k, v in fields.items():
+        k = k.decode("utf-8") if isinstance(k, bytes) else k
+        v = v.decode("utf-8") if isinstance(v, bytes) else v
+        bar[k] = int(v) if k in ("ts", "volume", "ticks", "closed", "backfilled") else float(v)
+    return bar
+
+def read_closed_bars(instrument_key: str, interval: str = "1m", after_id: str = "-", count=None):
+    """Return [(stream_id, bar_dict)] of closed bars after `after_id` (exclusive)."""
+    start = "-" if after_id in ("-", "0", None) else f"({after_id}"
+    try:
+        entries = redis_client.xrange(bar_stream_key(instrument_key, interval), min=start, max="+", count=count)
+    except Exception as e:
+        print(f"[BARS] ⚠️ Failed to read closed bars for {instrument_key}: {e}")
+        return []
+    return [
+        (entry_id.decode("utf-8") if isinstance(entry_id, bytes) else entry_id, _decode_bar_fields(fields))
+        for entry_id, fields in entries
+    ]
+
+def get_forming_bar(instrument_key: str, interval: str = "1m"):
+    """Return the forming bar dict (ts in epoch ms) or None."""
+    try:
+        fields = redis_client.hgetall(forming_bar_key(instrument_key, interval))
+    except Exception as e:
+        print(f"[BARS] ⚠️ Failed to read forming bar for {instrument_key}: {e}")
+        return None
+    return _decode_bar_fields(fields) if fields else None
+
+def replay_clock_ms():
+    """Recorded time of a running replay (epoch ms), or None on live data."""
+    try:
+        value = redis_client.get(REPLAY_CLOCK_KEY)
+    except Exception:
+        return None
+    return int(value) if value else None
+
 def get_cached_historical_data(instrument_key: str):
     """
-    Retrieves cached historical data. (Used by T7: calculate_sma_for_closed_bar)
+    Retrieves cached historical data as a list of row dicts (ISO timestamps).
     """
+    from app.tasks.candle_codec import decode_candles, is_encoded
+
     try:
         # --- CRITICAL FIX: Use Flask-Cache (cache) and the correct key ---
         cache_key = f"historical_data:{instrument_key}" # Key from task_1_fetch_hist
         cached_data = cache.get(cache_key) 
         
         if cached_data:
-            # Data is a JSON string saved by task_1_fetch_hist
-            data = json.loads(cached_data)
-            return data
+            if is_encoded(cached_data):
+                # Binary columnar frame saved by task_1_fetch_hist
+                df = decode_candles(cached_data)
+                df["timestamp"] = df["timestamp"].map(lambda ts: ts.isoformat())
+                return df.to_dict(orient="records")
+            return json.loads(cached_data)
         return None
     except Exception as e:
         print(f"[CACHE ERROR] get_cached_historical_data failed: {e}")
         return None
 
 def get_next_tuesday():
-    """Gets the upcoming Tuesday expiry date (Tuesday is weekday 1)."""
-    today = datetime.now()
-    # Calculate days to next Tuesday (1)
-    days_ahead = (1 - today.weekday() + 7) % 7 
-    # If today is Tuesday, days_ahead is 0. If you want the NEXT Tuesday, add a check.
-    if days_ahead == 0:
-        days_ahead = 7
-        
-    return today.date() + timedelta(days=days_ahead)
+    """Gets the next weekly expiry after today (Tuesday, or the session before it on a holiday)."""
+    from app.tasks.trading_calendar import next_expiry
+    return next_expiry(include_today=False)
 
 def get_previous_working_day(date_today):
-    """Gets the previous working day, skipping weekends."""
-    prev_day = date_today - timedelta(days=1)
-    # 5=Saturday, 6=Sunday
-    while prev_day.weekday() >= 5: 
-        prev_day -= timedelta(days=1)
-    return prev_day
+    """Gets the previous NSE session, skipping weekends and exchange holidays."""
+    from app.tasks.trading_calendar import previous_session
+    return previous_session(date_today)
 
 # --- REMOVED: merge_live_ltp_with_historical (Logic moved to task_merge.py) ---
\ No newline at end of file
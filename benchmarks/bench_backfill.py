@@ -0,0 +1,93 @@
+# benchmarks/bench_backfill.py
+# PURPOSE: Simulate a watchlist backfill against a fake HistoryV3Api with a fixed
+#          per-call latency and random 429s: serial calls vs the rate-limited pool,
+#          then a resumed run that must not fetch anything again.
+#
+# Run from the repo root:  python -m benchmarks.bench_backfill [instruments] [days] [latency_ms]
+
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from app.tasks import history_backfill as hb
+from app.tasks.candle_archive import read_archive
+
+THROTTLE_RATE = 0.05   # share of calls answered with 429
+
+
+class TooManyRequests(Exception):
+    status = 429
+    body = "Too Many Requests"
+
+
+class FakeHistoryApi:
+    """Answers like get_historical_candle_data1 (newest first), sleeping `latency` per call."""
+
+    def __init__(self, latency, throttle_rate=THROTTLE_RATE, seed=0):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.payloads = {}   # (from, to) -> rows, built once so the benchmark times the client side
+
+    def get_historical_candle_data1(self, instrument_key, unit, interval, to_date, from_date):
+        time.sleep(self.latency)
+        with self.lock:
+            self.calls += 1
+            if self.random.random() < self.throttle_rate:
+                raise TooManyRequests()
+            rows = self.payloads.get((from_date, to_date))
+        if rows is None:
+            rows = self._rows(from_date, to_date)
+            with self.lock:
+                self.payloads[(from_date, to_date)] = rows
+        return type("Response", (), {"data": type("Data", (), {"candles": rows})()})()
+
+    @staticmethod
+    def _rows(from_date, to_date):
+        rows = []
+        for day in reversed(hb.session_days(date.fromisoformat(from_date), date.fromisoformat(to_date))):
+            open_time = datetime.combine(day, datetime.min.time()) + timedelta(hours=9, minutes=15)
+            for minute in range(374, -1, -1):
+                stamp = (open_time + timedelta(minutes=minute)).strftime("%Y-%m-%dT%H:%M:%S+05:30")
+                rows.append([stamp, 100.0, 101.0, 99.0, 100.5, 0, 0])
+        return rows
+
+
+def main():
+    instruments = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 365
+    latency = (float(sys.argv[3]) if len(sys.argv) > 3 else 300) / 1000
+    keys = [f"NSE_EQ|BENCH{i:03d}" for i in range(instruments)]
+    end = hb.last_complete_day() - timedelta(days=1)
+    start = end - timedelta(days=days)
+    hb.HISTORY_BACKOFF_SECONDS = 0.05
+
+    requests = sum(len(hb.day_ranges(hb.session_days(start, end))) for _ in keys)
+    serial_s = requests * latency
+    print(f"{instruments} instrument(s) x {days} day(s): {requests} request(s) at {latency * 1000:.0f} ms")
+    print(f"  serial (one blocking call after another): ~{serial_s:8.1f} s (estimated)")
+
+    directory = tempfile.mkdtemp()
+    api = FakeHistoryApi(latency)
+    started = time.perf_counter()
+    summaries = hb.backfill_many(keys, start, end, api, directory=directory, workers=hb.HISTORY_WORKERS)
+    pooled_s = time.perf_counter() - started
+    failed = sum(len(s["failed"]) for s in summaries.values())
+    print(f"  pooled ({hb.HISTORY_WORKERS} workers, {hb.HISTORY_RATE_LIMITS}): {pooled_s:8.1f} s, "
+          f"{api.calls} call(s) incl. retries, {failed} failed range(s)")
+    print(f"  Speed-up: {serial_s / pooled_s:,.1f}x")
+
+    calls = api.calls
+    hb.backfill_many(keys, start, end, api, directory=directory)
+    print(f"  resumed run: {api.calls - calls} new call(s)")
+    bars = len(read_archive(keys[0], directory=directory))
+    print(f"  {keys[0]}: {bars} candles on disk")
+
+
+if __name__ == "__main__":
+    main()
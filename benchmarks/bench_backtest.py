@@ -0,0 +1,106 @@
+# benchmarks/bench_backtest.py
+# PURPOSE: Time the vectorized backtester on a month of 1m bars and check it
+#          trade-for-trade against a bar-by-bar replay of the live rules.
+#
+# Run from the repo root:  python -m benchmarks.bench_backtest [days] [seed]
+
+import sys
+import time
+
+import numpy as np
+
+from app.tasks.backtest import (
+    ENTRY_START_MINUTE, OPTION_DELTA, SQUARE_OFF_MINUTE, STOPLOSS_POINTS, TARGET_POINTS, backtest,
+)
+from app.tasks.candle_archive import DAY_MS, IST_OFFSET_MS
+from app.tasks.candle_store import CANDLE_DTYPE
+from app.tasks.indicators import SMAEngine
+
+SESSION_OPEN_MS = 13_500_000   # 09:15 IST as ms after 00:00 UTC
+
+
+def synthetic_month(days, seed):
+    """`days` sessions of 375 1m bars; the random walk trends so the SMA stack fires."""
+    rng = np.random.default_rng(seed)
+    day_numbers = [d for d in range(19_000, 19_000 + days * 2) if (d + 3) % 7 < 5][:days]
+    ts = (np.asarray(day_numbers, dtype="<i8")[:, None] * DAY_MS + SESSION_OPEN_MS
+          + np.arange(375, dtype="<i8") * 60_000).ravel()
+    drift = np.repeat(rng.normal(0, 1.5, len(ts) // 25 + 1), 25)[:len(ts)]
+    close = 24_000 + np.cumsum(drift + rng.normal(0, 6, len(ts)))
+    records = np.zeros(len(ts), dtype=CANDLE_DTYPE)
+    records["ts"] = ts
+    records["open"] = np.r_[close[0], close[:-1]] + rng.normal(0, 1, len(ts))
+    records["high"] = np.maximum(records["open"], close) + rng.exponential(4, len(ts))
+    records["low"] = np.minimum(records["open"], close) - rng.exponential(4, len(ts))
+    records["close"] = close
+    return records
+
+
+def reference(records, stoploss=STOPLOSS_POINTS, target=TARGET_POINTS, delta=OPTION_DELTA):
+    """Bar-by-bar replay: SMAEngine + decide_and_execute_trade / manage_active_trade rules."""
+    engine = SMAEngine()
+    trades, position = [], None
+    for i, bar in enumerate(records):
+        minute = (int(bar["ts"]) + IST_OFFSET_MS) % DAY_MS // 60_000
+        if position is not None:
+            side, entry, day = position
+            if day != (int(bar["ts"]) + IST_OFFSET_MS) // DAY_MS:
+                trades.append((side, "DAY_END", delta * side * (records["close"][i - 1] - entry)))
+                position = None
+            elif minute >= SQUARE_OFF_MINUTE:
+                trades.append((side, "SQUARE_OFF", delta * side * (bar["open"] - entry)))
+                position = None
+            else:
+                low, high = (bar["low"], bar["high"]) if side > 0 else (bar["high"], bar["low"])
+                if delta * side * (low - entry) <= -stoploss:
+                    trades.append((side, "STOPLOSS", min(-stoploss, delta * side * (bar["open"] - entry))))
+                    position = None
+                elif delta * side * (high - entry) >= target:
+                    trades.append((side, "TARGET", max(target, delta * side * (bar["open"] - entry))))
+                    position = None
+
+        values = engine.update(float(bar["close"]))
+        smas = [values.get(f"sma_{p}") for p in engine.periods]
+        decided = minute + 1
+        if position is None and None not in smas and ENTRY_START_MINUTE <= decided <= SQUARE_OFF_MINUTE:
+            ltp, s10, rest = float(bar["close"]), smas[0], smas[1:]
+            if ltp > max(smas) and all(s10 > s for s in rest):
+                position = (1, ltp, (int(bar["ts"]) + IST_OFFSET_MS) // DAY_MS)
+            elif ltp < min(smas) and all(s10 < s for s in rest):
+                position = (-1, ltp, (int(bar["ts"]) + IST_OFFSET_MS) // DAY_MS)
+    if position is not None:
+        trades.append((position[0], "DAY_END", delta * position[0] * (records["close"][-1] - position[1])))
+    return trades
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 22
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 11
+    records = synthetic_month(days, seed)
+
+    backtest(records[:500])   # warm imports / first-call overhead
+    repeat = 10
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = backtest(records)
+    vector_ms = (time.perf_counter() - started) / repeat * 1000.0
+
+    started = time.perf_counter()
+    expected = reference(records)
+    loop_ms = (time.perf_counter() - started) * 1000.0
+
+    trades = result["trades"]
+    got = list(zip(np.where(trades["side"] == "CALL", 1, -1), trades["reason"], trades["pnl"]))
+    same = len(got) == len(expected) and all(
+        a[0] == b[0] and a[1] == b[1] and abs(a[2] - b[2]) < 1e-6 for a, b in zip(got, expected))
+
+    print(f"{len(records):,} bars ({days} sessions)")
+    print(f"vectorized backtest: {vector_ms:8.1f} ms")
+    print(f"bar-by-bar replay:   {loop_ms:8.1f} ms")
+    print(f"trades match the replay: {same} ({len(got)} vs {len(expected)})")
+    for name, value in result["summary"].items():
+        print(f"  {name}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# benchmarks/bench_codec.py
+# PURPOSE: Compare the binary columnar candle codec with to_json(orient="records"),
+#          and vectorized tz normalization with the per-row apply() it replaces.
+#
+# Run from the repo root:  python -m benchmarks.bench_codec [csv_path] [scale]
+
+import glob
+import json
+import sys
+import time
+
+import pandas as pd
+import pytz
+
+from app.tasks.candle_codec import decode_candles, encode_candles, normalize_timestamps
+
+IST = pytz.timezone("Asia/Kolkata")
+
+
+def localize_or_convert_to_ist(ts, ist):
+    """The per-row helper merge_hist_live used before the codec."""
+    if pd.isna(ts):
+        return ts
+    if ts.tzinfo is None or ts.tzinfo.utcoffset(ts) is None:
+        return ts.tz_localize(ist)
+    elif ts.tzinfo != ist:
+        return ts.tz_convert(ist)
+    return ts
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - started) / repeat * 1000.0, result
+
+
+def load_frame(path, scale):
+    df = pd.read_csv(path)
+    if scale > 1:
+        # Extend the series by shifting copies forward in time
+        step = pd.Timedelta(minutes=len(df))
+        ts = pd.to_datetime(df["timestamp"])
+        df = pd.concat(
+            [df.assign(timestamp=(ts + step * i).map(lambda t: t.isoformat())) for i in range(scale)],
+            ignore_index=True,
+        )
+    return df
+
+
+def main():
+    paths = [sys.argv[1]] if len(sys.argv) > 1 else sorted(glob.glob("data/merged_data_*.csv"))
+    scale = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    repeat = 5
+    if not paths:
+        print("No data/merged_data_*.csv files found.")
+        return
+
+    for path in paths:
+        raw = load_frame(path, scale)
+        df = raw.copy()
+        df["timestamp"] = normalize_timestamps(df["timestamp"])
+        print(f"{path} x{scale}: {len(df)} rows")
+
+        # --- Timezone normalization ---
+        apply_ms, old_ts = timed(lambda: pd.to_datetime(raw["timestamp"], errors="coerce")
+                                 .apply(lambda ts: localize_or_convert_to_ist(ts, IST)), repeat)
+        vec_ms, new_ts = timed(lambda: normalize_timestamps(raw["timestamp"]), repeat)
+        assert (old_ts.map(lambda t: t.value) == new_ts.map(lambda t: t.value)).all()
+        print(f"  tz normalize   apply(): {apply_ms:8.2f} ms   vectorized: {vec_ms:8.2f} ms   ({apply_ms / vec_ms:.0f}x)")
+
+        # --- Serialization ---
+        json_enc_ms, payload_json = timed(lambda: df.to_json(orient="records", date_format="iso"), repeat)
+
+        def json_decode():
+            out = pd.DataFrame(json.loads(payload_json))
+            out["timestamp"] = pd.to_datetime(out["timestamp"], errors="coerce").apply(
+                lambda ts: localize_or_convert_to_ist(ts, IST))
+            return out
+
+        json_dec_ms, _ = timed(json_decode, repeat)
+        bin_enc_ms, payload_bin = timed(lambda: encode_candles(df), repeat)
+        bin_dec_ms, decoded = timed(lambda: decode_candles(payload_bin), repeat)
+        pd.testing.assert_frame_equal(decoded, df.astype({c: "float64" for c in df.columns if c != "timestamp"}),
+                                      check_dtype=False)
+
+        print(f"  to_json(records): encode {json_enc_ms:8.2f} ms  decode {json_dec_ms:8.2f} ms  size {len(payload_json):>10,} B")
+        print(f"  encode_candles  : encode {bin_enc_ms:8.2f} ms  decode {bin_dec_ms:8.2f} ms  size {len(payload_bin):>10,} B")
+        print(f"  Payload {len(payload_json) / len(payload_bin):.1f}x smaller, round-trip "
+              f"{(json_enc_ms + json_dec_ms) / (bin_enc_ms + bin_dec_ms):.0f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# benchmarks/bench_decode.py
+# PURPOSE: Compare the old decode path (ParseFromString + MessageToDict) with
+#          the direct field decoder used by the streamer hot loop.
+#
+# Run from the repo root:  python -m benchmarks.bench_decode [instruments] [frames]
+
+import sys
+import time
+
+from google.protobuf.json_format import MessageToDict
+
+from app.websocket.market_data_v3 import MarketDataFeedV3_pb2 as pb
+from app.tasks.streamer.decoder import decode_ticks
+
+
+def build_frames(num_instruments=50, num_frames=2000):
+    """Synthetic live_feed frames, each carrying an LTPC for every instrument."""
+    frames = []
+    for f in range(num_frames):
+        msg = pb.FeedResponse()
+        msg.type = pb.live_feed
+        msg.currentTs = 1_700_000_000_000 + f
+        for i in range(num_instruments):
+            feed = msg.feeds[f"NSE_FO|{40000 + i}"]
+            feed.ltpc.ltp = 100.0 + i + f * 0.05
+            feed.ltpc.ltt = 1_700_000_000_000 + f
+            feed.ltpc.ltq = 75
+            feed.ltpc.cp = 99.5 + i
+        frames.append(msg.SerializeToString())
+    return frames
+
+
+def old_path(frames):
+    ticks = 0
+    for buffer in frames:
+        feed_response = pb.FeedResponse()
+        feed_response.ParseFromString(buffer)
+        data_dict = MessageToDict(feed_response)
+        for instrument, info in data_dict.get("feeds", {}).items():
+            ltp = info.get("ltpc", {}).get("ltp")
+            if ltp:
+                ticks += 1
+    return ticks
+
+
+def new_path(frames):
+    ticks = 0
+    for buffer in frames:
+        ticks += len(decode_ticks(buffer))
+    return ticks
+
+
+def run(num_instruments=50, num_frames=2000):
+    frames = build_frames(num_instruments, num_frames)
+    results = {}
+    for name, fn in (("MessageToDict", old_path), ("decode_ticks", new_path)):
+        start = time.perf_counter()
+        ticks = fn(frames)
+        elapsed = time.perf_counter() - start
+        results[name] = ticks / elapsed
+        print(f"{name:>14}: {ticks} ticks in {elapsed:.3f}s -> {ticks / elapsed:,.0f} ticks/sec")
+
+    print(f"Speed-up: {results['decode_ticks'] / results['MessageToDict']:.1f}x")
+    return results
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    run(*args)
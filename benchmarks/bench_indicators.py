@@ -0,0 +1,151 @@
+# benchmarks/bench_indicators.py
+# PURPOSE: Cross-check the registry indicators against pandas references, check that
+#          a persist/restore half-way changes nothing, and time one update per bar.
+#
+# Run from the repo root:  python -m benchmarks.bench_indicators [csv_path] [repeat]
+
+import glob
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.tasks.candle_archive import DAY_MS, IST_OFFSET_MS
+from app.tasks.indicators import INDICATOR_REGISTRY, build_indicator
+
+TOLERANCE = 1e-6
+SPECS = [
+    {"name": "ema", "period": 20},
+    {"name": "rsi", "period": 14},
+    {"name": "atr", "period": 14},
+    {"name": "supertrend", "period": 10, "multiplier": 3},
+    {"name": "bollinger", "period": 20, "k": 2},
+    {"name": "macd", "fast": 12, "slow": 26, "signal": 9},
+    {"name": "vwap"},
+]
+
+
+def load_bars(path):
+    df = pd.read_csv(path)
+    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
+    df = df.sort_values("timestamp").reset_index(drop=True)
+    df["ts"] = df["timestamp"].astype("int64") // 1_000_000
+    if not df["volume"].any():
+        # Index candles carry no volume; use a fixed synthetic one so VWAP is exercised
+        df["volume"] = np.random.default_rng(0).integers(1, 1000, len(df)).astype(float)
+    return df
+
+
+def seeded_ewm(values, period, alpha):
+    """pandas ewm(adjust=False) seeded with the mean of the first `period` values."""
+    values = pd.Series(values, dtype=float).reset_index(drop=True)
+    out = pd.Series(np.nan, index=values.index)
+    if len(values) < period:
+        return out.to_numpy()
+    seeded = values.iloc[period - 1:].copy()
+    seeded.iloc[0] = values.iloc[:period].mean()
+    out.iloc[period - 1:] = seeded.ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    return out.to_numpy()
+
+
+def pandas_reference(df):
+    close, high, low = df["close"], df["high"], df["low"]
+    tr = pd.concat([high - low, (high - close.shift()).abs(), (low - close.shift()).abs()], axis=1).max(axis=1)
+
+    change = close.diff().iloc[1:]
+    avg_gain = seeded_ewm(change.clip(lower=0), 14, 1 / 14)
+    avg_loss = seeded_ewm((-change).clip(lower=0), 14, 1 / 14)
+    rsi = np.r_[np.nan, np.where(avg_loss == 0, 100.0, 100 - 100 / (1 + avg_gain / avg_loss))]
+
+    macd = seeded_ewm(close, 12, 2 / 13) - seeded_ewm(close, 26, 2 / 27)
+    signal = np.r_[np.full(25, np.nan), seeded_ewm(macd[25:], 9, 2 / 10)]
+
+    mid = close.rolling(20).mean()
+    std = close.rolling(20).std(ddof=0)
+    day = (df["ts"] + IST_OFFSET_MS) // DAY_MS
+    pv = ((high + low + close) / 3 * df["volume"]).groupby(day).cumsum()
+
+    return {
+        "ema": seeded_ewm(close, 20, 2 / 21),
+        "rsi": rsi,
+        "atr": seeded_ewm(tr, 14, 1 / 14),
+        "bollinger.upper": (mid + 2 * std).to_numpy(),
+        "bollinger.lower": (mid - 2 * std).to_numpy(),
+        "macd.macd": macd,
+        "macd.signal": signal,
+        "vwap": (pv / df["volume"].groupby(day).cumsum()).to_numpy(),
+    }
+
+
+def run_indicators(bars, restore_at=None):
+    indicators = [build_indicator(spec) for spec in SPECS]
+    out = {ind.name: [] for ind in indicators}
+    for i, bar in enumerate(bars):
+        if i == restore_at:
+            indicators = [type(ind).from_state(ind.params, ind.to_state()) for ind in indicators]
+        for ind in indicators:
+            ind.update(bar)
+            out[ind.name].append(ind.value())
+    return out
+
+
+def flatten(out):
+    flat = {}
+    for name, values in out.items():
+        if any(isinstance(v, dict) for v in values):
+            fields = next(v for v in values if isinstance(v, dict)).keys()
+            for field in fields:
+                flat[f"{name}.{field}"] = np.array(
+                    [np.nan if v is None or v[field] is None else v[field] for v in values], dtype=float)
+        else:
+            flat[name] = np.array([np.nan if v is None else v for v in values], dtype=float)
+    return flat
+
+
+def cross_check(df, bars):
+    actual = flatten(run_indicators(bars))
+    restored = flatten(run_indicators(bars, restore_at=len(bars) // 2))
+    for name in actual:
+        assert np.array_equal(actual[name], restored[name], equal_nan=True), f"{name}: state round-trip differs"
+
+    worst = 0.0
+    for name, expected in pandas_reference(df).items():
+        got = actual[name]
+        assert np.array_equal(np.isnan(expected), np.isnan(got)), f"{name}: warm-up mismatch"
+        worst = max(worst, float(np.nanmax(np.abs(expected - got))))
+    assert worst < TOLERANCE, f"max abs diff {worst} exceeds {TOLERANCE}"
+    return worst
+
+
+def bench(bars, repeat):
+    timings = {}
+    for spec in SPECS:
+        indicator = build_indicator(spec)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for bar in bars:
+                indicator.update(bar)
+        timings[indicator.spec_id] = (time.perf_counter() - started) / (repeat * len(bars)) * 1e6
+    return timings
+
+
+def main():
+    paths = [sys.argv[1]] if len(sys.argv) > 1 else sorted(glob.glob("data/merged_data_*.csv"))
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    if not paths:
+        print("No data/merged_data_*.csv files found.")
+        return
+
+    print(f"Registered indicators: {', '.join(sorted(INDICATOR_REGISTRY))}")
+    for path in paths:
+        df = load_bars(path)
+        bars = df[["ts", "open", "high", "low", "close", "volume"]].to_dict("records")
+        worst = cross_check(df, bars)
+        print(f"{path}: {len(bars)} bars, max |indicator - pandas| = {worst:.2e}")
+        for sid, us in bench(bars, repeat).items():
+            print(f"  {sid:<40} {us:6.2f} us/bar")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# benchmarks/bench_mmap.py
+# PURPOSE: Historical candle reads from the memory-mapped series vs the day files and
+#          the JSON-in-Redis payload, plus memory per reader process (private vs shared).
+#
+# Run from the repo root:  python -m benchmarks.bench_mmap [days] [readers]
+
+import json
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.tasks.candle_archive import append_archive, read_day_files
+from app.tasks.candle_mmap import _mapped, mapped_candles, series_path
+from app.tasks.candle_store import CANDLE_DTYPE, candles_to_frame
+
+KEY = "NSE_INDEX|Nifty 50"
+SESSION_OPEN_MS = 13_500_000   # 09:15 IST as ms after 00:00 UTC
+DAY_MS = 86_400_000
+
+
+def synthetic_series(days, start_day=19_000):
+    """`days` weekdays of 375 1m bars with a random-walk close."""
+    rng = np.random.default_rng(7)
+    day_numbers = [d for d in range(start_day, start_day + days * 2) if (d + 3) % 7 < 5][:days]
+    ts = (np.asarray(day_numbers, dtype="<i8")[:, None] * DAY_MS + SESSION_OPEN_MS
+          + np.arange(375, dtype="<i8") * 60_000).ravel()
+    records = np.zeros(len(ts), dtype=CANDLE_DTYPE)
+    close = 22_000 + np.cumsum(rng.normal(0, 4, len(ts)))
+    records["ts"] = ts
+    records["open"] = np.r_[close[0], close[:-1]]
+    records["high"] = np.maximum(records["open"], close) + 2
+    records["low"] = np.minimum(records["open"], close) - 2
+    records["close"] = close
+    records["volume"] = rng.integers(1_000, 50_000, len(ts))
+    return records
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - started) / repeat * 1000.0, result
+
+
+def memory_kb():
+    """(private, shared) resident kB of this process from /proc (Linux only)."""
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if rest.strip().endswith("kB"):
+                fields[name] = int(rest.split()[0])
+    return (fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+            fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0))
+
+
+def reader(mode, directory, barrier, queue):
+    _mapped.clear()   # map the file in this process, not the mapping inherited from the parent
+    before = memory_kb()
+    if mode == "mmap":
+        records = mapped_candles(KEY, "1m", directory=directory)
+    else:
+        records = read_day_files(KEY, "1m", directory=directory)
+    checksum = float(records["close"].sum())   # touch every page
+    barrier.wait()                             # every reader holds its history now
+    after = memory_kb()
+    queue.put((after[0] - before[0], after[1] - before[1], checksum))
+    barrier.wait()
+
+
+def memory_per_reader(mode, directory, readers):
+    ctx = mp.get_context("fork")
+    barrier, queue = ctx.Barrier(readers), ctx.Queue()
+    procs = [ctx.Process(target=reader, args=(mode, directory, barrier, queue)) for _ in range(readers)]
+    for p in procs:
+        p.start()
+    results = [queue.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return np.mean([r[0] for r in results]), np.mean([r[1] for r in results])
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 250
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    repeat = 20
+    records = synthetic_series(days)
+    directory = tempfile.mkdtemp(prefix="bench_mmap_")
+
+    started = time.perf_counter()
+    for day in np.split(records, days):   # one append per day, as the live archive does
+        append_archive(KEY, "1m", day, directory=directory)
+    print(f"{len(records):,} bars over {days} days, series file "
+          f"{os.path.getsize(series_path(KEY, '1m', directory)) / 1e6:.1f} MB "
+          f"(written in {time.perf_counter() - started:.2f}s)")
+
+    frame = candles_to_frame(records)
+    frame["timestamp"] = frame["timestamp"].map(lambda t: t.isoformat())
+    payload = frame.to_json(orient="records")
+
+    end_ms = int(records["ts"][-1]) + 60_000
+    cases = [
+        ("JSON payload -> DataFrame (full)", lambda: pd.DataFrame(json.loads(payload))),
+        ("day files -> array (full)", lambda: read_day_files(KEY, "1m", directory=directory)),
+        ("mapped series (full)", lambda: mapped_candles(KEY, "1m", directory=directory)),
+        ("day files, newest 100", lambda: read_day_files(KEY, "1m", end_ms=end_ms, count=100, directory=directory)),
+        ("mapped series, newest 100", lambda: mapped_candles(KEY, "1m", end_ms=end_ms, count=100,
+                                                              directory=directory)),
+    ]
+    print(f"\n{'read':<36}{'ms':>10}")
+    for name, fn in cases:
+        ms, result = timed(fn, repeat)
+        print(f"{name:<36}{ms:>10.3f}")
+    assert np.array_equal(mapped_candles(KEY, "1m", directory=directory), records)
+
+    if os.path.exists("/proc/self/smaps_rollup"):
+        print(f"\nmemory per reader with {readers} processes holding the full history:")
+        print(f"{'read':<16}{'private kB':>12}{'shared kB':>11}")
+        for mode in ("day files", "mmap"):
+            private, shared = memory_per_reader(mode, directory, readers)
+            print(f"{mode:<16}{private:>12.0f}{shared:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# benchmarks/bench_sma.py
+# PURPOSE: Cross-check the incremental SMA engine against pandas rolling().mean()
+#          and compare the per-bar cost of both on the recorded merged candles.
+#
+# Run from the repo root:  python -m benchmarks.bench_sma [csv_path] [repeat]
+
+import glob
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.tasks.indicators import SMAEngine, SMA_PERIODS
+
+TOLERANCE = 1e-6
+
+
+def load_closes(path):
+    df = pd.read_csv(path)
+    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
+    return df.sort_values("timestamp")["close"].astype(float).reset_index(drop=True)
+
+
+def pandas_smas(closes):
+    return {f"sma_{p}": closes.rolling(window=p, min_periods=p).mean().to_numpy() for p in SMA_PERIODS}
+
+
+def engine_smas(closes):
+    engine = SMAEngine(SMA_PERIODS)
+    out = {f"sma_{p}": np.full(len(closes), np.nan) for p in SMA_PERIODS}
+    for i, close in enumerate(closes.tolist()):
+        # Persist/restore half-way through, as the Celery task does between runs
+        if i == len(closes) // 2:
+            engine = SMAEngine.from_state(engine.to_state())
+        for name, value in engine.update(close, i).items():
+            if value is not None:
+                out[name][i] = value
+    return out
+
+
+def cross_check(closes):
+    expected, actual = pandas_smas(closes), engine_smas(closes)
+    worst = 0.0
+    for name in expected:
+        assert np.array_equal(np.isnan(expected[name]), np.isnan(actual[name])), f"{name}: warm-up mismatch"
+        worst = max(worst, float(np.nanmax(np.abs(expected[name] - actual[name]))))
+    assert worst < TOLERANCE, f"max abs diff {worst} exceeds {TOLERANCE}"
+    return worst
+
+
+def bench(closes, repeat):
+    # Old path: every closed bar re-runs rolling().mean() over the full history
+    tail = min(200, len(closes) - 1)
+    started = time.perf_counter()
+    for end in range(len(closes) - tail, len(closes)):
+        history = closes.iloc[: end + 1]
+        for p in SMA_PERIODS:
+            history.rolling(window=p, min_periods=p).mean()
+    full_us = (time.perf_counter() - started) / tail * 1e6
+
+    # New path: one engine update per closed bar
+    values = closes.tolist() * repeat
+    engine = SMAEngine(SMA_PERIODS)
+    started = time.perf_counter()
+    for close in values:
+        engine.update(close)
+    incr_us = (time.perf_counter() - started) / len(values) * 1e6
+    return full_us, incr_us
+
+
+def main():
+    paths = [sys.argv[1]] if len(sys.argv) > 1 else sorted(glob.glob("data/merged_data_*.csv"))
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    if not paths:
+        print("No data/merged_data_*.csv files found.")
+        return
+
+    for path in paths:
+        closes = load_closes(path)
+        worst = cross_check(closes)
+        full_us, incr_us = bench(closes, repeat)
+        print(f"{path}: {len(closes)} bars, max |engine - pandas| = {worst:.2e}")
+        print(f"  rolling().mean() over full history: {full_us:9.1f} us/bar")
+        print(f"  SMAEngine.update:                   {incr_us:9.2f} us/bar")
+        print(f"  Speed-up: {full_us / incr_us:,.0f}x")
+
+
+if __name__ == "__main__":
+    main()
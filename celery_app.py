@@ -23,8 +23,10 @@ from app.tasks import (
     task_1_fetch_hist,
     task_merge,
     task_sma,
+    task_indicators,
     task_trend,
     task_option_chain,
     task_order_manager,
+    task_pipeline,
     cleanup_task,
 )
\ No newline at end of file
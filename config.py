@@ -37,6 +37,8 @@ class Config:
 
     # --- SocketIO Message Queue ---
     SOCKETIO_MESSAGE_QUEUE = os.environ.get('REDIS_URL')
+    # Max live LTP pushes per instrument per second (app/market_bridge.py)
+    MARKET_PUSH_RATE_HZ = float(os.environ.get('MARKET_PUSH_RATE_HZ', 4))
 
     # --- REMOVED Upstox App Credentials ---
     # In the "Bring Your Own Key" model, the application does not have its own
@@ -67,19 +69,13 @@ class Config:
         "schedule": 60.0,
         "args":("NSE_INDEX|Nifty 50", "1m")
     },
-    "merge-every-30sec": {
-        "task": "app.tasks.task_merge.merge_hist_live",
-        "schedule": 30.0,
-        "args": ("NSE_INDEX|Nifty 50", "1m")
-    },    
-    "sma-every-32sec": {
-        "task": "app.tasks.task_sma.calculate_sma_for_closed_bar",
-        "schedule": 32.0,
-        "args": ("NSE_INDEX|Nifty 50", "1m")
-    },
-    "trend-every-35sec": {
-        "task": "app.tasks.task_trend.analyze_trend",
-        "schedule": 35.0,
+    # Merge -> SMA -> trend -> orders run when the streamer dispatches
+    # app.tasks.task_pipeline.on_bars_close on bar close. This beat only catches
+    # bars no event claimed (streamer down); with STREAMER_BAR_CLOSE_PIPELINE=0
+    # it is the timer that drives the pipeline, every 30s as before.
+    "pipeline-fallback": {
+        "task": "app.tasks.task_pipeline.pipeline_fallback",
+        "schedule": 30.0 if os.environ.get("STREAMER_BAR_CLOSE_PIPELINE", "1") == "0" else 60.0,
         "args": ("NSE_INDEX|Nifty 50", "1m")
     },
     "option-chain-every-300sec": {
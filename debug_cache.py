@@ -1,17 +1,16 @@
-import json
-from app import create_app, cache
+from app import create_app
+from app.tasks.utils import get_cached_historical_data
+from app.tasks.candle_mmap import mapped_candles
+from app.tasks.candle_store import candles_to_frame
 
 def run_debug():
     app, _ = create_app()
-    hist_cache_key = "historical_data:NSE_INDEX|Nifty 50"
+    instrument_key = "NSE_INDEX|Nifty 50"
 
     with app.app_context():
-        cached_json_data = cache.get(hist_cache_key)
+        data_list = get_cached_historical_data(instrument_key)
         
-        if cached_json_data:
-            # The data is a JSON string of a list of dictionaries
-            data_list = json.loads(cached_json_data)
-            
+        if data_list:
             print(f"\n--- Retrieved {len(data_list)} Historical Candles ---")
             
             # Print the first 5 records
@@ -24,5 +23,13 @@ def run_debug():
         else:
             print("Cache key not found.")
 
+        # Archived history straight from the memory-mapped series (no Redis)
+        records = mapped_candles(instrument_key, "1m")
+        if records is not None and len(records):
+            print(f"\n--- Mapped archive: {len(records)} Candles ---")
+            print(candles_to_frame(records[-5:]).to_string(index=False))
+        else:
+            print("No mapped archive series yet.")
+
 if __name__ == '__main__':
     run_debug()
\ No newline at end of file
@@ -0,0 +1,98 @@
+# tests/test_backtest.py
+# PURPOSE: Backtest SMAs against pandas and the stoploss / target / square-off exits on synthetic sessions.
+#
+# Run from the repo root:  python -m pytest -q tests
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.tasks import backtest as bt
+from app.tasks.candle_store import CANDLE_DTYPE
+
+MINUTE_MS = 60_000
+OPEN_MS = 1_760_586_300_000   # 2025-10-16 09:15 IST
+ENTRY_BAR = 14                # the 09:29 bar, acted on at its 09:30 close
+SQUARE_OFF_BAR = 360          # the 15:15 bar
+PRICE = 22_000.0
+
+
+def flat_session(bars=375):
+    records = np.zeros(bars, dtype=CANDLE_DTYPE)
+    records["ts"] = OPEN_MS + np.arange(bars, dtype="<i8") * MINUTE_MS
+    records["open"] = records["high"] = records["low"] = records["close"] = PRICE
+    return records
+
+
+def run(monkeypatch, records, side=1):
+    """Backtest with one `side` signal on the 09:29 bar (the exits are what is under test)."""
+    sides = np.zeros(len(records), dtype=np.int8)
+    sides[ENTRY_BAR] = side
+    monkeypatch.setattr(bt, "entry_sides", lambda close: sides)
+    trades = bt.backtest(records)["trades"]
+    assert len(trades) == 1
+    return trades.iloc[0]
+
+
+def test_rolling_sma_matches_pandas_around_nan_closes():
+    close = 22_000 + np.cumsum(np.random.default_rng(3).normal(0, 4, 600))
+    close[[5, 120, 121, 450]] = np.nan
+    for period in (10, 25, 50, 100):
+        expected = pd.Series(close).rolling(period).mean().to_numpy()
+        np.testing.assert_allclose(bt.rolling_sma(close, period), expected, rtol=0, atol=1e-8, equal_nan=True)
+    sma = bt.rolling_sma(close, 10)
+    assert np.isnan(sma[459]) and not np.isnan(sma[460])   # back once the NaN leaves the window
+
+
+def test_stoploss_exit(monkeypatch):
+    records = flat_session()
+    records["low"][ENTRY_BAR + 5] = PRICE - 30          # -15 option points at delta 0.5
+    trade = run(monkeypatch, records)
+    assert (trade["side"], trade["reason"], trade["pnl"]) == ("CALL", "STOPLOSS", -15.0)
+    assert trade["minutes"] == 5 and trade["exit_index_price"] == PRICE - 30
+
+
+def test_stoploss_gap_fills_at_the_open(monkeypatch):
+    records = flat_session()
+    records["open"][ENTRY_BAR + 3] = records["low"][ENTRY_BAR + 3] = PRICE - 100
+    trade = run(monkeypatch, records)
+    assert (trade["reason"], trade["pnl"]) == ("STOPLOSS", -50.0)
+
+
+def test_target_exit(monkeypatch):
+    records = flat_session()
+    records["high"][ENTRY_BAR + 7] = PRICE + 61
+    trade = run(monkeypatch, records)
+    assert (trade["reason"], trade["pnl"], trade["minutes"]) == ("TARGET", 30.0, 7)
+
+
+def test_put_mirrors_the_levels(monkeypatch):
+    records = flat_session()
+    records["low"][ENTRY_BAR + 2] = PRICE - 60
+    records["high"][ENTRY_BAR + 4] = PRICE + 30
+    trade = run(monkeypatch, records, side=-1)
+    assert (trade["side"], trade["reason"], trade["pnl"]) == ("PUT", "TARGET", 30.0)
+
+
+def test_stoploss_is_checked_first_within_a_bar(monkeypatch):
+    records = flat_session()
+    records["low"][ENTRY_BAR + 1] = PRICE - 30
+    records["high"][ENTRY_BAR + 1] = PRICE + 60
+    assert run(monkeypatch, records)["reason"] == "STOPLOSS"
+
+
+def test_square_off_at_the_1515_open(monkeypatch):
+    records = flat_session()
+    records["open"][SQUARE_OFF_BAR] = PRICE + 10
+    records["high"][SQUARE_OFF_BAR] = PRICE + 100          # too late: the position is already closed
+    trade = run(monkeypatch, records)
+    assert (trade["reason"], trade["pnl"]) == ("SQUARE_OFF", 5.0)
+    assert trade["exit_time"] == pd.Timestamp("2025-10-16 15:15", tz=bt.IST)
+
+
+def test_no_entry_after_square_off(monkeypatch):
+    records = flat_session()
+    sides = np.zeros(len(records), dtype=np.int8)
+    sides[SQUARE_OFF_BAR] = 1
+    monkeypatch.setattr(bt, "entry_sides", lambda close: sides)
+    assert bt.backtest(records)["summary"]["trades"] == 0
@@ -0,0 +1,189 @@
+# tests/test_indicator_registry.py
+# PURPOSE: The registry indicators against pandas references, across state restores and NaN closes.
+#
+# Run from the repo root:  python -m pytest -q tests
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.tasks.candle_archive import DAY_MS, IST_OFFSET_MS
+from app.tasks.indicators import IndicatorSet, build_indicator
+
+MINUTE_MS = 60_000
+OPEN_MS = 1_760_586_300_000   # 2025-10-16 09:15 IST
+SESSION_BARS = 375
+SPECS = [
+    {"name": "ema", "period": 20},
+    {"name": "rsi", "period": 14},
+    {"name": "atr", "period": 14},
+    {"name": "supertrend", "period": 10, "multiplier": 3},
+    {"name": "bollinger", "period": 20, "k": 2},
+    {"name": "macd", "fast": 12, "slow": 26, "signal": 9},
+    {"name": "vwap"},
+]
+FIELDS = {"supertrend": ("supertrend",), "bollinger": ("mid", "upper", "lower"), "macd": ("macd", "signal", "hist")}
+
+
+def random_bars(days=2, seed=11):
+    """`days` sessions of 1m OHLCV bars."""
+    rng = np.random.default_rng(seed)
+    n = days * SESSION_BARS
+    ts = np.concatenate([OPEN_MS + d * DAY_MS + np.arange(SESSION_BARS) * MINUTE_MS for d in range(days)])
+    close = 22_000 + np.cumsum(rng.normal(0, 4, n))
+    open_ = close + rng.normal(0, 2, n)
+    return pd.DataFrame({
+        "ts": ts,
+        "open": open_,
+        "high": np.maximum(open_, close) + rng.uniform(0, 3, n),
+        "low": np.minimum(open_, close) - rng.uniform(0, 3, n),
+        "close": close,
+        "volume": rng.integers(1, 1000, n).astype(float),
+    })
+
+
+# --- pandas references ---
+def seeded_ewm(values, period, alpha):
+    """ewm(adjust=False) seeded with the mean of the first `period` values."""
+    values = pd.Series(values, dtype=float).reset_index(drop=True)
+    out = np.full(len(values), np.nan)
+    if len(values) >= period:
+        seeded = values.iloc[period - 1:].copy()
+        seeded.iloc[0] = values.iloc[:period].mean()
+        out[period - 1:] = seeded.ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    return out
+
+
+def supertrend_reference(df, atr, multiplier):
+    high, low, close = df["high"].to_numpy(), df["low"].to_numpy(), df["close"].to_numpy()
+    line = np.full(len(df), np.nan)
+    upper = lower = None
+    direction = 1
+    for i in range(len(df)):
+        if np.isnan(atr[i]):
+            continue
+        mid = (high[i] + low[i]) / 2
+        new_upper, new_lower = mid + multiplier * atr[i], mid - multiplier * atr[i]
+        if upper is not None:
+            new_upper = new_upper if new_upper < upper or close[i - 1] > upper else upper
+            new_lower = new_lower if new_lower > lower or close[i - 1] < lower else lower
+            if direction == 1 and close[i] < new_lower:
+                direction = -1
+            elif direction == -1 and close[i] > new_upper:
+                direction = 1
+        upper, lower = new_upper, new_lower
+        line[i] = lower if direction == 1 else upper
+    return line
+
+
+def recursive_reference(df):
+    """EMA, RSI, ATR, Supertrend, MACD and VWAP of the bars in `df` (all closes finite)."""
+    close, high, low = df["close"], df["high"], df["low"]
+    tr = pd.concat([high - low, (high - close.shift()).abs(), (low - close.shift()).abs()], axis=1).max(axis=1)
+
+    change = close.diff().iloc[1:]
+    avg_gain = seeded_ewm(change.clip(lower=0), 14, 1 / 14)
+    avg_loss = seeded_ewm((-change).clip(lower=0), 14, 1 / 14)
+    with np.errstate(divide="ignore"):
+        rsi = np.r_[np.nan, np.where(avg_loss == 0, 100.0, 100 - 100 / (1 + avg_gain / avg_loss))]
+
+    macd = seeded_ewm(close, 12, 2 / 13) - seeded_ewm(close, 26, 2 / 27)
+    signal = np.r_[np.full(25, np.nan), seeded_ewm(macd[25:], 9, 2 / 10)]
+
+    day = (df["ts"] + IST_OFFSET_MS) // DAY_MS
+    pv = ((high + low + close) / 3 * df["volume"]).groupby(day).cumsum()
+    vwap = pv / df["volume"].groupby(day).cumsum()
+
+    return {
+        "ema": seeded_ewm(close, 20, 2 / 21),
+        "rsi": rsi,
+        "atr": seeded_ewm(tr, 14, 1 / 14),
+        "supertrend.supertrend": supertrend_reference(df, seeded_ewm(tr, 10, 1 / 10), 3),
+        "macd.macd": macd,
+        "macd.signal": signal,
+        "macd.hist": macd - signal,
+        "vwap": vwap.to_numpy(),
+    }
+
+
+def bollinger_reference(close):
+    mid = close.rolling(20).mean()
+    std = close.rolling(20).std(ddof=0)
+    return {"bollinger.mid": mid.to_numpy(),
+            "bollinger.upper": (mid + 2 * std).to_numpy(),
+            "bollinger.lower": (mid - 2 * std).to_numpy()}
+
+
+def pandas_reference(df):
+    """Recursive indicators skip NaN closes and carry their value; Bollinger follows rolling()."""
+    finite = df[df["close"].notna()]
+    reference = {}
+    for name, values in recursive_reference(finite.reset_index(drop=True)).items():
+        reference[name] = pd.Series(values, index=finite.index).reindex(df.index).ffill().to_numpy()
+    reference.update(bollinger_reference(df["close"]))
+    return reference
+
+
+# --- registry runs ---
+def run_registry(df, restore_at=()):
+    """{"ema": [...], "macd.signal": [...], ...} after every bar; state goes through JSON at `restore_at`."""
+    indicators = [build_indicator(spec) for spec in SPECS]
+    out = {}
+    for i, bar in enumerate(df.to_dict("records")):
+        if i in restore_at:   # as the indicator task does between runs
+            indicators = [type(ind).from_state(ind.params, json.loads(json.dumps(ind.to_state())))
+                          for ind in indicators]
+        for ind in indicators:
+            ind.update(bar)
+            value = ind.value()
+            if ind.name in FIELDS:
+                for field in FIELDS[ind.name]:
+                    field_value = None if value is None else value[field]
+                    out.setdefault(f"{ind.name}.{field}", []).append(np.nan if field_value is None else field_value)
+            else:
+                out.setdefault(ind.name, []).append(np.nan if value is None else value)
+    return {name: np.array(values, dtype=float) for name, values in out.items()}
+
+
+def assert_matches_pandas(actual, df):
+    for name, expected in pandas_reference(df).items():
+        np.testing.assert_array_equal(np.isnan(actual[name]), np.isnan(expected), err_msg=name)
+        np.testing.assert_allclose(actual[name], expected, rtol=0, atol=1e-6, equal_nan=True, err_msg=name)
+
+
+def test_matches_pandas():
+    df = random_bars()
+    assert_matches_pandas(run_registry(df), df)
+
+
+@pytest.mark.parametrize("restore_at", [(1,), (13,), (100, 374, 375), tuple(range(0, 750, 7))])
+def test_restore_partway_changes_nothing(restore_at):
+    df = random_bars()
+    expected = run_registry(df)
+    actual = run_registry(df, restore_at)
+    for name, values in expected.items():
+        np.testing.assert_array_equal(actual[name], values, err_msg=name)
+
+
+def test_nan_closes_are_skipped_and_blank_the_bollinger_window():
+    df = random_bars()
+    df.loc[[0, 5, 30, 200, 201, 374, 375, 600], "close"] = np.nan
+    actual = run_registry(df, restore_at=(150, 202, 376))
+    assert_matches_pandas(actual, df)
+    assert np.isnan(actual["bollinger.mid"][219]) and not np.isnan(actual["bollinger.mid"][221])
+    assert actual["ema"][200] == actual["ema"][199]
+
+
+def test_vwap_resets_each_ist_day():
+    df = random_bars()
+    actual = run_registry(df)["vwap"]
+    first = df.iloc[SESSION_BARS]
+    assert actual[SESSION_BARS] == pytest.approx((first["high"] + first["low"] + first["close"]) / 3)
+
+
+def test_indicator_set_shares_one_instance_per_spec():
+    indicator_set = IndicatorSet([build_indicator(spec) for spec in SPECS + [{"name": "ema", "period": 20}]])
+    assert len(indicator_set.indicators) == len(SPECS)
+    assert indicator_set.warmup == max(build_indicator(spec).warmup for spec in SPECS)
@@ -0,0 +1,179 @@
+# tests/test_indicators.py
+# PURPOSE: The incremental SMA engine and the SMA task against pandas rolling().mean().
+#
+# Run from the repo root:  python -m pytest -q tests
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.tasks import task_sma
+from app.tasks.candle_store import CANDLE_DTYPE
+from app.tasks.indicators import SMAEngine, SMA_PERIODS
+
+MINUTE_MS = 60_000
+START_MS = 1_699_999_980_000   # a minute boundary
+
+
+def random_closes(n, seed=7):
+    rng = np.random.default_rng(seed)
+    return 22_000 + np.cumsum(rng.normal(0, 4, n))
+
+
+def pandas_smas(closes):
+    closes = pd.Series(closes, dtype=float)
+    return {f"sma_{p}": closes.rolling(window=p, min_periods=p).mean().to_numpy() for p in SMA_PERIODS}
+
+
+def engine_smas(closes, restore_every=None):
+    """SMA values after every close (NaN where the engine returns None)."""
+    engine = SMAEngine(SMA_PERIODS)
+    out = {f"sma_{p}": np.full(len(closes), np.nan) for p in SMA_PERIODS}
+    for i, close in enumerate(closes):
+        if restore_every and i and i % restore_every == 0:
+            engine = SMAEngine.from_state(engine.to_state())   # as the Celery task does between runs
+        for name, value in engine.update(float(close), i).items():
+            if value is not None:
+                out[name][i] = value
+    return out
+
+
+def assert_matches_pandas(actual, closes):
+    expected = pandas_smas(closes)
+    for name, values in expected.items():
+        np.testing.assert_array_equal(np.isnan(actual[name]), np.isnan(values), err_msg=name)
+        np.testing.assert_allclose(actual[name], values, rtol=0, atol=1e-8, equal_nan=True, err_msg=name)
+
+
+def test_warm_up_returns_none_until_each_window_is_full():
+    closes = random_closes(max(SMA_PERIODS) + 5)
+    engine = SMAEngine(SMA_PERIODS)
+    for i, close in enumerate(closes, start=1):
+        values = engine.update(float(close))
+        for p in SMA_PERIODS:
+            assert (values[f"sma_{p}"] is None) == (i < p)
+    assert_matches_pandas(engine_smas(closes), closes)
+
+
+@pytest.mark.parametrize("restore_every", [None, 1, 37, 100])
+def test_matches_pandas_over_many_ring_wraps(restore_every):
+    closes = random_closes(2_000)
+    assert_matches_pandas(engine_smas(closes, restore_every), closes)
+
+
+def test_nan_close_blanks_each_window_until_it_leaves():
+    closes = random_closes(400)
+    closes[[30, 150, 151, 399 - 5]] = np.nan
+    actual = engine_smas(closes, restore_every=64)
+    assert_matches_pandas(actual, closes)
+    # SMA10 is back 10 bars after the NaN, long before SMA100 and the next ring wrap
+    assert np.isnan(actual["sma_10"][39]) and not np.isnan(actual["sma_10"][40])
+    assert np.isnan(actual["sma_100"][129]) and not np.isnan(actual["sma_100"][130])
+
+
+def test_nan_in_a_warm_up_window():
+    closes = random_closes(60)
+    closes[3] = np.nan
+    assert_matches_pandas(engine_smas(closes), closes)
+
+
+# --- calculate_sma_for_closed_bar on an in-memory candle store ---
+def candle_records(closes, start_ms=START_MS):
+    records = np.zeros(len(closes), dtype=CANDLE_DTYPE)
+    records["ts"] = start_ms + np.arange(len(closes), dtype="<i8") * MINUTE_MS
+    records["open"] = records["high"] = records["low"] = records["close"] = closes
+    return records
+
+
+@pytest.fixture
+def store(monkeypatch):
+    """Patch the task's candle reads and SMA state to a dict-backed store."""
+    state = {"records": np.zeros(0, dtype=CANDLE_DTYPE), "engine": None, "rebuilds": 0}
+
+    def read_candles(instrument_key, interval, start_ms=None, end_ms=None, count=None):
+        records = state["records"]
+        ts = records["ts"]
+        first = int(np.searchsorted(ts, start_ms)) if start_ms is not None else 0
+        last = int(np.searchsorted(ts, end_ms)) if end_ms is not None else len(records)
+        if count is not None:
+            first = max(first, last - count)
+            state["rebuilds"] += 1
+        return records[first:last]
+
+    def save(engine, instrument_key, interval, version=None):
+        state["engine"] = engine.to_state()
+        return dict(engine.values(), ts=engine.last_ts, close=engine.last_close, version=version)
+
+    monkeypatch.setattr(task_sma, "replay_clock_ms", lambda: None)
+    monkeypatch.setattr(task_sma, "read_candles", read_candles)
+    monkeypatch.setattr(task_sma, "load_sma_engine",
+                        lambda *a, **k: SMAEngine.from_state(state["engine"]) if state["engine"] else None)
+    monkeypatch.setattr(task_sma, "save_sma_engine", save)
+    return state
+
+
+def run_task(records):
+    return task_sma.calculate_sma_for_closed_bar.run("TEST", "1m", version=int(records["ts"][-1]))
+
+
+def expected_latest(closes):
+    return {name: values[-1] for name, values in pandas_smas(closes).items()}
+
+
+def assert_latest(latest, closes):
+    for name, value in expected_latest(closes).items():
+        if np.isnan(value):
+            assert latest[name] is None, name
+        else:
+            assert latest[name] == pytest.approx(value, abs=1e-8), name
+
+
+def test_task_folds_new_bars_incrementally(store):
+    closes = random_closes(500)
+    records = candle_records(closes)
+    for end in (5, 60, 150, 151, 152, 300, 500):   # warm-up, then runs of one or many new bars
+        store["records"] = records[:end]
+        assert_latest(run_task(records[:end]), closes[:end])
+    assert store["rebuilds"] == 1   # only the cold start read a window
+
+
+def test_task_rebuilds_when_the_last_bar_is_revised(store):
+    closes = random_closes(300)
+    records = candle_records(closes)
+    store["records"] = records[:250]
+    run_task(records[:250])
+
+    # A backfill revises the bar the engine folded in last, then a new bar closes
+    revised = closes[:251].copy()
+    revised[249] += 25.0
+    store["records"] = candle_records(revised)
+    latest = run_task(store["records"])
+    assert store["rebuilds"] == 2
+    assert_latest(latest, revised)
+
+
+
+def test_task_cutoff_follows_the_session_anchored_60m_grid(store, monkeypatch):
+    # 60m bars start at 09:15, 10:15, 11:15 IST; at 11:40 IST the 11:15 bar is still forming
+    open_ms = 1_760_586_300_000   # 2025-10-16 09:15 IST
+    hour_ms = 60 * MINUTE_MS
+    closes = random_closes(3)
+    store["records"] = candle_records(closes, start_ms=open_ms)
+    store["records"]["ts"] = open_ms + np.arange(3) * hour_ms
+    monkeypatch.setattr(task_sma.time, "time", lambda: (open_ms + 2 * hour_ms + 25 * MINUTE_MS) / 1000)
+
+    latest = task_sma.calculate_sma_for_closed_bar.run("TEST", "60m")
+    assert latest["ts"] == open_ms + hour_ms        # 10:15 is the last closed bar
+    assert latest["close"] == pytest.approx(closes[1])
+
+
+def test_task_cutoff_follows_the_replay_clock(store, monkeypatch):
+    # Wall time is long past the replayed bars: only the recorded clock keeps the forming bar out
+    open_ms = 1_760_586_300_000   # 2025-10-16 09:15 IST
+    closes = random_closes(30)
+    store["records"] = candle_records(closes, start_ms=open_ms)
+    monkeypatch.setattr(task_sma, "replay_clock_ms", lambda: open_ms + 20 * MINUTE_MS + 30_000)
+
+    latest = task_sma.calculate_sma_for_closed_bar.run("TEST", "1m")
+    assert latest["ts"] == open_ms + 19 * MINUTE_MS   # the 09:35 bar is still forming at 09:35:30
+    assert_latest(latest, closes[:20])
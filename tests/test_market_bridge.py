@@ -0,0 +1,48 @@
+# tests/test_market_bridge.py
+# PURPOSE: Per-instrument push throttle of the tick relay.
+#
+# Run from the repo root:  python -m pytest -q tests
+
+import pytest
+
+from app.market_bridge import due_ticks, next_wait
+
+INTERVAL = 0.25
+
+
+def relay(ticks_at, seconds=1.0, step=0.01):
+    """Feed ticks_at(step) -> instruments ticking at that step through the throttle; returns [(time, [emitted])]."""
+    latest, last_emit, emits = {}, {}, []
+    for i in range(int(seconds / step)):
+        now = round(i * step, 2)
+        for key in ticks_at(i):
+            latest[key] = {"ltp": i}
+        due = due_ticks(latest, last_emit, now, INTERVAL)
+        if due:
+            emits.append((now, sorted(due)))
+    return emits
+
+
+def test_busy_instrument_does_not_hold_back_others():
+    # A ticks every 10ms; B ticks once at 0.30s, just after A was emitted at 0.25s
+    emits = relay(lambda i: ["A"] + (["B"] if i == 30 else []))
+    assert (0.3, ["B"]) in emits
+    assert [t for t, keys in emits if "A" in keys] == [0.0, 0.25, 0.5, 0.75]
+
+
+def test_each_instrument_is_capped_at_the_push_rate():
+    emits = relay(lambda i: ["A", "B"])
+    for key in ("A", "B"):
+        times = [t for t, keys in emits if key in keys]
+        assert all(b - a >= INTERVAL - 1e-9 for a, b in zip(times, times[1:]))
+
+
+def test_latest_tick_wins_while_throttled():
+    latest, last_emit = {"A": {"ltp": 1}}, {}
+    assert due_ticks(latest, last_emit, 10.0, INTERVAL) == {"A": {"ltp": 1}}
+    latest["A"] = {"ltp": 2}
+    latest["A"] = {"ltp": 3}
+    assert due_ticks(latest, last_emit, 10.1, INTERVAL) == {}
+    assert next_wait(latest, last_emit, 10.1, INTERVAL) == pytest.approx(0.15)
+    assert due_ticks(latest, last_emit, 10.25, INTERVAL) == {"A": {"ltp": 3}}
+
@@ -0,0 +1,80 @@
+# tests/test_trading_calendar.py
+# PURPOSE: Sessions, expiries and the minute grid of the NSE trading calendar.
+#
+# Run from the repo root:  python -m pytest -q tests
+
+import json
+from datetime import date, datetime
+
+import pytest
+
+from app.tasks import trading_calendar
+from app.tasks.trading_calendar import IST, TradingCalendar, load_calendar, session_minute_index
+
+
+@pytest.fixture
+def calendar(monkeypatch):
+    """The shipped holiday file, built as in 2026 (independent of today's date)."""
+    calendar = load_calendar(year=2026)
+    monkeypatch.setattr(trading_calendar, "_calendar", calendar)
+    return calendar
+
+
+def ist_ms(year, month, day, hour, minute):
+    return int(IST.localize(datetime(year, month, day, hour, minute)).timestamp() * 1000)
+
+
+@pytest.mark.parametrize("day, weekly, monthly", [
+    (date(2026, 2, 25), date(2026, 3, 2), date(2026, 3, 30)),     # Tue 3 Mar is Holi; Tue 31 Mar Mahavir Jayanti
+    (date(2026, 3, 3), date(2026, 3, 10), date(2026, 3, 30)),
+    (date(2025, 10, 18), date(2025, 10, 20), date(2025, 10, 28)),  # Tue 21 Oct 2025 is Diwali Laxmi Pujan
+    (date(2026, 4, 10), date(2026, 4, 13), date(2026, 4, 28)),     # Tue 14 Apr is Ambedkar Jayanti
+])
+def test_expiries_move_to_the_previous_session_on_a_holiday(calendar, day, weekly, monthly):
+    assert calendar.next_expiry(day) == weekly
+    assert calendar.next_expiry(day, monthly=True) == monthly
+
+
+def test_next_expiry_include_today(calendar):
+    assert calendar.next_expiry(date(2026, 3, 10)) == date(2026, 3, 10)
+    assert calendar.next_expiry(date(2026, 3, 10), include_today=False) == date(2026, 3, 17)
+
+
+def test_previous_and_next_session_skip_holidays(calendar):
+    assert calendar.previous_session(date(2026, 3, 4)) == date(2026, 3, 2)      # over Holi
+    assert calendar.previous_session(date(2026, 4, 6)) == date(2026, 4, 2)      # over Good Friday + weekend
+    assert calendar.next_session(date(2026, 4, 2)) == date(2026, 4, 6)
+    assert not calendar.is_session(date(2026, 1, 26))
+    assert calendar.sessions_between(date(2026, 3, 30), date(2026, 4, 7)) == [
+        date(2026, 3, 30), date(2026, 4, 1), date(2026, 4, 2), date(2026, 4, 6), date(2026, 4, 7)]
+
+
+def test_session_minute_index_boundaries(calendar):
+    assert session_minute_index(ist_ms(2026, 3, 4, 9, 14)) is None
+    assert session_minute_index(ist_ms(2026, 3, 4, 9, 15)) == 0
+    assert session_minute_index(ist_ms(2026, 3, 4, 15, 29)) == 374
+    assert session_minute_index(ist_ms(2026, 3, 4, 15, 30)) is None
+    assert session_minute_index(IST.localize(datetime(2026, 3, 4, 12, 0, 59))) == 165
+    assert session_minute_index(ist_ms(2026, 3, 3, 10, 0)) is None   # Holi
+    assert session_minute_index(ist_ms(2026, 3, 7, 10, 0)) is None   # Saturday
+
+
+def test_year_without_holidays_falls_back_to_weekdays(tmp_path, capsys):
+    path = tmp_path / "holidays.json"
+    path.write_text(json.dumps({"holidays": {"2025-12-25": "Christmas"}}))
+    calendar = load_calendar(str(path), year=2026)
+
+    assert "NO NSE HOLIDAYS FOR 2026" in capsys.readouterr().out
+    assert calendar.covers(date(2026, 6, 1))
+    assert calendar.is_session(date(2026, 3, 3)) and not calendar.is_session(date(2025, 12, 25))
+    assert calendar.next_expiry(date(2026, 3, 1)) == date(2026, 3, 3)
+
+    load_calendar(str(path), year=2025)
+    assert capsys.readouterr().out == ""
+
+
+def test_expiry_past_the_range_keeps_the_calendar_weekday():
+    thursday = TradingCalendar({}, 2025, 2025, expiry_weekday=3)
+    assert thursday.next_expiry(date(2025, 12, 30)) == date(2026, 1, 1)
+    assert thursday.next_expiry(date(2027, 1, 4)) == date(2027, 1, 7)
+    assert thursday.next_expiry(date(2027, 1, 4), monthly=True) == date(2027, 1, 28)
@@ -0,0 +1,66 @@
+# tests/test_trend_transitions.py
+# PURPOSE: Trend flips are recorded once per series, also when workers race on the same flip.
+#
+# Run from the repo root:  python -m pytest -q tests
+
+import json
+
+import fakeredis
+import pytest
+
+from app.tasks.trend_transitions import (
+    TREND_LAST_SIGNAL_KEY, TREND_TRANSITIONS_STREAM, read_transitions, record_transitions,
+)
+
+
+@pytest.fixture
+def client():
+    return fakeredis.FakeRedis()
+
+
+def payload(signal, ltp=22_000.0):
+    return {"signal": signal, "ltp": ltp, "sma_10": ltp - 1, "version": 1}
+
+
+def record(client, payloads, tmp_path, interval="1m"):
+    return record_transitions(payloads, interval, client=client, log_dir=str(tmp_path))
+
+
+def test_records_only_changes(client, tmp_path):
+    first = record(client, {"A": payload("NEUTRAL"), "B": payload("CALL BUY")}, tmp_path)
+    assert [(t["instrument"], t["from"], t["to"]) for t in first] == [("A", None, "NEUTRAL"), ("B", None, "CALL BUY")]
+
+    again = record(client, {"A": payload("NEUTRAL"), "B": payload("PUT BUY")}, tmp_path)
+    assert [(t["instrument"], t["from"], t["to"]) for t in again] == [("B", "CALL BUY", "PUT BUY")]
+    stream = read_transitions(client=client)
+    assert [(t["instrument"], t["from"], t["to"]) for t in stream] == [
+        ("A", None, "NEUTRAL"), ("B", None, "CALL BUY"), ("B", "CALL BUY", "PUT BUY")]
+    assert stream[-1]["ltp"] == 22_000.0 and stream[-1]["version"] == 1
+
+
+def test_series_are_keyed_per_interval(client, tmp_path):
+    record(client, {"A": payload("CALL BUY")}, tmp_path, "1m")
+    assert len(record(client, {"A": payload("CALL BUY")}, tmp_path, "5m")) == 1
+    assert client.hgetall(TREND_LAST_SIGNAL_KEY) == {b"A:1m": b"CALL BUY", b"A:5m": b"CALL BUY"}
+
+
+def test_racing_workers_record_a_flip_once(client, tmp_path, monkeypatch):
+    record(client, {"A": payload("NEUTRAL")}, tmp_path)
+    # Both workers read NEUTRAL before either writes: the second one must not append a duplicate
+    stale = client.hmget(TREND_LAST_SIGNAL_KEY, ["A:1m"])
+    monkeypatch.setattr(client, "hmget", lambda *a, **k: stale)
+    assert len(record(client, {"A": payload("CALL BUY")}, tmp_path)) == 1
+    assert record(client, {"A": payload("CALL BUY")}, tmp_path) == []
+
+    # A worker racing with a newer flip records it against the signal actually stored
+    flipped = record(client, {"A": payload("PUT BUY")}, tmp_path)
+    assert [(t["from"], t["to"]) for t in flipped] == [("CALL BUY", "PUT BUY")]
+    assert client.xlen(TREND_TRANSITIONS_STREAM) == 3
+
+
+def test_audit_log_matches_the_stream(client, tmp_path):
+    record(client, {"A": payload("NEUTRAL")}, tmp_path)
+    record(client, {"A": payload("CALL BUY")}, tmp_path)
+    lines = [line for f in tmp_path.iterdir() for line in f.read_text().splitlines()]
+    assert len(lines) == client.xlen(TREND_TRANSITIONS_STREAM) == 2
+    assert json.loads(lines[-1])["from"] == "NEUTRAL"
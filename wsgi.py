@@ -2,6 +2,8 @@ from gevent import monkey
 monkey.patch_all()
 
 from app import create_app
+from app.market_bridge import start_market_bridge
 
 flask_app, socketio = create_app()
+start_market_bridge(flask_app)
 application = flask_app